@@ -0,0 +1,169 @@
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from regression_statistics import SUM_COLUMNS,linear_regression_arrays
+
+def resample_block_sums(block_sums:np.ndarray,block_counts:np.ndarray,number_of_replicates:int,rng:np.random.Generator):
+    '''
+    Draws block bootstrap replicates of the sufficient statistics for each
+    group, e.g., resampling days within each resource. Each replicate weights
+    a group's blocks by multinomial counts summing to its number of blocks,
+    which is equivalent to drawing blocks with replacement, and the weighted
+    block sums are combined by matrix multiplication.
+
+    Parameters:
+        block_sums - an array with one row per block, ordered by group, and
+            one column for each entry of SUM_COLUMNS.
+        block_counts - an array with the number of blocks in each group.
+        number_of_replicates - the number of replicates to draw.
+        rng - a numpy random generator.
+
+    Returns:
+        an array with shape (replicates, groups, len(SUM_COLUMNS)).
+    '''
+    replicate_sums = np.zeros((number_of_replicates,len(block_counts),len(SUM_COLUMNS)))
+    starts = np.cumsum(block_counts) - block_counts
+    for group,(start,block_count) in enumerate(zip(starts,block_counts)):
+        if block_count==0:
+            continue
+        counts = rng.multinomial(block_count,np.full(block_count,1/block_count),size=number_of_replicates)
+        replicate_sums[:,group,:] = counts @ block_sums[start:start+block_count,:]
+    return replicate_sums
+
+def unit_type_replicate_regressions(
+        resource_sums:np.ndarray,
+        unit_type_codes:np.ndarray,
+        number_of_unit_types:int,
+        target_curtailment:float=0,
+        minimum_rsquared:float=0.0,
+        normalize_temperatures:bool=True
+    ):
+    '''
+    Performs the unit type stage of CurtailmentModeller's regress, as in its
+    unit_type_regressions method, for every replicate at once from an array
+    of resource sufficient statistics with shape (replicates, resources,
+    len(SUM_COLUMNS)).
+
+    Returns:
+        a dictionary as returned by linear_regression_arrays with arrays of
+        shape (replicates, unit types).
+    '''
+    resource_fits = linear_regression_arrays(resource_sums)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        if normalize_temperatures:
+            shifts = (resource_fits['INTERCEPT']-target_curtailment) / resource_fits['SLOPE']
+        else:
+            shifts = np.zeros(resource_fits['SLOPE'].shape)
+        included = np.isfinite(shifts) & (np.abs(shifts)<1e6) & (resource_fits['RSQUARED']>minimum_rsquared)
+    shifts = np.where(included,shifts,0)
+    n,sum_x,sum_y,sum_xy,sum_xx,sum_yy = np.moveaxis(resource_sums,-1,0)
+    shifted_sums = np.stack([
+        n,
+        sum_x + n*shifts,
+        sum_y,
+        sum_xy + sum_y*shifts,
+        sum_xx + 2*sum_x*shifts + n*shifts*shifts,
+        sum_yy,
+    ],axis=-1) * included[...,np.newaxis]
+    membership = np.zeros((len(unit_type_codes),number_of_unit_types))
+    membership[np.arange(len(unit_type_codes)),unit_type_codes] = 1
+    return linear_regression_arrays(np.einsum('rgk,gu->ruk',shifted_sums,membership))
+
+def bootstrap_task(
+        block_sums:np.ndarray,
+        block_counts:np.ndarray,
+        unit_type_codes:np.ndarray,
+        number_of_unit_types:int,
+        number_of_replicates:int,
+        seed_sequence:np.random.SeedSequence,
+        target_curtailment:float,
+        minimum_rsquared:float,
+        normalize_temperatures:bool
+    ):
+    '''
+    Draws one batch of replicates and returns resource slopes and intercepts
+    and unit type slopes and intercepts, each with one row per replicate.
+    '''
+    rng = np.random.default_rng(seed_sequence)
+    resource_sums = resample_block_sums(block_sums,block_counts,number_of_replicates,rng)
+    resource_fits = linear_regression_arrays(resource_sums)
+    unit_type_fits = unit_type_replicate_regressions(resource_sums,unit_type_codes,number_of_unit_types,target_curtailment,minimum_rsquared,normalize_temperatures)
+    return resource_fits['SLOPE'],resource_fits['INTERCEPT'],unit_type_fits['SLOPE'],unit_type_fits['INTERCEPT']
+
+def bootstrap_regressions(
+        block_sums:pd.DataFrame,
+        number_of_replicates:int=1000,
+        target_curtailment:float=0,
+        minimum_rsquared:float=0.0,
+        normalize_temperatures:bool=True,
+        seed:int=0,
+        replicates_per_task:int=100,
+        number_of_workers:int=None
+    ):
+    '''
+    Bootstraps the resource and unit type regressions of
+    CurtailmentModeller's regress by resampling blocks, e.g., days, within
+    each resource. Replicates are drawn in batches of replicates_per_task,
+    each seeded from its own child of a SeedSequence for the given seed, so
+    results depend only on the seed and batch size and not on the number of
+    workers. Batches are run in a process pool unless number_of_workers is 1.
+
+    Parameters:
+        block_sums - a dataframe of sufficient statistics as returned by
+            grouped_sums, indexed by UnitType, RESOURCE ID, and block.
+        number_of_replicates - the number of bootstrap replicates. Default
+            value is 1000.
+        target_curtailment, minimum_rsquared, normalize_temperatures - see
+            CurtailmentModeller's regress method.
+        seed - an integer seed. Default value is 0.
+        replicates_per_task - the number of replicates drawn in each batch.
+            Default value is 100.
+        number_of_workers - the number of worker processes. Default value is
+            None, which uses the number of processors.
+
+    Returns:
+        a dictionary of four dataframes with one row per replicate, keyed
+        RESOURCE SLOPE and RESOURCE INTERCEPT, with one column per resource,
+        and UNIT TYPE SLOPE and UNIT TYPE INTERCEPT, with one column per unit
+        type.
+    '''
+    block_sums = block_sums.sort_index()
+    resources = block_sums.index.droplevel(-1).unique()
+    block_counts = block_sums.groupby(level=[0,1],observed=True,sort=True).size().reindex(resources).to_numpy()
+    unit_types = resources.unique(level=0)
+    unit_type_codes = unit_types.get_indexer(resources.get_level_values(0))
+    batch_sizes = [min(replicates_per_task,number_of_replicates-start) for start in range(0,number_of_replicates,replicates_per_task)]
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+    task_arguments = [
+        (block_sums.loc[:,SUM_COLUMNS].to_numpy(dtype=float),block_counts,unit_type_codes,len(unit_types),batch_size,seed_sequence,target_curtailment,minimum_rsquared,normalize_temperatures)
+        for batch_size,seed_sequence in zip(batch_sizes,seed_sequences)
+    ]
+    if number_of_workers==1:
+        results = [bootstrap_task(*arguments) for arguments in task_arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=number_of_workers) as executor:
+            results = list(executor.map(bootstrap_task,*zip(*task_arguments)))
+    resource_ids = resources.get_level_values(1)
+    return {
+        'RESOURCE SLOPE' : pd.DataFrame(np.concatenate([r[0] for r in results]),columns=resource_ids),
+        'RESOURCE INTERCEPT' : pd.DataFrame(np.concatenate([r[1] for r in results]),columns=resource_ids),
+        'UNIT TYPE SLOPE' : pd.DataFrame(np.concatenate([r[2] for r in results]),columns=unit_types),
+        'UNIT TYPE INTERCEPT' : pd.DataFrame(np.concatenate([r[3] for r in results]),columns=unit_types),
+    }
+
+def confidence_intervals(replicates:pd.DataFrame,confidence_level:float=0.95):
+    '''
+    Summarizes bootstrap replicates with one column per group as a standard
+    error and percentile confidence interval for each group.
+
+    Returns:
+        a dataframe indexed by the columns of replicates with columns STD
+        ERROR, LOWER, and UPPER.
+    '''
+    alpha = 1 - confidence_level
+    return pd.DataFrame({
+        'STD ERROR' : replicates.std(axis='index'),
+        'LOWER' : replicates.quantile(alpha/2,axis='index'),
+        'UPPER' : replicates.quantile(1-alpha/2,axis='index'),
+    })
@@ -0,0 +1,82 @@
+import pandas as pd
+import numpy as np
+import tempfile
+from pathlib import Path
+
+from model_curtailments import CurtailmentModeller
+
+UNIT_TYPES = ['COMBUSTION TURBINE','COMBINED CYCLE','STEAM','RECIPROCATING ENGINE']
+
+def synthetic_merged_data(number_of_resources:int=40,number_of_days:int=60,seed:int=0):
+    '''
+    Returns a merged curtailment and weather dataset with the columns written
+    by CurtailmentModeller's load_merged_data, with one row per resource and
+    hour and percent curtailments increasing linearly with temperature plus
+    noise and occasional full trips.
+    '''
+    rng = np.random.default_rng(seed)
+    datetimes = pd.date_range('2022-06-01',periods=24*number_of_days,freq='h')
+    resource_codes = np.repeat(np.arange(number_of_resources),len(datetimes))
+    temperatures = 25 + 10*np.sin(2*np.pi*np.tile(np.arange(len(datetimes)),number_of_resources)/24) + rng.normal(0,3,len(resource_codes))
+    slopes = rng.uniform(0.001,0.004,number_of_resources)[resource_codes]
+    intercepts = rng.uniform(-0.05,0.0,number_of_resources)[resource_codes]
+    percent_curtailment = np.clip(intercepts + slopes*temperatures + rng.normal(0,0.02,len(resource_codes)),0,1)
+    percent_curtailment[rng.random(len(resource_codes))<0.01] = 1.0
+    pmax_mw = rng.uniform(50,500,number_of_resources)[resource_codes]
+    return pd.DataFrame({
+        'DATETIME' : np.tile(datetimes,number_of_resources),
+        'RESOURCE ID' : np.char.add('R',np.char.zfill(resource_codes.astype(str),3)),
+        'RESOURCE NAME' : np.char.add('RESOURCE ',resource_codes.astype(str)),
+        'UnitType' : np.array(UNIT_TYPES)[resource_codes%len(UNIT_TYPES)],
+        'CURTAILMENT MW' : percent_curtailment*pmax_mw,
+        'RESOURCE PMAX MW' : pmax_mw,
+        'WeatherStationID' : np.array(['KAAA','KBBB','KCCC'])[resource_codes%3],
+        'DRY BULB TEMPERATURE' : temperatures,
+        'PERCENT CURTAILMENT' : percent_curtailment,
+    })
+
+def check_out_of_core_regression(target_curtailment:float=0.07,maximum_curtailment:float=0.3,minimum_rsquared:float=0.0,memory_limit='256kB',seed:int=0):
+    '''
+    Writes a synthetic merged dataset to a temporary directory, performs the
+    two-stage regression on it with both regress and regress_out_of_core,
+    reading it in chunks no larger than memory_limit, and compares the
+    results.
+
+    Returns:
+        a tuple of the largest absolute differences between the per-resource
+        tables and between the per-unit type tables.
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        synthetic_merged_data(seed=seed).to_csv(directory / 'merged.csv',index=False)
+        data_paths = {
+            'resource_curtailments_filename' : directory / 'curtailments.csv',
+            'weather_data_directory' : directory,
+            'processed_weather_data_filename' : directory / 'weather.csv',
+            'resources_to_weather_stations_map_filename' : directory / 'resource_weather_stations.csv',
+            'weather_station_placenames_filename' : directory / 'weather_station_placenames.csv',
+            'regression_by_resource_filename' : directory / 'regression_by_resource.csv',
+            'regression_by_unit_type_filename' : directory / 'regression_by_unit_type.csv',
+            'merged_data_filename' : directory / 'merged.csv',
+        }
+        curtailment_modeller = CurtailmentModeller(data_paths)
+        curtailment_modeller.regress(True,target_curtailment,maximum_curtailment,minimum_rsquared)
+        df1 = curtailment_modeller.regression_by_resource.sort_values('RESOURCE ID',ignore_index=True)
+        df2 = curtailment_modeller.regression_by_unit_type.sort_values('UNIT TYPE',ignore_index=True)
+        curtailment_modeller = CurtailmentModeller(data_paths)
+        df3,df4 = curtailment_modeller.regress_out_of_core(target_curtailment,maximum_curtailment,minimum_rsquared,memory_limit=memory_limit)
+        df4 = df4.sort_values('UNIT TYPE',ignore_index=True)
+    resource_columns = ['NUMBER OF OBSERVATIONS','CORRELATION DRY BULB TEMPERATURE','COV DRY BULB TEMPERATURE','DRY BULB SLOPE','DRY BULB INTERCEPT','DRY BULB RSQUARED']
+    unit_type_columns = ['DRY BULB SLOPE','DRY BULB INTERCEPT','DRY BULB RSQUARED']
+    if not (df1.loc[:,'RESOURCE ID'].astype(str).tolist()==df3.loc[:,'RESOURCE ID'].astype(str).tolist() and df2.loc[:,'UNIT TYPE'].astype(str).tolist()==df4.loc[:,'UNIT TYPE'].astype(str).tolist()):
+        raise ValueError('Out-of-Core Regression Returned Different Resources or Unit Types')
+    resource_difference = np.nanmax(np.abs(df1.loc[:,resource_columns].to_numpy(dtype=float)-df3.loc[:,resource_columns].to_numpy(dtype=float)))
+    unit_type_difference = np.nanmax(np.abs(df2.loc[:,unit_type_columns].to_numpy(dtype=float)-df4.loc[:,unit_type_columns].to_numpy(dtype=float)))
+    return resource_difference,unit_type_difference
+
+if __name__=='__main__':
+    tolerance = 1e-6
+    resource_difference,unit_type_difference = check_out_of_core_regression()
+    print('Largest Difference by Resource: {:.3e}\nLargest Difference by Unit Type: {:.3e}'.format(resource_difference,unit_type_difference))
+    if max(resource_difference,unit_type_difference)>tolerance:
+        raise SystemExit('Out-of-Core Regression Differs from regress by More than {}'.format(tolerance))
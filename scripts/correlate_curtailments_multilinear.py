@@ -1,28 +1,77 @@
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
+import dask
 import dask.dataframe as ddf
 import re
 from functools import reduce
 from pathlib import Path
-from pandas import Timedelta as td
-from pandas import Timestamp as ts
 import metpy.calc as mpcalc
 from metpy.units import units
 
+from weather_processing import resample_weather
+from curtailment_intervals import expand_intervals,join_intervals_to_observations
+from curtailment_matrix import CurtailmentMatrix
+from weather_station_blending import primary_weather_stations
+from regression_statistics import grouped_sums,split_grouped_sums,solve_linear_regressions
+from curtailment_schema import compact_dtypes,apply_compact_schema,memory_report
+
 class CurtailmentModeller:
     '''
     A class to assist in modeling curtailments as a function of temperature
     using data from nearby weather stations.
     '''
     resource_curtailments = pd.DataFrame()
+    resource_curtailment_intervals = pd.DataFrame()
+    curtailment_matrix = None
+    nminutes = 60
     weather_data = pd.DataFrame()
     weather_station_map = pd.DataFrame()
     weather_station_placenames = pd.DataFrame()
     regression_by_resource = pd.DataFrame()
     regression_by_unit_type = pd.DataFrame()
-    def __init__(self,data_paths:dict):
+    scheduler_options = {}
+    client = None
+    merged_data = None
+    merged_data_parameters = None
+    def __init__(self,data_paths:dict,scheduler:str='threads',number_of_workers:int=None,memory_limit:str=None):
         self.set_data_paths(data_paths)
+        self.set_scheduler(scheduler,number_of_workers,memory_limit)
+
+    def set_scheduler(self,scheduler:str='threads',number_of_workers:int=None,memory_limit:str=None):
+        '''
+        Configures the local dask scheduler used to persist and compute the
+        merged curtailment and weather data.
+
+        Parameters:
+            scheduler - one of 'threads', 'processes', 'synchronous', or
+                'cluster'. The 'cluster' option starts a dask.distributed
+                LocalCluster, which requires the distributed package. Default
+                value is 'threads'.
+            number_of_workers - the number of threads, processes, or cluster
+                workers to use. Default value is None, which uses dask's
+                default for the scheduler.
+            memory_limit - the memory limit per cluster worker, e.g., '4GB'.
+                Only used with the 'cluster' scheduler. Default value is None,
+                which uses dask's default.
+        '''
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+        if scheduler=='cluster':
+            from dask.distributed import Client,LocalCluster
+            cluster_options = {}
+            if number_of_workers is not None:
+                cluster_options['n_workers'] = number_of_workers
+            if memory_limit is not None:
+                cluster_options['memory_limit'] = memory_limit
+            self.client = Client(LocalCluster(**cluster_options))
+            self.scheduler_options = {}
+        elif scheduler in ['threads','processes','synchronous']:
+            self.scheduler_options = {'scheduler':scheduler}
+            if number_of_workers is not None:
+                self.scheduler_options['num_workers'] = number_of_workers
+        else:
+            raise ValueError('Unknown Scheduler: {}'.format(scheduler))
 
     def set_data_paths(self,data_paths:dict):
         '''
@@ -40,10 +89,12 @@ class CurtailmentModeller:
             'merged_data_filename' : data_paths['merged_data_filename'],
         }
 
-    def load_resource_curtailments(self,nminutes):
+    def load_resource_curtailments(self,nminutes,expand:bool=True):
         '''
         Reads a file containing extracted prior trade day curtailment reports
-        and loads the data into a Pandas DataFrame for analysis.
+        and loads the data into a Pandas DataFrame for analysis. Curtailments
+        are kept as intervals and, if expand is True, also subdivided into
+        nminutes-long blocks.
         '''
         print('Loading Resource Curtailment Reports ...')
         df = pd.read_csv(self.data_paths['resource_curtailments_filename'],low_memory=False)
@@ -74,22 +125,21 @@ class CurtailmentModeller:
         )
         df.loc[:,'CURTAILMENT START DATE TIME'] = pd.to_datetime(df.loc[:,'CURTAILMENT START DATE TIME'])
         df.loc[:,'CURTAILMENT END DATE TIME'] = pd.to_datetime(df.loc[:,'CURTAILMENT END DATE TIME'])
-        def expand_hours(df_row,nminutes):
-            start_datetime = df_row.loc['CURTAILMENT START DATE TIME'].replace(minute=0,second=0,microsecond=0)
-            end_datetime = df_row.loc['CURTAILMENT END DATE TIME']
-            delta_datetime = end_datetime - start_datetime
-            return [ts(start_datetime)+td(hours=x) for x in range(max(int(delta_datetime.total_seconds()/(nminutes*60)),1))]
-        df.loc[:,'DATETIME'] = df.apply(lambda r: expand_hours(r,nminutes),axis='columns')
-        df.drop(columns=['CURTAILMENT START DATE TIME','CURTAILMENT END DATE TIME'],inplace=True)
-        self.resource_curtailments = ddf.from_pandas(df.explode('DATETIME').reset_index().drop(columns=['index']),npartitions=16)
+        df = apply_compact_schema(df)
+        self.nminutes = nminutes
+        self.resource_curtailment_intervals = df
+        if expand:
+            self.resource_curtailments = ddf.from_pandas(expand_intervals(df,nminutes=nminutes),npartitions=16)
 
-    def load_weather(self,use_processed:bool=True):
+    def load_weather(self,use_processed:bool=True,nminutes:int=60,maximum_gap_minutes:int=120):
         '''
         Reads a file containing hourly weather data in ISD format downloaded
         from ncei.noaa.gov and loads the data into a Pandas DataFrame for
         analysis. If weather data has already been processed and stored in a
         data file, the use_store_merged flag will read data from that file
-        instead.
+        instead. Observations are resampled to nminutes-long blocks matching
+        the curtailment blocks, with gaps up to maximum_gap_minutes filled by
+        interpolation.
         '''
         def parse_temperature(temp_str:str):
             '''
@@ -154,8 +204,8 @@ class CurtailmentModeller:
             return np.round(wet_bulb_temperature.magnitude,1)
         if use_processed and self.data_paths['processed_weather_data_filename'].is_file():
             print('Loading Pre-Processed Weather Data ...')
-            df = ddf.read_csv(self.data_paths['processed_weather_data_filename'])
-            df['DATE'] = ddf.to_datetime(df['DATE'])
+            df = pd.read_csv(self.data_paths['processed_weather_data_filename'])
+            df.loc[:,'DATE'] = pd.to_datetime(df.loc[:,'DATE'])
         else:
             print('Loading Original Weather Data Files ...')
             df = pd.DataFrame()
@@ -171,7 +221,6 @@ class CurtailmentModeller:
             # extract fields required for later operations:
             df = df.loc[:,['CALL_SIGN','DATE','TMP','DEW','MA1']]
             df.loc[:,'DATE'] = pd.to_datetime(df.loc[:,'DATE'])
-            df.loc[:,'DATE'] = df.loc[:,'DATE'].map(lambda t: t.replace(minute=0,second=0,microsecond=0))
             df.loc[:,'DRY BULB TEMPERATURE'] = df.loc[:,'TMP'].map(parse_temperature)
             df.loc[:,'DEW POINT'] = df.loc[:,'DEW'].map(parse_dew_point)
             df.loc[:,'PRESSURE'] = df.loc[:,'MA1'].map(parse_pressure).round(1)
@@ -194,17 +243,21 @@ class CurtailmentModeller:
             # df.loc[:,'WET BULB TEMPERATURE'] = df.apply(f,axis='columns')
             ### END Removing wet bulb temperatures to reduce calculation time ###
             df.to_csv(self.data_paths['processed_weather_data_filename'],index=False)
-            df = ddf.from_pandas(df,npartitions=16)
-        self.weather_data = df
+        print('Resampling Weather Data to {}-Minute Blocks ...'.format(nminutes))
+        df = resample_weather(df,nminutes=nminutes,maximum_gap_minutes=maximum_gap_minutes)
+        self.weather_data = ddf.from_pandas(apply_compact_schema(df),npartitions=16)
 
     def load_weather_station_map(self):
         '''
         Reads a file containing weather stations and locations and loads the
-        data into a dataframe accessible as an object attribute.
+        data into a dataframe accessible as an object attribute. If the file
+        lists several stations per resource, e.g., the k nearest stations with
+        their distances in a Dist column, only the nearest station is kept.
         '''
         print('Loading Weather Station Locations ...')
         df = pd.read_csv(self.data_paths['resources_to_weather_stations_map_filename'],low_memory=False)
-        self.weather_station_map = ddf.from_pandas(df.loc[:,['ResourceID','UnitType','WeatherStationID']],npartitions=1)
+        df = primary_weather_stations(df.loc[:,[c for c in ['ResourceID','UnitType','WeatherStationID','Dist'] if c in df.columns]])
+        self.weather_station_map = ddf.from_pandas(apply_compact_schema(df.loc[:,['ResourceID','UnitType','WeatherStationID']]),npartitions=1)
 
     def load_weather_station_placenames(self):
         '''
@@ -213,12 +266,123 @@ class CurtailmentModeller:
         '''
         self.weather_station_placenames = ddf.read_csv(self.data_paths['weather_station_placenames_filename'])
 
-    def load_all(self,use_processed:bool=True,nminutes:int=5):
-        self.load_weather(use_processed)
-        self.load_resource_curtailments(nminutes)
+    def load_all(self,use_processed:bool=True,nminutes:int=5,maximum_gap_minutes:int=120,expand_curtailments:bool=True):
+        self.load_weather(use_processed,nminutes,maximum_gap_minutes)
+        self.load_resource_curtailments(nminutes,expand_curtailments)
         self.load_weather_station_map()
         self.load_weather_station_placenames()
 
+    def merge_curtailments_and_weather(self):
+        '''
+        Pairs each curtailment interval with the weather observations from its
+        resource's weather station during each block of the curtailment, using
+        only hours reported in the curtailment data. Curtailments are not
+        expanded into blocks; covering observations are located by binary
+        search on sorted timestamps.
+
+        Returns:
+            a dask dataframe with one row per curtailed resource and block with
+            a weather observation.
+        '''
+        intervals = self.resource_curtailment_intervals.merge(
+            self.weather_station_map.compute(),
+            left_on='RESOURCE ID',
+            right_on='ResourceID'
+        ).drop(columns=['ResourceID'])
+        df = join_intervals_to_observations(intervals,self.weather_data.compute(),nminutes=self.nminutes)
+        return ddf.from_pandas(apply_compact_schema(df),npartitions=16)
+
+    def impute_zero_curtailments(self):
+        '''
+        Inserts zero-valued curtailments into blocks during which no
+        curtailments were reported for each resource, using a resource by
+        block CurtailmentMatrix kept as the curtailment_matrix attribute. Each
+        partition of the returned dataframe is built from the matrix arrays
+        for a chunk of resources only when it is computed.
+
+        Returns:
+            a dask dataframe with curtailments and weather data including
+            imputed zero-valued curtailments
+        '''
+        self.curtailment_matrix = CurtailmentMatrix(
+            self.resource_curtailment_intervals,
+            self.weather_station_map.compute(),
+            self.weather_data.compute(),
+            nminutes=self.nminutes
+        )
+        return ddf.from_map(
+            self.curtailment_matrix.to_frame,
+            self.curtailment_matrix.resource_chunks(16),
+            meta=self.curtailment_matrix.to_frame(np.array([],dtype=np.int64))
+        )
+
+    def load_merged_data(self,use_processed:bool=True,unit_types:list=None,impute_zeros:bool=True):
+        '''
+        Reads the merged curtailment and weather dataset from file, or merges
+        curtailments with weather data and saves the result to file. The
+        dataset is persisted in memory once and kept as the merged_data
+        attribute, so later calls with the same parameters do not re-read or
+        re-merge the source data. Newly imputed zero curtailments are not
+        persisted; their partitions are rebuilt from the curtailment_matrix
+        arrays by each aggregation instead.
+
+        Returns:
+            a dask dataframe with one row per resource and block.
+        '''
+        merged_data_parameters = (use_processed,unit_types if isinstance(unit_types,list) else None,impute_zeros)
+        if self.merged_data is not None and self.merged_data_parameters==merged_data_parameters:
+            return self.merged_data
+        if use_processed and self.data_paths['merged_data_filename'].is_file():
+            print('Loading Pre-Processed Merged Curtailment and Weather Data')
+            df0 = ddf.read_csv(
+                self.data_paths['merged_data_filename'],
+                dtype={c:d for c,d in compact_dtypes(pd.read_csv(self.data_paths['merged_data_filename'],nrows=0).columns).items() if c!='DATETIME'},
+                parse_dates=['DATETIME']
+            )
+            # drop records not matching given unit_type:
+            if isinstance(unit_types,list):
+                df0 = df0.loc[df0['UnitType'].isin(unit_types),:]
+            df0 = df0.persist(**self.scheduler_options)
+            # find the categories of identifier columns from the persisted data:
+            df0 = df0.categorize(columns=list(df0.select_dtypes('category').columns)).persist(**self.scheduler_options)
+        else:
+            if impute_zeros:
+                # Impute zero curtailments where no records are found:
+                df0 = self.impute_zero_curtailments()
+            else:
+                # Use only hours reported in curtailment data:
+                df0 = self.merge_curtailments_and_weather()
+            # drop records not matching given unit_type:
+            if isinstance(unit_types,list):
+                df0 = df0.loc[reduce(lambda x,y:x|y,[df0['UnitType']==unit_type for unit_type in unit_types]),:]
+            df0 = df0.assign(PERCENT_CURTAILMENT=lambda r:r['CURTAILMENT MW']/r['RESOURCE PMAX MW'])
+            df0 = df0.rename(columns={'PERCENT_CURTAILMENT':'PERCENT CURTAILMENT'})
+            # remove implausible or missing temperatures:
+            df0 = df0.loc[(df0.loc[:,'DRY BULB TEMPERATURE']<=100),:]
+            df0 = df0.dropna(subset=['DRY BULB TEMPERATURE','PERCENT CURTAILMENT'],how='any')
+            # df0 = df0.loc[(df0.loc[:,'DRY BULB TEMPERATURE']<=100)&(df0.loc[:,'WET BULB TEMPERATURE']<=100),:]
+            # df0 = df0.dropna(subset=['DRY BULB TEMPERATURE','WET BULB TEMPERATURE','PERCENT CURTAILMENT'],how='any')
+            df0 = apply_compact_schema(df0)
+            if not impute_zeros:
+                df0 = df0.persist(**self.scheduler_options)
+            print('Saving Curtailments and Temperatures to File {}'.format(self.data_paths['merged_data_filename'].name))
+            df0.to_csv(self.data_paths['merged_data_filename'],single_file=True,index=False,compute_kwargs=self.scheduler_options)
+        self.merged_data = df0
+        self.merged_data_parameters = merged_data_parameters
+        return df0
+
+    def report_memory(self):
+        '''
+        Prints and returns a comparison of the memory used by each column of
+        the merged dataset under the compact schema in curtailment_schema.py
+        and under pandas' default dtypes.
+        '''
+        if self.merged_data is None:
+            raise ValueError('Merged Data Not Loaded')
+        report = memory_report(self.merged_data)
+        print('Merged Data Memory Usage:\n{}'.format(report.to_string(float_format='{:.2f}'.format)))
+        return report
+
     def regress(
             self,
             use_processed:bool=True,
@@ -261,148 +425,54 @@ class CurtailmentModeller:
                 trade-day curtailment dataset have zero curtailment due to
                 ambient temperatures. Default value is True.
         '''
-        if use_processed and self.data_paths['merged_data_filename'].is_file():
-            print('Loading Pre-Processed Merged Curtailment and Weather Data')
-            df0 = ddf.read_csv(self.data_paths['merged_data_filename'])
-        else:
-            if impute_zeros:
-                # Impute zero curtailments where no records are found:
-                min_datetime = self.resource_curtailments.loc[:,'DATETIME'].min().compute()
-                max_datetime = self.resource_curtailments.loc[:,'DATETIME'].max().compute()
-                datetimes = pd.DataFrame({'DATETIME':[min_datetime+td(hours=d_hrs) for d_hrs in range(int((max_datetime-min_datetime).total_seconds()/3600))]})
-                # Merge records into full list of hours, copying relevant metadata where needed:
-                df0 = datetimes.merge(self.resource_curtailments.loc[:,'RESOURCE ID'].unique().compute(),how='cross')
-                df0 = df0.merge(
-                    self.resource_curtailments.groupby(['RESOURCE ID','DATETIME']).last().reset_index().compute(),
-                    how='left',
-                    on=['RESOURCE ID','DATETIME']
-                )
-                df0.loc[df0.loc[:,'RESOURCE NAME'].isna(),'RESOURCE NAME'] = df0.loc[(df0.loc[:,'RESOURCE NAME'].isna()),['RESOURCE ID']].merge(
-                    self.resource_curtailments.loc[:,['RESOURCE ID','RESOURCE NAME']].groupby('RESOURCE ID').first().reset_index().compute(),
-                    how='left',
-                    on='RESOURCE ID'
-                ).loc[:,'RESOURCE NAME']
-                df0.loc[df0.loc[:,'RESOURCE PMAX MW'].isna(),'RESOURCE PMAX MW'] = df0.loc[(df0.loc[:,'RESOURCE PMAX MW'].isna()),['RESOURCE ID']].merge(
-                    self.resource_curtailments.loc[:,['RESOURCE ID','RESOURCE PMAX MW']].groupby('RESOURCE ID').mean().reset_index().compute(),
-                    how='left',
-                    on='RESOURCE ID'
-                ).loc[:,'RESOURCE PMAX MW']
-                # Insert assumed values and metadata:
-                df0.loc[:,'CURTAILMENT MW'] = df0.loc[:,'CURTAILMENT MW'].fillna(0)
-                df0.loc[:,'OUTAGE TYPE'] = df0.loc[:,'OUTAGE TYPE'].fillna('FORCED')
-                df0.loc[:,'NATURE OF WORK'] = df0.loc[:,'NATURE OF WORK'].fillna('AMBIENT_DUE_TO_TEMP')
-                df0 = df0.merge(
-                    self.weather_station_map.compute(),
-                    how='left',
-                    left_on='RESOURCE ID',
-                    right_on='ResourceID'
-                )
-                df0 = df0.merge(
-                    self.weather_data.compute(),
-                    how='left',
-                    left_on=['WeatherStationID','DATETIME'],
-                    right_on=['CALL_SIGN','DATE']
-                )
-                # filter for forced outages due to temperature:
-                df0 = df0.dropna(axis='index',how='all',subset=['DRY BULB TEMPERATURE'])
-                df0 = df0.loc[(df0.loc[:,'OUTAGE TYPE']=='FORCED')&(df0.loc[:,'NATURE OF WORK']=='AMBIENT_DUE_TO_TEMP'),:]
-                print(df0.head())
-                df0 = ddf.from_pandas(df0.loc[:,['DATETIME','RESOURCE ID','RESOURCE NAME','UnitType','CURTAILMENT MW','RESOURCE PMAX MW','WeatherStationID','DRY BULB TEMPERATURE']],npartitions=16)
-            else:
-                # Use only hours reported in curtailment data:
-                df0 = self.resource_curtailments.merge(
-                    self.weather_station_map,
-                    left_on='RESOURCE ID',
-                    right_on='ResourceID'
-                ).merge(
-                    self.weather_data,
-                    left_on=['WeatherStationID','DATETIME'],
-                    right_on=['CALL_SIGN','DATE']
-                )
-                df0 = df0.drop(columns=['ResourceID','CALL_SIGN','DATE'])
-            curtailed_resources = list(self.resource_curtailments['RESOURCE ID'].unique())
-            # drop records not matching given unit_type:
-            if isinstance(unit_types,list):
-                df0 = df0.loc[reduce(lambda x,y:x|y,[df0['UnitType']==unit_type for unit_type in unit_types]),:]
-            df0 = df0.assign(PERCENT_CURTAILMENT=lambda r:r['CURTAILMENT MW']/r['RESOURCE PMAX MW'])
-            df0 = df0.rename(columns={'PERCENT_CURTAILMENT':'PERCENT CURTAILMENT'})
-
-            merged_resources = list(df0['RESOURCE ID'].unique())
-
-            # remove implausible or missing temperatures:
-            df0 = df0.loc[(df0.loc[:,'DRY BULB TEMPERATURE']<=100),:]
-            df0 = df0.dropna(subset=['DRY BULB TEMPERATURE','PERCENT CURTAILMENT'],how='any')
-            # df0 = df0.loc[(df0.loc[:,'DRY BULB TEMPERATURE']<=100)&(df0.loc[:,'WET BULB TEMPERATURE']<=100),:]
-            # df0 = df0.dropna(subset=['DRY BULB TEMPERATURE','WET BULB TEMPERATURE','PERCENT CURTAILMENT'],how='any')
-            print('Saving Curtailments and Temperatures to File {}'.format(self.data_paths['merged_data_filename'].name))
-            df0.to_csv(self.data_paths['merged_data_filename'],single_file=True,index=False)
+        df0 = self.load_merged_data(use_processed,unit_types,impute_zeros)
 
         if len(self.regression_by_resource)>0:
             df1 = self.regression_by_resource
         else:
-            # extract unique resource ids for aggregation:
-            print('Performing Regression Analyses ...\n\t\tTarget Curtailment={:.2f}%\n\t\tMaximum Curtailment:{:.2f}%\n\t\tMinimum R-Squared:{:.3f}'.format(target_curtailment,maximum_curtailment,minimum_rsquared))
-            df1 = df0['RESOURCE ID'].unique().compute().to_frame()
-
-            # append unit type to resource list:
-            df1 = df1.merge(
-                df0[['RESOURCE ID','UnitType']].groupby('RESOURCE ID').first().rename(columns={'UnitType':'UNIT TYPE'}).compute(),
-                on='RESOURCE ID'
-            )
-
-            # count hours of curtailment for each resource (hours of curtailment):
-            df1 = df1.merge(
-                df0.groupby('RESOURCE ID')['DATETIME'].count().reset_index().rename(columns={'DATETIME':'NUMBER OF OBSERVATIONS'}).compute(),
-                on='RESOURCE ID'
+            # compute unit types, hours of curtailment, and sufficient
+            # statistics for correlations, covariances, and best-fit lines for
+            # each resource together; correlations and covariances use
+            # curtailments below 30% and best-fit lines use curtailments below
+            # maximum_curtailment:
+            weight_columns = ['CORRELATION_WEIGHT','FIT_WEIGHT']
+            unit_types_by_resource,observation_counts,sums = dask.compute(
+                df0[['RESOURCE ID','UnitType']].groupby('RESOURCE ID',observed=True).first().rename(columns={'UnitType':'UNIT TYPE'}),
+                df0.groupby('RESOURCE ID',observed=True)['DATETIME'].count().rename('NUMBER OF OBSERVATIONS'),
+                grouped_sums(
+                    df0.assign(
+                        CORRELATION_WEIGHT=(df0['PERCENT CURTAILMENT']<0.3),
+                        FIT_WEIGHT=(df0['PERCENT CURTAILMENT']<maximum_curtailment),
+                    ),
+                    ['RESOURCE ID'],
+                    'DRY BULB TEMPERATURE',
+                    'PERCENT CURTAILMENT',
+                    weight_columns=weight_columns,
+                    compute=False
+                ),
+                **self.scheduler_options
             )
+            sums = split_grouped_sums(sums,weight_columns)
+            df1 = unit_types_by_resource.join(observation_counts).reset_index()
             #df1 = df1.loc[(df1['NUMBER OF OBSERVATIONS']>300),:]
 
-            # calculate correlations:
-            df0_pd_g = df0.loc[(df0['PERCENT CURTAILMENT']<0.3),['RESOURCE ID','DRY BULB TEMPERATURE','PERCENT CURTAILMENT']].compute().groupby('RESOURCE ID')
-            # df0_pd_g = df0.loc[(df0['PERCENT CURTAILMENT']<0.3),['RESOURCE ID','DRY BULB TEMPERATURE','WET BULB TEMPERATURE','PERCENT CURTAILMENT']].compute().groupby('RESOURCE ID')
-            df1_pd = df0_pd_g.corr().reset_index()
-            df1_pd = df1_pd.loc[(df1_pd.loc[:,'level_1']=='PERCENT CURTAILMENT'),:].rename(columns={'DRY BULB TEMPERATURE':'CORRELATION DRY BULB TEMPERATURE'})
-            # df1_pd = df1_pd.loc[(df1_pd.loc[:,'level_1']=='PERCENT CURTAILMENT'),:].rename(columns={'DRY BULB TEMPERATURE':'CORRELATION DRY BULB TEMPERATURE','WET BULB TEMPERATURE':'CORRELATION WET BULB TEMPERATURE'})
-            df1_pd = df1_pd.drop(columns=['level_1','PERCENT CURTAILMENT'])
-            df1 = df1.merge(df1_pd,on='RESOURCE ID')
+            correlations = solve_linear_regressions(sums['CORRELATION_WEIGHT'])
+            correlations = correlations.loc[(sums['CORRELATION_WEIGHT'].loc[:,'N']>0),['CORRELATION','COVARIANCE']].rename(columns={
+                'CORRELATION' : 'CORRELATION DRY BULB TEMPERATURE',
+                'COVARIANCE' : 'COV DRY BULB TEMPERATURE',
+            })
+            df1 = df1.merge(correlations.reset_index(),on='RESOURCE ID')
 
-            # calculate covariances:
-            df2_pd = df0_pd_g.cov().reset_index()
-            df2_pd = df2_pd.loc[(df2_pd.loc[:,'level_1']=='PERCENT CURTAILMENT')].rename(columns={'DRY BULB TEMPERATURE':'COV DRY BULB TEMPERATURE'})
-            # df2_pd = df2_pd.loc[(df2_pd.loc[:,'level_1']=='PERCENT CURTAILMENT')].rename(columns={'DRY BULB TEMPERATURE':'COV DRY BULB TEMPERATURE','WET BULB TEMPERATURE':'COV WET BULB TEMPERATURE'})
-            df2_pd = df2_pd.drop(columns=['level_1','PERCENT CURTAILMENT'])
-            df1 = df1.merge(df2_pd,on='RESOURCE ID')
-
-            # find best-fit lines for each resource using both dry- [and wet-bulb temperatures]:
-            def f(r):
+            # find best-fit lines for each resource using dry-bulb temperatures:
+            fits = solve_linear_regressions(sums['FIT_WEIGHT']).loc[:,['SLOPE','INTERCEPT','RSQUARED']].rename(columns={
+                'SLOPE' : 'DRY BULB SLOPE',
+                'INTERCEPT' : 'DRY BULB INTERCEPT',
+                'RSQUARED' : 'DRY BULB RSQUARED',
+            })
+            df1 = df1.merge(fits.reset_index(),how='left',on='RESOURCE ID')
+            for _,r in df1.iterrows():
                 print('\tPerforming Linear Regression on Resource: {}'.format(r.loc['RESOURCE ID']))
-                df0_f = df0.loc[
-                    (df0['RESOURCE ID']==r['RESOURCE ID'])&
-                    (df0['PERCENT CURTAILMENT']<maximum_curtailment),
-                    [
-                        'DRY BULB TEMPERATURE',
-                        # 'WET BULB TEMPERATURE',
-                        'PERCENT CURTAILMENT',
-                    ]
-                ].compute()
-                t_d = df0_f.loc[:,'DRY BULB TEMPERATURE'].values.reshape(len(df0_f),1)
-                # t_w = df0_f.loc[:,'WET BULB TEMPERATURE'].values.reshape(len(df0_f),1)
-                c = df0_f.loc[:,'PERCENT CURTAILMENT'].values.reshape(len(df0_f),1)
-                lr_d = LinearRegression().fit(t_d,c)
-                # lr_w = LinearRegression().fit(t_w,c)
-                sc_d = lr_d.score(t_d,c)
-                # sc_w = lr_w.score(t_w,c)
-                linear_regression_results = {
-                    'DRY BULB SLOPE' : lr_d.coef_[0][0],
-                    'DRY BULB INTERCEPT' : lr_d.intercept_[0],
-                    'DRY BULB RSQUARED' : sc_d,
-                    # 'WET BULB SLOPE' : lr_w.coef_[0][0],
-                    # 'WET BULB INTERCEPT' : lr_w.intercept_[0],
-                    # 'WET BULB RSQUARED' : sc_w,
-                }
-                print('\tC = {DRY BULB SLOPE:.2%}*T + {DRY BULB INTERCEPT:.2%}\tR-Squared: {DRY BULB RSQUARED:.4f}'.format(**linear_regression_results))
-                return linear_regression_results
-            df1 = pd.concat([df1,df1.apply(f,axis='columns',result_type='expand')],axis='columns')
+                print('\tC = {DRY BULB SLOPE:.2%}*T + {DRY BULB INTERCEPT:.2%}\tR-Squared: {DRY BULB RSQUARED:.4f}'.format(**r))
             df1.to_csv(self.data_paths['regression_by_resource_filename'],index=False)
             self.regression_by_resource = df1
 
@@ -416,61 +486,36 @@ class CurtailmentModeller:
         df0 = df0.rename(columns={'NORMALIZED_DRY_BULB_TEMPERATURE':'NORMALIZED DRY BULB TEMPERATURE'})
         # df0 = df0.rename(columns={'NORMALIZED_DRY_BULB_TEMPERATURE':'NORMALIZED DRY BULB TEMPERATURE','NORMALIZED_WET_BULB_TEMPERATURE':'NORMALIZED WET BULB TEMPERATURE'})
         temperature_column = 'DRY BULB TEMPERATURE'
-        df2 = pd.DataFrame(df0['UnitType'].unique().to_frame().rename(columns={'UnitType':'UNIT TYPE'}).compute())
-        def f(r):
-            print('\tPerforming Multilinear Regression on Unit Type: {}'.format(r.loc['UNIT TYPE']))
-            df0_f = df0.loc[
-                (df0['UnitType']==r['UNIT TYPE'])&
-                (df0[temperature_column]>-1e6)&
-                (df0[temperature_column]<1e6)&
-                (df0['PERCENT CURTAILMENT']<maximum_curtailment),
-                [
-                    'WeatherStationID',
-                    temperature_column,
-                    # 'NORMALIZED WET BULB TEMPERATURE',
-                    'PERCENT CURTAILMENT',
-                    'DRY BULB RSQUARED',
-                    # 'WET BULB RSQUARED',
-                ]
-            ].compute()
-            for weather_station_id in df0_f.loc[:,'WeatherStationID'].unique():
-                df0_f.loc[:,weather_station_id] = 1 * (df0_f.loc[:,'WeatherStationID']==weather_station_id)
-            df0_f.drop(columns='WeatherStationID')
-            df0_f_d = df0_f.loc[(df0_f.loc[:,'DRY BULB RSQUARED']>minimum_rsquared),[temperature_column,'PERCENT CURTAILMENT']]
-            df0_f_d = df0_f.loc[(df0_f.loc[:,'DRY BULB RSQUARED']>minimum_rsquared),[temperature_column,'PERCENT CURTAILMENT']]
-            # df0_f_w = df0_f.loc[(df0_f.loc[:,'WET BULB RSQUARED']>minimum_rsquared),['NORMALIZED WET BULB TEMPERATURE','PERCENT CURTAILMENT']]
-            t_d = df0_f_d.loc[:,temperature_column].values.reshape(len(df0_f_d),1)
-            # t_w = df0_f_w.loc[:,'NORMALIZED WET BULB TEMPERATURE'].values.reshape(len(df0_f_w),1)
-            c_d = df0_f_d.loc[:,'PERCENT CURTAILMENT'].values.reshape(len(df0_f_d),1)
-            # c_w = df0_f_w.loc[:,'PERCENT CURTAILMENT'].values.reshape(len(df0_f_w),1)
-            if len(t_d)>0:
-                lr_d = LinearRegression().fit(t_d,c_d)
-                lr_d_coef = lr_d.coef_[0][0]
-                lr_d_intercept = lr_d.intercept_[0]
-                sc_d = lr_d.score(t_d,c_d)
-            else:
-                lr_d_coef = np.nan
-                lr_d_intercept = np.nan
-                sc_d = np.nan
-            # if len(t_w)>0:
-            #     lr_w = LinearRegression().fit(t_w,c_w)
-            #     lr_w_coef = lr_w.coef_[0][0]
-            #     lr_w_intercept = lr_w.intercept_[0]
-            #     sc_w = lr_w.score(t_w,c_w)
-            # else:
-            #     lr_w_coef = np.nan
-            #     lr_w_intercept = np.nan
-            #     sc_w = np.nan
-            linear_regression_results = {
-                'DRY BULB SLOPE' : lr_d_coef,
-                'DRY BULB INTERCEPT' : lr_d_intercept,
-                'DRY BULB RSQUARED' : sc_d,
-                # 'WET BULB SLOPE' : lr_w_coef,
-                # 'WET BULB INTERCEPT' : lr_w_intercept,
-                # 'WET BULB RSQUARED' : sc_w,
-            }
-            return linear_regression_results
-        df2 = pd.concat([df2,df2.apply(f,axis='columns',result_type='expand')],axis='columns')
+        # fit all unit types from sufficient statistics accumulated in one
+        # grouped pass, weighting rows by whether they meet the temperature,
+        # curtailment, and goodness-of-fit criteria:
+        unit_type_list,sums = dask.compute(
+            df0['UnitType'].unique(),
+            grouped_sums(
+                df0.assign(UNIT_TYPE_WEIGHT=(
+                    (df0[temperature_column]>-1e6)&
+                    (df0[temperature_column]<1e6)&
+                    (df0['PERCENT CURTAILMENT']<maximum_curtailment)&
+                    (df0['DRY BULB RSQUARED']>minimum_rsquared)
+                )),
+                ['UnitType'],
+                temperature_column,
+                'PERCENT CURTAILMENT',
+                weight_columns=['UNIT_TYPE_WEIGHT'],
+                compute=False
+            ),
+            **self.scheduler_options
+        )
+        sums = split_grouped_sums(sums,['UNIT_TYPE_WEIGHT'])['UNIT_TYPE_WEIGHT']
+        df2 = pd.DataFrame({'UNIT TYPE':list(unit_type_list)})
+        for unit_type in df2.loc[:,'UNIT TYPE']:
+            print('\tPerforming Multilinear Regression on Unit Type: {}'.format(unit_type))
+        fits = solve_linear_regressions(sums.loc[(sums.loc[:,'N']>0),:]).loc[:,['SLOPE','INTERCEPT','RSQUARED']].rename(columns={
+            'SLOPE' : 'DRY BULB SLOPE',
+            'INTERCEPT' : 'DRY BULB INTERCEPT',
+            'RSQUARED' : 'DRY BULB RSQUARED',
+        })
+        df2 = df2.merge(fits,how='left',left_on='UNIT TYPE',right_index=True)
         df2.loc[:,'MAXIMUM CURTAILMENT'] = maximum_curtailment
         df2.loc[:,'MINIMUM RSQUARED'] = minimum_rsquared
         df2.loc[:,'TARGET CURTAILMENT'] = target_curtailment
@@ -0,0 +1,70 @@
+import pandas as pd
+import numpy as np
+
+from regression_statistics import prediction_errors
+
+def rolling_origin_folds(months:list,minimum_training_months:int=12,training_months:int=None):
+    '''
+    Splits a sorted list of months into rolling-origin folds, each testing on
+    one month and training on the months before it.
+
+    Parameters:
+        months - a sorted list of month indices.
+        minimum_training_months - the number of months before the first test
+            month. Default value is 12.
+        training_months - if given, the length of a moving training window;
+            otherwise each fold trains on every earlier month.
+
+    Returns:
+        a list of tuples of the training months and the test month.
+    '''
+    folds = []
+    for i in range(minimum_training_months,len(months)):
+        start = 0 if training_months is None else max(0,i-training_months)
+        folds.append((list(months[start:i]),months[i]))
+    return folds
+
+def score_predictions(test_sums:pd.DataFrame,intercepts,slopes):
+    '''
+    Scores linear predictions of held-out observations for each unit type
+    from their sufficient statistics, as in prediction_errors. Rows of
+    test_sums, indexed by UnitType and RESOURCE ID, with missing intercepts or
+    slopes, e.g., resources excluded from the training fits, are not scored.
+
+    Returns:
+        a dataframe indexed by unit type with columns N, UNSCORED N, SSE,
+        SST, the total sum of squares about the held-out mean, RMSE, and
+        RSQUARED, the out-of-sample R-squared.
+    '''
+    intercepts = np.asarray(intercepts,dtype=float)
+    slopes = np.asarray(slopes,dtype=float)
+    scored = np.isfinite(intercepts) & np.isfinite(slopes)
+    errors = pd.DataFrame({
+        'N' : np.where(scored,test_sums.loc[:,'N'],0),
+        'UNSCORED N' : np.where(scored,0,test_sums.loc[:,'N']),
+        'SSE' : np.where(scored,prediction_errors(test_sums,np.where(scored,intercepts,0),np.where(scored,slopes,0)),0),
+        'SUM Y' : np.where(scored,test_sums.loc[:,'SUM Y'],0),
+        'SUM YY' : np.where(scored,test_sums.loc[:,'SUM YY'],0),
+    },index=test_sums.index).groupby(level='UnitType',observed=True).sum()
+    with np.errstate(invalid='ignore',divide='ignore'):
+        errors.loc[:,'SST'] = (errors.loc[:,'SUM YY'] - errors.loc[:,'SUM Y']**2/errors.loc[:,'N']).clip(lower=0)
+        errors.loc[:,'RMSE'] = np.sqrt(errors.loc[:,'SSE']/errors.loc[:,'N'])
+        errors.loc[:,'RSQUARED'] = 1 - errors.loc[:,'SSE']/errors.loc[:,'SST']
+    return errors.loc[:,['N','UNSCORED N','SSE','SST','RMSE','RSQUARED']]
+
+def summarize_folds(fold_scores:pd.DataFrame):
+    '''
+    Pools the scores of every fold for each model and unit type, so folds
+    are weighted by their number of scored observations.
+    '''
+    pooled = fold_scores.groupby(['MODEL','UNIT TYPE'],observed=True).agg(**{
+        'NUMBER OF FOLDS' : ('TEST MONTH','nunique'),
+        'NUMBER OF OBSERVATIONS' : ('NUMBER OF OBSERVATIONS','sum'),
+        'NUMBER OF UNSCORED OBSERVATIONS' : ('NUMBER OF UNSCORED OBSERVATIONS','sum'),
+        'SSE' : ('SSE','sum'),
+        'SST' : ('SST','sum'),
+    })
+    with np.errstate(invalid='ignore',divide='ignore'):
+        pooled.loc[:,'RMSE'] = np.sqrt(pooled.loc[:,'SSE']/pooled.loc[:,'NUMBER OF OBSERVATIONS'])
+        pooled.loc[:,'RSQUARED'] = 1 - pooled.loc[:,'SSE']/pooled.loc[:,'SST']
+    return pooled.reset_index()
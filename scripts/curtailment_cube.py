@@ -0,0 +1,196 @@
+import pandas as pd
+import numpy as np
+import dask
+from pathlib import Path
+
+from regression_statistics import SUM_COLUMNS,grouped_sums,split_grouped_sums
+
+CELL_COLUMNS = ['RESOURCE ID','UnitType','WeatherStationID','YEAR','MONTH','TEMPERATURE BIN','CURTAILMENT BIN']
+RESOURCE_MONTH_COLUMNS = ['RESOURCE ID','YEAR','MONTH']
+
+class CurtailmentCube:
+    '''
+    A compact summary of merged curtailment and temperature data, holding the
+    sufficient statistics for regressions of percent curtailment on dry bulb
+    temperature for every occupied cell of resource, unit type, weather
+    station, year, month, temperature bin, and percent curtailment bin. Cells store
+    the columns listed in SUM_COLUMNS, so regressions over any combination of
+    cells are exact and need no pass over the hourly data. Bins are stored as
+    integer indices, with each bin's lower edge at the index times the bin
+    width. Binning percent curtailment allows observations to be restricted
+    to those below a maximum curtailment, provided the maximum lies on a bin
+    edge. New hours are accumulated with the add method. Since each
+    resource's cells are kept separately for each calendar month, a
+    resource-month may be retracted and summarized again with the replace
+    method when its reports are revised, reported late, or replace imputed
+    zeros.
+    '''
+    temperature_bin_width = 0.5
+    curtailment_bin_width = 0.05
+    cells = pd.DataFrame(columns=SUM_COLUMNS)
+    last_datetime = pd.NaT
+    def __init__(self,temperature_bin_width:float=0.5,curtailment_bin_width:float=0.05):
+        self.temperature_bin_width = temperature_bin_width
+        self.curtailment_bin_width = curtailment_bin_width
+        self.cells = pd.DataFrame(
+            columns=SUM_COLUMNS,
+            index=pd.MultiIndex.from_tuples([],names=CELL_COLUMNS),
+            dtype=float
+        )
+        self.last_datetime = pd.NaT
+
+    def assign_bins(self,df:pd.DataFrame):
+        '''
+        Adds YEAR, MONTH, TEMPERATURE BIN, and CURTAILMENT BIN columns to a
+        pandas dataframe of merged data.
+        '''
+        return df.assign(**{
+            'DATETIME' : pd.to_datetime(df.loc[:,'DATETIME']),
+            'YEAR' : pd.to_datetime(df.loc[:,'DATETIME']).dt.year,
+            'MONTH' : pd.to_datetime(df.loc[:,'DATETIME']).dt.month,
+            'TEMPERATURE BIN' : np.floor(df.loc[:,'DRY BULB TEMPERATURE']/self.temperature_bin_width).astype('Int64'),
+            'CURTAILMENT BIN' : np.floor(df.loc[:,'PERCENT CURTAILMENT']/self.curtailment_bin_width+1e-9).astype('Int64'),
+        })
+
+    def add(self,df,new_only:bool=False):
+        '''
+        Accumulates the observations in a pandas or dask dataframe of merged
+        data, as returned by CurtailmentModeller's load_merged_data method,
+        into the cube. Cells are additive, so hours not yet in the cube may be
+        added at any time without revisiting earlier data, giving the same
+        results as recursive least squares updates. Observations already in
+        the cube must not be added again, since they would be counted twice;
+        revised or late reports of hours already summarized are instead
+        applied with the replace method.
+
+        Parameters:
+            df - a pandas or dask dataframe of merged data.
+            new_only - a boolean value to specify whether to add only
+                observations after the cube's last_datetime, so a dataset
+                overlapping the cube may be offered as is. Default value is
+                False, in which case every observation is added.
+
+        Returns:
+            the number of observations added.
+        '''
+        if new_only and not pd.isnull(self.last_datetime):
+            df = df.loc[df['DATETIME']>self.last_datetime,:]
+        if hasattr(df,'map_partitions'):
+            binned = df.map_partitions(self.assign_bins,meta=self.assign_bins(df._meta))
+        else:
+            binned = self.assign_bins(df)
+        binned = binned.dropna(subset=['TEMPERATURE BIN','CURTAILMENT BIN'],how='any')
+        new_cells,last_datetime = dask.compute(
+            grouped_sums(binned,CELL_COLUMNS,'DRY BULB TEMPERATURE','PERCENT CURTAILMENT',compute=False),
+            binned['DATETIME'].max()
+        )
+        new_cells = split_grouped_sums(new_cells)[None]
+        if len(new_cells)==0:
+            return 0
+        if len(self.cells)==0:
+            self.cells = new_cells
+        else:
+            self.cells = pd.concat([self.cells,new_cells],axis='index').groupby(level=CELL_COLUMNS,observed=True).sum().sort_index()
+        if pd.isnull(self.last_datetime) or last_datetime>self.last_datetime:
+            self.last_datetime = last_datetime
+        return int(new_cells.loc[:,'N'].sum())
+
+    def replace(self,df,resource_months:pd.DataFrame):
+        '''
+        Retracts every cell of the given resource-months from the cube and
+        accumulates the observations of df in those resource-months in their
+        place, e.g., when reports are revised, reported late, or replace
+        imputed zeros. Other cells and other observations in df are left
+        unchanged.
+
+        Parameters:
+            df - a pandas or dask dataframe of merged data holding every
+                observation of each of the given resource-months.
+            resource_months - a dataframe with RESOURCE ID, YEAR, and MONTH
+                columns identifying the resource-months to replace.
+
+        Returns:
+            the number of observations added in the replaced resource-months.
+        '''
+        resource_months = resource_months.loc[:,RESOURCE_MONTH_COLUMNS].astype({'RESOURCE ID':str,'YEAR':int,'MONTH':int}).drop_duplicates()
+        if len(self.cells)>0:
+            cell_months = self.cells.index.droplevel([c for c in CELL_COLUMNS if c not in RESOURCE_MONTH_COLUMNS]).to_frame(index=False)
+            retracted = cell_months.astype({'RESOURCE ID':str,'YEAR':int,'MONTH':int}).merge(resource_months,how='left',indicator=True).loc[:,'_merge']=='both'
+            self.cells = self.cells.loc[~retracted.to_numpy(),:]
+        datetimes = df['DATETIME'].astype('datetime64[ns]')
+        df = df.assign(**{
+            'RESOURCE ID' : df['RESOURCE ID'].astype(str),
+            'YEAR' : datetimes.dt.year.astype(int),
+            'MONTH' : datetimes.dt.month.astype(int),
+        }).merge(resource_months,on=RESOURCE_MONTH_COLUMNS).drop(columns=['YEAR','MONTH'])
+        return self.add(df)
+
+    def sums(self,group_columns:list=['RESOURCE ID'],maximum_curtailment:float=None,months:list=None,unit_types:list=None):
+        '''
+        Combines cells into regression sufficient statistics for each group.
+
+        Parameters:
+            group_columns - a list of cell columns identifying each group.
+                Default value is ['RESOURCE ID'].
+            maximum_curtailment - if given, only observations with percent
+                curtailment strictly below this value are included. Must be a
+                multiple of the curtailment bin width.
+            months - if given, a list of months (1-12) to include.
+            unit_types - if given, a list of unit types to include.
+
+        Returns:
+            a dataframe indexed by group_columns with the columns listed in
+            SUM_COLUMNS, as accepted by solve_linear_regressions.
+        '''
+        cells = self.cells.reset_index()
+        if maximum_curtailment is not None:
+            bins = maximum_curtailment / self.curtailment_bin_width
+            if abs(bins-round(bins))>1e-9:
+                raise ValueError('Maximum Curtailment {} Is Not a Multiple of the Curtailment Bin Width {}'.format(maximum_curtailment,self.curtailment_bin_width))
+            cells = cells.loc[(cells.loc[:,'CURTAILMENT BIN']<round(bins)),:]
+        if months is not None:
+            cells = cells.loc[cells.loc[:,'MONTH'].isin(months),:]
+        if unit_types is not None:
+            cells = cells.loc[cells.loc[:,'UnitType'].isin(unit_types),:]
+        return cells.groupby(group_columns,observed=True)[SUM_COLUMNS].sum()
+
+    def temperature_profile(self,group_columns:list=['UnitType'],months:list=None):
+        '''
+        Returns the number of observations and the mean and standard deviation
+        of percent curtailment in each temperature bin for each group, with the
+        lower edge of each bin in a DRY BULB TEMPERATURE column.
+        '''
+        cells = self.cells.reset_index()
+        if months is not None:
+            cells = cells.loc[cells.loc[:,'MONTH'].isin(months),:]
+        sums = cells.groupby(group_columns+['TEMPERATURE BIN'],observed=True)[['N','SUM Y','SUM YY']].sum()
+        mean = sums.loc[:,'SUM Y'] / sums.loc[:,'N']
+        return pd.DataFrame({
+            'DRY BULB TEMPERATURE' : sums.index.get_level_values('TEMPERATURE BIN').astype(float)*self.temperature_bin_width,
+            'NUMBER OF OBSERVATIONS' : sums.loc[:,'N'],
+            'MEAN PERCENT CURTAILMENT' : mean,
+            'STD PERCENT CURTAILMENT' : np.sqrt((sums.loc[:,'SUM YY']/sums.loc[:,'N']-mean*mean).clip(lower=0)),
+        }).reset_index()
+
+    def save(self,path:Path):
+        '''
+        Writes the cube's cells, bin widths, and latest datetime to a csv file.
+        '''
+        self.cells.reset_index().assign(**{
+            'TEMPERATURE BIN WIDTH' : self.temperature_bin_width,
+            'CURTAILMENT BIN WIDTH' : self.curtailment_bin_width,
+            'LAST DATETIME' : self.last_datetime,
+        }).to_csv(path,index=False)
+
+    @classmethod
+    def load(cls,path:Path):
+        '''
+        Reads a cube written by the save method.
+        '''
+        df = pd.read_csv(path)
+        if len(df)==0:
+            return cls()
+        cube = cls(df.loc[0,'TEMPERATURE BIN WIDTH'],df.loc[0,'CURTAILMENT BIN WIDTH'])
+        cube.last_datetime = pd.to_datetime(df.loc[0,'LAST DATETIME'])
+        cube.cells = df.loc[:,CELL_COLUMNS+SUM_COLUMNS].astype({'RESOURCE ID':str,'UnitType':str,'WeatherStationID':str}).set_index(CELL_COLUMNS).sort_index()
+        return cube
@@ -0,0 +1,142 @@
+import pandas as pd
+import numpy as np
+
+def block_offsets(block_counts:np.ndarray):
+    '''
+    Returns the position of each element within its run when runs of the given
+    lengths are laid end-to-end, e.g., [2,3] returns [0,1,0,1,2].
+    '''
+    return np.arange(block_counts.sum()) - np.repeat(np.cumsum(block_counts)-block_counts,block_counts)
+
+def datetimes_to_nanoseconds(datetimes:pd.Series):
+    '''
+    Converts a series of datetimes to an array of int64 nanoseconds since the
+    epoch, regardless of the resolution used to store the series.
+    '''
+    return pd.to_datetime(datetimes).to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+def interval_blocks(
+        df:pd.DataFrame,
+        nminutes:int=60,
+        start_column:str='CURTAILMENT START DATE TIME',
+        end_column:str='CURTAILMENT END DATE TIME'
+    ):
+    '''
+    Determines the blocks covered by each interval in a dataframe. The start of
+    each interval is floored to the block length, and each interval covers the
+    whole blocks between the floored start and the end, with a minimum of one
+    block.
+
+    Returns:
+        a tuple containing an int64 array of floored interval starts in
+        nanoseconds since the epoch and an int64 array of block counts.
+    '''
+    block_ns = np.int64(nminutes*60*10**9)
+    start_ns = datetimes_to_nanoseconds(df.loc[:,start_column])
+    end_ns = datetimes_to_nanoseconds(df.loc[:,end_column])
+    start_ns = start_ns - start_ns%block_ns
+    block_counts = np.maximum((end_ns-start_ns)//block_ns,1)
+    return start_ns,block_counts
+
+def expand_intervals(
+        df:pd.DataFrame,
+        nminutes:int=60,
+        start_column:str='CURTAILMENT START DATE TIME',
+        end_column:str='CURTAILMENT END DATE TIME',
+        datetime_column:str='DATETIME'
+    ):
+    '''
+    Subdivides each interval in a dataframe into nminutes-long blocks as
+    determined by interval_blocks. Block counts are computed from int64
+    nanosecond arrays and rows are repeated with numpy, so no python objects
+    are created for individual blocks.
+
+    Parameters:
+        df - a dataframe with one row per interval.
+        nminutes - the length of each block in minutes. Default value is 60.
+        start_column - the name of the column containing interval starts.
+        end_column - the name of the column containing interval ends.
+        datetime_column - the name of the column to contain the start of each
+            block in the output.
+
+    Returns:
+        a dataframe with one row per block, containing all input columns except
+        the start and end columns, plus the datetime column.
+    '''
+    block_ns = np.int64(nminutes*60*10**9)
+    start_ns,block_counts = interval_blocks(df,nminutes,start_column,end_column)
+    expanded = df.drop(columns=[start_column,end_column]).iloc[np.repeat(np.arange(len(df)),block_counts)].reset_index(drop=True)
+    expanded.loc[:,datetime_column] = pd.to_datetime((np.repeat(start_ns,block_counts)+block_offsets(block_counts)*block_ns).view('datetime64[ns]'))
+    return expanded
+
+def join_intervals_to_observations(
+        intervals:pd.DataFrame,
+        observations:pd.DataFrame,
+        nminutes:int=60,
+        interval_station_column:str='WeatherStationID',
+        observation_station_column:str='CALL_SIGN',
+        observation_datetime_column:str='DATE',
+        start_column:str='CURTAILMENT START DATE TIME',
+        end_column:str='CURTAILMENT END DATE TIME',
+        datetime_column:str='DATETIME'
+    ):
+    '''
+    Pairs each interval with the observations from its weather station which
+    fall within the blocks it covers, without expanding intervals into blocks.
+    Observations are sorted by station and block, and the first and last
+    covered observations for every interval are located together by binary
+    search. The result contains the same rows as expanding the intervals with
+    expand_intervals and inner-merging with the observations on station and
+    datetime.
+
+    Parameters:
+        intervals - a dataframe with one row per interval, including a weather
+            station column and start and end columns.
+        observations - a dataframe with one row per weather station and
+            block, e.g., as returned by resample_weather.
+        nminutes - the length of each block in minutes. Default value is 60.
+        interval_station_column - the name of the weather station column in
+            intervals.
+        observation_station_column - the name of the weather station column in
+            observations.
+        observation_datetime_column - the name of the datetime column in
+            observations.
+        start_column - the name of the column containing interval starts.
+        end_column - the name of the column containing interval ends.
+        datetime_column - the name of the column to contain the start of each
+            block in the output.
+
+    Returns:
+        a dataframe with one row per pair of interval and observation,
+        containing all interval columns except the start and end columns, the
+        datetime column, and all observation columns except the station and
+        datetime columns.
+    '''
+    block_ns = np.int64(nminutes*60*10**9)
+    start_ns,block_counts = interval_blocks(intervals,nminutes,start_column,end_column)
+    # encode stations and blocks as a single sortable integer key:
+    stations = pd.Index(observations.loc[:,observation_station_column].unique())
+    observation_station_codes = stations.get_indexer(observations.loc[:,observation_station_column])
+    interval_station_codes = stations.get_indexer(intervals.loc[:,interval_station_column])
+    observation_ns = datetimes_to_nanoseconds(observations.loc[:,observation_datetime_column])
+    first_ns = min(observation_ns.min(),start_ns.min()) if len(observation_ns)>0 and len(start_ns)>0 else 0
+    first_ns = first_ns - first_ns%block_ns
+    observation_blocks = (observation_ns-first_ns)//block_ns
+    interval_blocks_start = (start_ns-first_ns)//block_ns
+    span = max(observation_blocks.max(),(interval_blocks_start+block_counts).max()) + 1 if len(observation_ns)>0 and len(start_ns)>0 else 1
+    observation_keys = observation_station_codes.astype(np.int64)*span + observation_blocks
+    order = np.argsort(observation_keys,kind='stable')
+    observation_keys = observation_keys[order]
+    interval_keys = interval_station_codes.astype(np.int64)*span + interval_blocks_start
+    lower = np.searchsorted(observation_keys,interval_keys,side='left')
+    upper = np.searchsorted(observation_keys,interval_keys+block_counts,side='left')
+    # intervals whose weather station has no observations match nothing:
+    pair_counts = np.where(interval_station_codes>=0,upper-lower,0)
+    interval_rows = np.repeat(np.arange(len(intervals)),pair_counts)
+    observation_rows = order[np.repeat(lower,pair_counts)+block_offsets(pair_counts)]
+    pairs = intervals.drop(columns=[start_column,end_column]).iloc[interval_rows].reset_index(drop=True)
+    pairs.loc[:,datetime_column] = pd.to_datetime(observation_ns[observation_rows].view('datetime64[ns]'))
+    observation_columns = [c for c in observations.columns if c not in [observation_station_column,observation_datetime_column]]
+    for observation_column in observation_columns:
+        pairs.loc[:,observation_column] = observations.loc[:,observation_column].to_numpy()[observation_rows]
+    return pairs
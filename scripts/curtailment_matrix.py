@@ -0,0 +1,213 @@
+import pandas as pd
+import numpy as np
+
+from curtailment_intervals import block_offsets,datetimes_to_nanoseconds,interval_blocks
+from weather_station_blending import primary_weather_stations,neighbouring_stations,inverse_distance_weights,resource_station_temperatures
+
+class CurtailmentMatrix:
+    '''
+    An array-backed representation of curtailments and temperatures for every
+    resource and every nminutes-long block between the first and last reported
+    curtailments. Blocks without a reported curtailment are assumed to have
+    zero curtailment due to ambient temperatures. Values are stored in 2-D
+    numpy arrays indexed by resource code and block offset, with temperatures
+    stored once per weather station and broadcast to resources by station
+    code. Where the weather station map lists several stations for a
+    resource, gaps at the nearest station may be filled from the next
+    nearest, or temperatures blended by inverse distance, as in
+    resource_station_temperatures. Values are stored in single precision and
+    identifiers are returned as categoricals, following the compact schema in
+    curtailment_schema.py.
+    '''
+    nminutes = 60
+    first_ns = 0
+    number_of_blocks = 0
+    resource_ids = pd.Index([])
+    resource_names = np.array([])
+    resource_unit_types = np.array([])
+    resource_weather_station_ids = np.array([])
+    resource_station_codes = np.array([],dtype=np.int64)
+    neighbour_station_codes = np.empty((0,1),dtype=np.int64)
+    neighbour_station_distances = np.empty((0,1))
+    station_weights = None
+    station_blending = 'nearest'
+    inverse_distance_power = 2.0
+    weather_station_ids = pd.Index([])
+    curtailment_mw = np.empty((0,0),dtype=np.float32)
+    pmax_mw = np.empty((0,0),dtype=np.float32)
+    included = np.empty((0,0),dtype=bool)
+    temperatures = np.empty((0,0),dtype=np.float32)
+    def __init__(
+            self,
+            curtailment_intervals:pd.DataFrame,
+            weather_station_map:pd.DataFrame,
+            weather_data:pd.DataFrame,
+            nminutes:int=60,
+            station_blending:str='nearest',
+            number_of_stations:int=None,
+            inverse_distance_power:float=2.0
+        ):
+        '''
+        Initializes the matrix from curtailment intervals, a map of resources
+        to weather stations, and weather observations.
+
+        Parameters:
+            curtailment_intervals - a dataframe of curtailments with one row per
+                report, as stored in CurtailmentModeller's
+                resource_curtailment_intervals attribute.
+            weather_station_map - a dataframe with ResourceID, UnitType, and
+                WeatherStationID columns, and optionally a Dist column, with
+                one or more rows per resource.
+            weather_data - a dataframe with CALL_SIGN, DATE, and DRY BULB
+                TEMPERATURE columns on the same block grid.
+            nminutes - the length of each block in minutes. Default value is
+                60.
+            station_blending - one of 'nearest', 'fallback', or 'inverse
+                distance'; see resource_station_temperatures. Default value
+                is 'nearest'.
+            number_of_stations - if given, the maximum number of stations used
+                for each resource.
+            inverse_distance_power - the exponent of inverse distance weights.
+                Default value is 2.
+        '''
+        self.nminutes = nminutes
+        self.station_blending = station_blending
+        self.inverse_distance_power = inverse_distance_power
+        self.set_curtailments(curtailment_intervals)
+        self.set_weather(weather_station_map,weather_data,number_of_stations)
+
+    def block_ns(self):
+        '''
+        Returns the length of each block in nanoseconds.
+        '''
+        return np.int64(self.nminutes*60*10**9)
+
+    def datetimes(self):
+        '''
+        Returns the start of each block as an array of datetimes.
+        '''
+        return (self.first_ns+np.arange(self.number_of_blocks,dtype=np.int64)*self.block_ns()).view('datetime64[ns]')
+
+    def set_curtailments(self,curtailment_intervals:pd.DataFrame):
+        '''
+        Scatters curtailments into resource by block arrays. Where several
+        curtailments cover the same block for a resource, the last reported
+        curtailment is used. Blocks whose last reported curtailment is not a
+        forced outage due to ambient temperatures are excluded.
+        '''
+        df = curtailment_intervals
+        block_ns = self.block_ns()
+        start_ns,block_counts = interval_blocks(df,self.nminutes)
+        self.first_ns = start_ns.min()
+        self.number_of_blocks = int(((start_ns+block_counts*block_ns).max()-self.first_ns)//block_ns)
+        self.resource_ids = pd.Index(np.sort(df.loc[:,'RESOURCE ID'].astype(str).unique()))
+        resource_codes = self.resource_ids.get_indexer(df.loc[:,'RESOURCE ID'].astype(str))
+        interval_rows = np.repeat(np.arange(len(df)),block_counts)
+        block_indices = np.repeat((start_ns-self.first_ns)//block_ns,block_counts) + block_offsets(block_counts)
+        flat_indices = resource_codes[interval_rows]*self.number_of_blocks + block_indices
+        # default capacity for blocks without curtailments is the average over
+        # all reported blocks for each resource:
+        pmax_mw = df.loc[:,'RESOURCE PMAX MW'].to_numpy(dtype=float)
+        has_pmax = ~np.isnan(pmax_mw[interval_rows])
+        pmax_totals = np.bincount(resource_codes[interval_rows][has_pmax],weights=pmax_mw[interval_rows][has_pmax],minlength=len(self.resource_ids))
+        pmax_counts = np.bincount(resource_codes[interval_rows][has_pmax],minlength=len(self.resource_ids))
+        with np.errstate(invalid='ignore',divide='ignore'):
+            average_pmax_mw = pmax_totals / pmax_counts
+        # keep only the last reported curtailment in each block:
+        _,last_reversed = np.unique(flat_indices[::-1],return_index=True)
+        last = len(flat_indices) - 1 - last_reversed
+        flat_indices = flat_indices[last]
+        interval_rows = interval_rows[last]
+        shape = (len(self.resource_ids),self.number_of_blocks)
+        self.curtailment_mw = np.zeros(shape,dtype=np.float32)
+        self.curtailment_mw.flat[flat_indices] = df.loc[:,'CURTAILMENT MW'].to_numpy(dtype=float)[interval_rows]
+        self.pmax_mw = np.repeat(average_pmax_mw.astype(np.float32).reshape(-1,1),self.number_of_blocks,axis=1)
+        self.pmax_mw.flat[flat_indices] = np.where(np.isnan(pmax_mw[interval_rows]),self.pmax_mw.flat[flat_indices],pmax_mw[interval_rows])
+        forced_ambient = (
+            (df.loc[:,'OUTAGE TYPE'].to_numpy()=='FORCED')&
+            (df.loc[:,'NATURE OF WORK'].to_numpy()=='AMBIENT_DUE_TO_TEMP')
+        )
+        self.included = np.ones(shape,dtype=bool)
+        self.included.flat[flat_indices] = forced_ambient[interval_rows]
+        self.resource_names = df.groupby(df.loc[:,'RESOURCE ID'].astype(str))['RESOURCE NAME'].first().astype(str).reindex(self.resource_ids).to_numpy()
+
+    def set_weather(self,weather_station_map:pd.DataFrame,weather_data:pd.DataFrame,number_of_stations:int=None):
+        '''
+        Stores temperatures in a weather station by block array, assigns each
+        resource the code of its nearest weather station, and arranges the
+        codes of its neighbouring stations by distance. Inverse distance
+        weights are computed once here if used.
+        '''
+        station_map = primary_weather_stations(weather_station_map.astype({'ResourceID':str})).set_index('ResourceID').reindex(self.resource_ids)
+        self.resource_unit_types = station_map.loc[:,'UnitType'].astype(object).to_numpy()
+        self.resource_weather_station_ids = station_map.loc[:,'WeatherStationID'].astype(object).to_numpy()
+        self.weather_station_ids = pd.Index(np.sort(weather_data.loc[:,'CALL_SIGN'].astype(str).unique()))
+        self.resource_station_codes = self.weather_station_ids.get_indexer(self.resource_weather_station_ids)
+        station_codes = self.weather_station_ids.get_indexer(weather_data.loc[:,'CALL_SIGN'].astype(str))
+        block_indices = (datetimes_to_nanoseconds(weather_data.loc[:,'DATE'])-self.first_ns)//self.block_ns()
+        in_range = (block_indices>=0)&(block_indices<self.number_of_blocks)
+        self.temperatures = np.full((len(self.weather_station_ids),self.number_of_blocks),np.nan,dtype=np.float32)
+        self.temperatures[station_codes[in_range],block_indices[in_range]] = weather_data.loc[:,'DRY BULB TEMPERATURE'].to_numpy(dtype=float)[in_range]
+        self.neighbour_station_codes,self.neighbour_station_distances = neighbouring_stations(weather_station_map,self.resource_ids,self.weather_station_ids,number_of_stations)
+        if self.station_blending=='inverse distance':
+            self.station_weights = inverse_distance_weights(self.neighbour_station_codes,self.neighbour_station_distances,len(self.weather_station_ids),self.inverse_distance_power)
+
+    def resource_temperatures(self,resource_codes:np.ndarray=None):
+        '''
+        Broadcasts weather station temperatures to resources by the station
+        blending method, returning a resource by block array for the given
+        resource codes, or for all resources if none are given. Resources
+        without a weather station have missing temperatures.
+        '''
+        if resource_codes is None:
+            resource_codes = np.arange(len(self.resource_ids))
+        return resource_station_temperatures(
+            self.temperatures,
+            self.neighbour_station_codes[resource_codes,:],
+            self.neighbour_station_distances[resource_codes,:],
+            self.station_blending,
+            self.inverse_distance_power,
+            None if self.station_weights is None else self.station_weights[resource_codes,:]
+        )
+
+    def resource_chunks(self,number_of_chunks:int=16):
+        '''
+        Splits the resource codes into up to number_of_chunks contiguous
+        arrays, e.g., one per partition of a dask dataframe built from
+        to_frame.
+        '''
+        return [c for c in np.array_split(np.arange(len(self.resource_ids)),number_of_chunks) if len(c)>0]
+
+    def to_frame(self,resource_codes:np.ndarray=None,start=None,end=None):
+        '''
+        Returns a dataframe with one row per included block and resource with a
+        temperature, ordered by datetime and resource id, for the given
+        resource codes or for all resources if none are given, and for blocks
+        starting at or after start and before end if given. Identifier
+        columns are categoricals built directly from resource codes, with the
+        same categories for any resource codes.
+        '''
+        if resource_codes is None:
+            resource_codes = np.arange(len(self.resource_ids))
+        first_block = 0
+        last_block = self.number_of_blocks
+        if start is not None:
+            first_block = int(np.clip(-((self.first_ns-pd.Timestamp(start).value)//self.block_ns()),0,self.number_of_blocks))
+        if end is not None:
+            last_block = int(np.clip(-((self.first_ns-pd.Timestamp(end).value)//self.block_ns()),first_block,self.number_of_blocks))
+        temperatures = self.resource_temperatures(resource_codes)[:,first_block:last_block]
+        block_indices,rows = np.nonzero((self.included[resource_codes,first_block:last_block]&~np.isnan(temperatures)).T)
+        codes = resource_codes[rows]
+        def resource_categorical(values:np.ndarray):
+            categorical = pd.Categorical(values)
+            return pd.Categorical.from_codes(categorical.codes[codes],categories=categorical.categories)
+        return pd.DataFrame({
+            'DATETIME' : self.datetimes()[first_block+block_indices],
+            'RESOURCE ID' : pd.Categorical.from_codes(codes,categories=self.resource_ids),
+            'RESOURCE NAME' : resource_categorical(self.resource_names),
+            'UnitType' : resource_categorical(self.resource_unit_types),
+            'CURTAILMENT MW' : self.curtailment_mw[codes,first_block+block_indices],
+            'RESOURCE PMAX MW' : self.pmax_mw[codes,first_block+block_indices],
+            'WeatherStationID' : resource_categorical(self.resource_weather_station_ids),
+            'DRY BULB TEMPERATURE' : temperatures[rows,block_indices],
+        })
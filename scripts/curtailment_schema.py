@@ -0,0 +1,94 @@
+import pandas as pd
+import numpy as np
+
+CATEGORICAL_COLUMNS = [
+    'RESOURCE ID',
+    'ResourceID',
+    'RESOURCE NAME',
+    'UnitType',
+    'WeatherStationID',
+    'CALL_SIGN',
+    'OUTAGE TYPE',
+    'NATURE OF WORK',
+]
+FLOAT_COLUMNS = [
+    'CURTAILMENT MW',
+    'RESOURCE PMAX MW',
+    'DRY BULB TEMPERATURE',
+    'DEW POINT',
+    'PRESSURE',
+    'PERCENT CURTAILMENT',
+]
+DATETIME_COLUMNS = [
+    'DATETIME',
+    'DATE',
+    'CURTAILMENT START DATE TIME',
+    'CURTAILMENT END DATE TIME',
+]
+
+def compact_dtypes(columns:list):
+    '''
+    Returns a dictionary mapping each of the given columns found in the
+    schema to its compact dtype: categorical for identifiers and other
+    repeated strings, float32 for temperatures, capacities, and ratios, and
+    datetime64 for datetimes. Columns not in the schema are omitted.
+    '''
+    dtypes = {}
+    for column in columns:
+        if column in CATEGORICAL_COLUMNS:
+            dtypes[column] = 'category'
+        elif column in FLOAT_COLUMNS:
+            dtypes[column] = np.float32
+        elif column in DATETIME_COLUMNS:
+            dtypes[column] = 'datetime64[ns]'
+    return dtypes
+
+def standard_dtypes(columns:list):
+    '''
+    Returns a dictionary mapping each of the given columns found in the
+    schema to the dtype pandas uses by default: object for strings, float64
+    for numbers, and datetime64 for datetimes.
+    '''
+    return {
+        column : {'category':object,np.float32:np.float64}.get(dtype,dtype)
+        for column,dtype in compact_dtypes(columns).items()
+    }
+
+def apply_compact_schema(df:pd.DataFrame):
+    '''
+    Casts the columns of a pandas or dask dataframe found in the schema to
+    their compact dtypes. Categorical columns of dask dataframes have known
+    categories only if the input's categories were already known.
+    '''
+    dtypes = {
+        column : dtype for column,dtype in compact_dtypes(df.columns).items()
+        if str(df[column].dtype)!=str(dtype) and not (dtype=='category' and str(df[column].dtype)=='category')
+    }
+    return df.astype(dtypes)
+
+def memory_report(df):
+    '''
+    Compares the memory used by each column of a pandas or dask dataframe
+    under the compact schema with the memory used under pandas' default
+    dtypes.
+
+    Returns:
+        a dataframe with one row per column, plus a TOTAL row, with columns
+        COMPACT DTYPE, STANDARD DTYPE, COMPACT MB, STANDARD MB, and SAVING.
+    '''
+    compact = apply_compact_schema(df)
+    standard = compact.astype(standard_dtypes(compact.columns))
+    compact_bytes = compact.memory_usage(index=False,deep=True)
+    standard_bytes = standard.memory_usage(index=False,deep=True)
+    if hasattr(compact_bytes,'compute'):
+        import dask
+        compact_bytes,standard_bytes = dask.compute(compact_bytes,standard_bytes)
+    report = pd.DataFrame({
+        'COMPACT DTYPE' : compact.dtypes.astype(str),
+        'STANDARD DTYPE' : standard.dtypes.astype(str),
+        'COMPACT MB' : compact_bytes/2**20,
+        'STANDARD MB' : standard_bytes/2**20,
+    })
+    report.loc['TOTAL',:] = ['','',report.loc[:,'COMPACT MB'].sum(),report.loc[:,'STANDARD MB'].sum()]
+    report.loc[:,'SAVING'] = 1 - report.loc[:,'COMPACT MB'].astype(float)/report.loc[:,'STANDARD MB'].astype(float)
+    return report
@@ -0,0 +1,315 @@
+import re
+import json
+import sqlite3
+import threading
+from itertools import count
+from contextlib import contextmanager
+import pandas as pd
+
+EZDB_SCHEMA = 'ezdb_ed_main.public'
+
+class PostgresBackend:
+    '''
+    Runs queries on EZDB through a pool of psycopg2 connections which is
+    opened on the first query and shared by every later query, rather than
+    connecting once per query. Large results may be streamed through
+    server-side cursors.
+    '''
+    database = 'db_main'
+    user = 'uid'
+    minimum_connections = 1
+    maximum_connections = 4
+    def __init__(self,database:str='db_main',user:str='uid',minimum_connections:int=1,maximum_connections:int=4):
+        '''
+        initializes a backend without connecting.
+
+        parameters:
+            database - the key in login.pguser of the database name. Default
+                is db_main.
+            user - the key in login.pguser of the user name. Default is uid.
+            minimum_connections, maximum_connections - the numbers of
+                connections kept open and allowed open at once by the pool.
+        '''
+        self.database = database
+        self.user = user
+        self.minimum_connections = minimum_connections
+        self.maximum_connections = maximum_connections
+        self.pool = None
+        self.lock = threading.Lock()
+        self.cursor_names = count()
+
+    def get_pool(self):
+        '''
+        returns the backend's connection pool, opening it if necessary.
+        '''
+        with self.lock:
+            if self.pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+                from login import pguser
+                self.pool = ThreadedConnectionPool(
+                    self.minimum_connections,
+                    self.maximum_connections,
+                    database=pguser[self.database],
+                    user=pguser[self.user],
+                    password=pguser['passwd'],
+                    host=pguser['host']
+                )
+        return self.pool
+
+    @contextmanager
+    def connect(self):
+        '''
+        borrows a connection from the pool for the duration of a with block,
+        committing on success or rolling back on error before returning it.
+        '''
+        pool = self.get_pool()
+        connection = pool.getconn()
+        try:
+            with connection:
+                yield connection
+        finally:
+            pool.putconn(connection)
+
+    def cursor(self,connection,stream:bool=False,chunk_size:int=10000):
+        '''
+        returns a cursor on the given connection, which is a named server-side
+        cursor fetching chunk_size rows at a time if stream is True.
+        '''
+        if stream:
+            cursor = connection.cursor(name='ezdb_cursor_{}'.format(next(self.cursor_names)))
+            cursor.itersize = chunk_size
+            return cursor
+        return connection.cursor()
+
+    def prepare(self,sql:str,parameters:dict):
+        '''
+        returns the query and its parameters unchanged; queries are written
+        for Postgres, with lists passed whole as arrays.
+        '''
+        return sql,parameters
+
+    def insert_rows(self,connection,table:str,columns:list,rows:list,page_size:int=1000):
+        '''
+        inserts rows into a table in batches of page_size rows per statement.
+        '''
+        from psycopg2.extras import execute_values
+        with connection.cursor() as cursor:
+            execute_values(
+                cursor,
+                'INSERT INTO {} ({}) VALUES %s'.format(table,','.join(['"{}"'.format(c) for c in columns])),
+                rows,
+                page_size=page_size
+            )
+
+    def close(self):
+        '''
+        closes every connection in the pool.
+        '''
+        with self.lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+
+class SQLiteBackend:
+    '''
+    Runs the same queries as PostgresBackend on a local SQLite database, e.g.,
+    a test fixture holding small copies of EZDB tables without the
+    ezdb_ed_main.public schema prefix. Queries are translated from the few
+    Postgres constructs they use: %(name)s parameters become :name, lists
+    passed to unnest are passed as JSON arrays to json_each, and STRPOS is
+    provided as a function.
+    '''
+    path = ':memory:'
+    def __init__(self,path=':memory:'):
+        '''
+        initializes a backend using the SQLite database at path. An in-memory
+        database is kept open for the life of the backend.
+        '''
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self.memory_connection = self.open_connection() if self.path==':memory:' else None
+
+    def open_connection(self):
+        connection = sqlite3.connect(self.path,check_same_thread=False)
+        connection.create_function('STRPOS',2,lambda s,t: None if s is None or t is None else s.find(t)+1,deterministic=True)
+        return connection
+
+    @contextmanager
+    def connect(self):
+        '''
+        opens a connection for the duration of a with block, committing on
+        success or rolling back on error.
+        '''
+        if self.memory_connection is not None:
+            with self.lock:
+                with self.memory_connection:
+                    yield self.memory_connection
+        else:
+            connection = self.open_connection()
+            try:
+                with connection:
+                    yield connection
+            finally:
+                connection.close()
+
+    def cursor(self,connection,stream:bool=False,chunk_size:int=10000):
+        '''
+        returns a cursor on the given connection, fetching chunk_size rows at
+        a time from fetchmany.
+        '''
+        cursor = connection.cursor()
+        cursor.arraysize = chunk_size
+        return cursor
+
+    def prepare(self,sql:str,parameters:dict):
+        '''
+        translates a query written for Postgres and its parameters for SQLite.
+        '''
+        parameters = {
+            k : json.dumps(list(v)) if isinstance(v,(list,tuple,pd.Series,pd.Index)) else v
+            for k,v in (parameters or {}).items()
+        }
+        sql = sql.replace(EZDB_SCHEMA+'.','')
+        sql = re.sub(r'SELECT\s+unnest\(\s*%\((\w+)\)s(::\w+\[\])?\s*\)',r'SELECT value FROM json_each(:\1)',sql,flags=re.IGNORECASE)
+        sql = re.sub(r'%\((\w+)\)s',r':\1',sql)
+        return sql,parameters
+
+    def insert_rows(self,connection,table:str,columns:list,rows:list,page_size:int=1000):
+        '''
+        inserts rows into a table, ignoring page_size.
+        '''
+        connection.executemany(
+            'INSERT INTO {} ({}) VALUES ({})'.format(
+                table.replace(EZDB_SCHEMA+'.',''),
+                ','.join(['"{}"'.format(c) for c in columns]),
+                ','.join(['?']*len(columns))
+            ),
+            rows
+        )
+
+    def close(self):
+        if self.memory_connection is not None:
+            self.memory_connection.close()
+            self.memory_connection = None
+
+backends = {}
+backend_override = None
+backends_lock = threading.Lock()
+
+def get_backend(database:str='db_main',user:str='uid'):
+    '''
+    Returns the backend for a database and user, creating a PostgresBackend
+    on first use, or the backend set by set_backend if any.
+    '''
+    if backend_override is not None:
+        return backend_override
+    with backends_lock:
+        if (database,user) not in backends:
+            backends[(database,user)] = PostgresBackend(database,user)
+        return backends[(database,user)]
+
+def set_backend(backend=None):
+    '''
+    Directs every query to the given backend, e.g., a SQLiteBackend holding
+    a test fixture, or back to EZDB if backend is None.
+    '''
+    global backend_override
+    backend_override = backend
+
+def stream_query(sql:str,parameters:dict=None,columns:list=None,chunk_size:int=10000,backend=None):
+    '''
+    Runs a query and yields its results as dataframes of up to chunk_size
+    rows, so large results need not be held in memory at once.
+
+    Parameters:
+        sql - a query written for Postgres, with %(name)s parameters and
+            list parameters expanded by SELECT unnest(%(name)s::text[]).
+        parameters - a dictionary of parameter values.
+        columns - a list of column names for the results; defaults to the
+            names returned by the query.
+        chunk_size - the number of rows fetched at a time. Default is 10000.
+        backend - the backend to query. Default is get_backend().
+    '''
+    backend = backend or get_backend()
+    sql,parameters = backend.prepare(sql,parameters)
+    with backend.connect() as connection:
+        cursor = backend.cursor(connection,stream=True,chunk_size=chunk_size)
+        try:
+            cursor.execute(sql,parameters)
+            while True:
+                results = cursor.fetchmany(chunk_size)
+                if len(results)==0:
+                    break
+                yield pd.DataFrame(results,columns=columns or [d[0] for d in cursor.description])
+        finally:
+            cursor.close()
+
+def query(sql:str,parameters:dict=None,columns:list=None,backend=None):
+    '''
+    Runs a query and returns its results as a dataframe. See stream_query.
+    '''
+    backend = backend or get_backend()
+    sql,parameters = backend.prepare(sql,parameters)
+    with backend.connect() as connection:
+        cursor = backend.cursor(connection)
+        try:
+            cursor.execute(sql,parameters)
+            results = cursor.fetchall()
+            return pd.DataFrame(results,columns=columns or [d[0] for d in cursor.description])
+        finally:
+            cursor.close()
+
+def insert_rows(table:str,columns:list,rows:list,page_size:int=1000,backend=None):
+    '''
+    Inserts a list of row tuples into a table in batches, e.g., to load a
+    test fixture.
+    '''
+    backend = backend or get_backend()
+    with backend.connect() as connection:
+        backend.insert_rows(connection,table,columns,rows,page_size)
+
+def get_resource_types(resource_ids:list,backend=None):
+    '''
+    Retrieves resource unit-types for each resource id in input list from EZDB.
+
+    Parameters:
+        resource_ids - a list of strings containing CAISO IDs for generation
+            resources
+        backend - the backend to query. Default is get_backend('db_main',
+            'postgres').
+
+    Returns:
+        a dataframe containing three columns: resource id, resource type, and
+        unit type
+    '''
+    sql_str = '''
+        WITH curtailed_resources ("ResourceID") AS (
+            SELECT unnest(%(resource_ids)s::text[])
+        )
+
+        SELECT
+            "ResourceID"
+            ,"ResourceType"
+            ,"UnitType"
+        FROM (
+            SELECT
+                b."ResourceID"
+                ,c."RESOURCE_TYPE" AS "ResourceType"
+                ,c."UNIT_TYPE" AS "UnitType"
+                ,ROW_NUMBER() OVER (PARTITION BY b."ResourceID") AS "RowNumber"
+            FROM curtailed_resources AS b
+            LEFT JOIN ezdb_ed_main.public.caisomastercapability AS c
+            ON b."ResourceID"=c."ResID"
+        ) AS a
+        WHERE "RowNumber"=1
+        ORDER BY "ResourceID"
+    '''
+    print('Retrieving generator resource types from EZDB ...')
+    results = query(
+        sql_str,
+        {'resource_ids' : sorted(resource_ids)},
+        columns=['RESOURCE ID','RESOURCE TYPE','UNIT TYPE'],
+        backend=backend or get_backend('db_main','postgres')
+    )
+    print('Retrieved {} resource types.'.format(len(results)))
+    return results
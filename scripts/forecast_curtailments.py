@@ -68,9 +68,13 @@ class DerateForecaster:
             'KIGM' : -6.558333333333334,
         }
     }
-    def __init__(self,weather_data_path:Path):
+    def __init__(self,weather_data_path:Path,stations:list=None,years:list=None):
+        '''
+        reads the DateTime and Temp columns of the weather data, optionally
+        for only the given station ids and years.
+        '''
         self.weather_data_path = weather_data_path
-        self.weather_data_meta,self.weather_data = read_cif(self.weather_data_path)
+        self.weather_data_meta,self.weather_data = read_cif(self.weather_data_path,columns=['DateTime','Temp'],stations=stations,years=years)
         self.weather_data.loc[:,'DateTime'] = self.weather_data.loc[:,'DateTime'].dt.tz_localize(None)
 
     def get_derate_parameters(self,resource_class:dict):
@@ -93,7 +97,7 @@ class DerateForecaster:
         weather_data.loc[:,'Date'] = weather_data.loc[:,'DateTime'].map(f)
         f = lambda t: t.replace(month=1,day=1,hour=0,minute=0,second=0,microsecond=0)
         weather_data.loc[:,'Year'] = weather_data.loc[:,'DateTime'].map(f)
-        min_temps = weather_data.groupby(['StationID','Year','Date']).mean().reset_index().groupby(['StationID','Year']).min().reset_index().loc[:,['StationID','Year','Temp']]
+        min_temps = weather_data.groupby(['StationID','Year','Date'],observed=True).mean().reset_index().groupby(['StationID','Year'],observed=True).min().reset_index().loc[:,['StationID','Year','Temp']]
         for station_id in self.weather_data.loc[:,'StationID'].unique():
             # the 'rated temperature' is defined here as the lowest daily
             # average temperature in the first available year of weather data
@@ -139,14 +143,16 @@ class DerateForecaster:
 if __name__=='__main__':
     # get parameters for historic weather years:
     historic_weather_data_path = Path(r'M:\Users\RH2\src\caiso_curtailments\climate_informed_weather_data\ncdc_1978_2023.parquet')
+    unit_types = ['combined_cycle','combustion_turbine']
+    weather_stations = ['KNKX','KOAK','KRDD','KRNO','KSAC','KSAN','KSBA','KSCK','KSFO','KSJC','KSMF','KUKI']
+    # only the stations for which derates are saved are read:
     historic_derates = DerateForecaster(
         weather_data_path=historic_weather_data_path,
+        stations=weather_stations,
     )
     historic_derates.calculate_derate_intercepts()
     historic_derates.calculate_derates()
 
-    unit_types = ['combined_cycle','combustion_turbine']
-    weather_stations = ['KNKX','KOAK','KRDD','KRNO','KSAC','KSAN','KSBA','KSCK','KSFO','KSJC','KSMF','KUKI']
 
     for unit_type in unit_types:
         for weather_station in weather_stations:
@@ -165,7 +171,8 @@ if __name__=='__main__':
     for cif_scenario in cif_scenarios:
         weather_data_path = weather_data_directory / 'cif_temperature_{}.parquet'.format(cif_scenario)
         derate_forecaster = DerateForecaster(
-            weather_data_path=weather_data_path
+            weather_data_path=weather_data_path,
+            stations=weather_stations,
         )
         derate_forecaster.derate_parameters = historic_derates.derate_parameters
         derate_forecaster.calculate_derates()
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from pandas import Timestamp as ts
+from pandas import Timedelta as td
+
+class MergedDataCache:
+    '''
+    A directory of merged curtailment and weather datasets, each stored under
+    a key derived from the contents of the input files and the parameters used
+    to merge them, so a merged dataset is only rebuilt when an input changes.
+    File hashes are remembered along with each file's size and modification
+    time to avoid re-reading unchanged inputs. Entries are evicted when older
+    than a maximum age or, least recently used first, when the directory grows
+    beyond a maximum size.
+    '''
+    cache_directory = Path()
+    maximum_size_bytes = 10 * 2**30
+    maximum_age = td(days=90)
+    hash_index_filename = 'file_hashes.json'
+    def __init__(self,cache_directory:Path,maximum_size_bytes:int=10*2**30,maximum_age:td=td(days=90)):
+        '''
+        initializes a cache in the given directory, which is created if it does
+        not exist.
+
+        parameters:
+            cache_directory - a path object pointing to the cache directory
+            maximum_size_bytes - the maximum total size of cached datasets in
+                bytes. Default is 10 GiB.
+            maximum_age - a pandas timedelta giving the maximum time since an
+                entry was last used. Default is 90 days.
+        '''
+        self.cache_directory = cache_directory
+        self.maximum_size_bytes = maximum_size_bytes
+        self.maximum_age = maximum_age
+
+    def file_hash(self,path:Path):
+        '''
+        returns the sha256 hash of a file's contents, reusing the hash from
+        previous calls if the file's size and modification time are unchanged.
+        '''
+        index_path = self.cache_directory / self.hash_index_filename
+        if index_path.is_file():
+            with open(index_path,'r') as f:
+                hash_index = json.load(f)
+        else:
+            hash_index = {}
+        stat = path.stat()
+        entry = hash_index.get(str(path.resolve()),{})
+        if entry.get('size')==stat.st_size and entry.get('mtime_ns')==stat.st_mtime_ns:
+            return entry['sha256']
+        sha256 = hashlib.sha256()
+        with open(path,'rb') as f:
+            for chunk in iter(lambda: f.read(2**20),b''):
+                sha256.update(chunk)
+        hash_index[str(path.resolve())] = {
+            'size' : stat.st_size,
+            'mtime_ns' : stat.st_mtime_ns,
+            'sha256' : sha256.hexdigest(),
+        }
+        self.cache_directory.mkdir(parents=True,exist_ok=True)
+        with open(index_path,'w') as f:
+            json.dump(hash_index,f,indent=1)
+        return sha256.hexdigest()
+
+    def key(self,input_paths:list,parameters:dict):
+        '''
+        returns a key identifying a merged dataset from the contents of its
+        input files and a json-serializable dictionary of parameters. Input
+        files which do not exist, e.g., a processed weather file not yet
+        written, are keyed by their paths.
+        '''
+        description = {
+            'inputs' : sorted(self.file_hash(p) if p.is_file() else 'missing:{}'.format(p) for p in input_paths),
+            'parameters' : parameters,
+        }
+        return hashlib.sha256(json.dumps(description,sort_keys=True,default=str).encode()).hexdigest()[:24]
+
+    def get_path(self,key:str):
+        '''
+        returns the path at which the dataset with the given key is stored.
+        '''
+        return self.cache_directory / 'merged_data_{}.csv'.format(key)
+
+    def lookup(self,key:str):
+        '''
+        returns the path to the cached dataset with the given key, marking it
+        as recently used, or None if no such dataset is cached.
+        '''
+        path = self.get_path(key)
+        if path.is_file():
+            path.touch()
+            return path
+        return None
+
+    def store(self,source_path:Path,key:str):
+        '''
+        copies a merged dataset file into the cache under the given key and
+        evicts stale entries.
+        '''
+        self.cache_directory.mkdir(parents=True,exist_ok=True)
+        shutil.copyfile(source_path,self.get_path(key))
+        self.evict(keep=[key])
+
+    def evict(self,keep:list=[]):
+        '''
+        removes cached datasets last used longer ago than the maximum age, then
+        removes the least recently used datasets until the total size is
+        within the maximum size. Datasets with keys listed in keep are never
+        removed.
+        '''
+        keep_paths = [self.get_path(k) for k in keep]
+        entries = sorted(
+            [p for p in self.cache_directory.glob('merged_data_*.csv') if p not in keep_paths],
+            key=lambda p: p.stat().st_mtime
+        )
+        now = ts.now().timestamp()
+        total_size = sum(p.stat().st_size for p in self.cache_directory.glob('merged_data_*.csv'))
+        for p in entries:
+            size = p.stat().st_size
+            if now-p.stat().st_mtime>self.maximum_age.total_seconds() or total_size>self.maximum_size_bytes:
+                print('Evicting Cached Merged Data {}'.format(p.name))
+                p.unlink()
+                total_size -= size
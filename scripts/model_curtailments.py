@@ -1,28 +1,97 @@
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
+import dask
 import dask.dataframe as ddf
 import re
 from functools import reduce
 from pathlib import Path
-from pandas import Timedelta as td
-from pandas import Timestamp as ts
+from dask.utils import parse_bytes
 import metpy.calc as mpcalc
 from metpy.units import units
 
+from weather_processing import resample_weather
+from curtailment_intervals import expand_intervals,join_intervals_to_observations
+from curtailment_matrix import CurtailmentMatrix
+from weather_station_blending import primary_weather_stations,blended_observations
+from regression_statistics import grouped_sums,split_grouped_sums,accumulate_grouped_sums,shift_grouped_sums,solve_linear_regressions,solve_fixed_effects_regressions,solve_hinge_regressions
+from merged_data_cache import MergedDataCache
+from curtailment_cube import CurtailmentCube
+from bootstrap_regressions import bootstrap_regressions,confidence_intervals
+from curtailment_schema import compact_dtypes,apply_compact_schema,memory_report
+from cross_validation import rolling_origin_folds,score_predictions,summarize_folds
+from robust_regressions import solve_huber_regressions,solve_quantile_regressions
+
 class CurtailmentModeller:
     '''
     A class to assist in modeling curtailments as a function of temperature
     using data from nearby weather stations
     '''
     resource_curtailments = pd.DataFrame()
+    resource_curtailment_intervals = pd.DataFrame()
+    curtailment_matrix = None
+    curtailment_cube = None
+    nminutes = 60
+    maximum_gap_minutes = 120
+    weather_station_blending = 'nearest'
+    number_of_weather_stations = None
+    inverse_distance_power = 2.0
     weather_data = pd.DataFrame()
     weather_station_map = pd.DataFrame()
     weather_station_placenames = pd.DataFrame()
     regression_by_resource = pd.DataFrame()
     regression_by_unit_type = pd.DataFrame()
-    def __init__(self,data_paths:dict):
+    intercepts_by_resource = pd.DataFrame()
+    sweep_results = pd.DataFrame()
+    bootstrap_by_resource = pd.DataFrame()
+    bootstrap_by_unit_type = pd.DataFrame()
+    hinge_regression_by_resource = pd.DataFrame()
+    robust_regression_by_resource = pd.DataFrame()
+    cross_validation_by_fold = pd.DataFrame()
+    cross_validation_by_unit_type = pd.DataFrame()
+    scheduler_options = {}
+    client = None
+    merged_data = None
+    merged_data_parameters = None
+    merged_data_cache = None
+    def __init__(self,data_paths:dict,scheduler:str='threads',number_of_workers:int=None,memory_limit:str=None):
         self.set_data_paths(data_paths)
+        self.set_scheduler(scheduler,number_of_workers,memory_limit)
+
+    def set_scheduler(self,scheduler:str='threads',number_of_workers:int=None,memory_limit:str=None):
+        '''
+        Configures the local dask scheduler used to persist and compute the
+        merged curtailment and weather data.
+
+        Parameters:
+            scheduler - one of 'threads', 'processes', 'synchronous', or
+                'cluster'. The 'cluster' option starts a dask.distributed
+                LocalCluster, which requires the distributed package. Default
+                value is 'threads'.
+            number_of_workers - the number of threads, processes, or cluster
+                workers to use. Default value is None, which uses dask's
+                default for the scheduler.
+            memory_limit - the memory limit per cluster worker, e.g., '4GB'.
+                Only used with the 'cluster' scheduler. Default value is None,
+                which uses dask's default.
+        '''
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+        if scheduler=='cluster':
+            from dask.distributed import Client,LocalCluster
+            cluster_options = {}
+            if number_of_workers is not None:
+                cluster_options['n_workers'] = number_of_workers
+            if memory_limit is not None:
+                cluster_options['memory_limit'] = memory_limit
+            self.client = Client(LocalCluster(**cluster_options))
+            self.scheduler_options = {}
+        elif scheduler in ['threads','processes','synchronous']:
+            self.scheduler_options = {'scheduler':scheduler}
+            if number_of_workers is not None:
+                self.scheduler_options['num_workers'] = number_of_workers
+        else:
+            raise ValueError('Unknown Scheduler: {}'.format(scheduler))
 
     def set_data_paths(self,data_paths:dict):
         self.data_paths = {
@@ -34,12 +103,28 @@ class CurtailmentModeller:
             'regression_by_resource_filename' : data_paths['regression_by_resource_filename'],
             'regression_by_unit_type_filename' : data_paths['regression_by_unit_type_filename'],
             'merged_data_filename' : data_paths['merged_data_filename'],
+            'merged_data_cache_directory' : data_paths.get(
+                'merged_data_cache_directory',
+                data_paths['merged_data_filename'].parent / 'merged_data_cache'
+            ),
         }
+        self.data_paths['curtailment_cube_filename'] = data_paths.get(
+            'curtailment_cube_filename',
+            data_paths['merged_data_filename'].parent / 'curtailment_cube.csv'
+        )
+        for name in ['bootstrap_by_resource','bootstrap_by_unit_type','hinge_regression_by_resource','robust_regression_by_resource','cross_validation_by_fold','cross_validation_by_unit_type']:
+            self.data_paths['{}_filename'.format(name)] = data_paths.get(
+                '{}_filename'.format(name),
+                data_paths['regression_by_resource_filename'].parent / '{}.csv'.format(name)
+            )
+        self.merged_data_cache = MergedDataCache(self.data_paths['merged_data_cache_directory'])
 
-    def load_resource_curtailments(self):
+    def load_resource_curtailments(self,nminutes:int=60,expand:bool=True):
         '''
         Reads a file containing extracted prior trade day curtailment reports
-        and loads the data into a Pandas DataFrame for analysis.
+        and loads the data into a Pandas DataFrame for analysis. Curtailments
+        are kept as intervals and, if expand is True, also subdivided into
+        nminutes-long blocks.
         '''
         print('Loading Resource Curtailment Reports ...')
         df = pd.read_csv(self.data_paths['resource_curtailments_filename'],low_memory=False)
@@ -49,22 +134,21 @@ class CurtailmentModeller:
         df.dropna(axis='index',how='any',inplace=True)
         df.loc[:,'CURTAILMENT START DATE TIME'] = pd.to_datetime(df.loc[:,'CURTAILMENT START DATE TIME'])
         df.loc[:,'CURTAILMENT END DATE TIME'] = pd.to_datetime(df.loc[:,'CURTAILMENT END DATE TIME'])
-        def expand_hours(df_row):
-            start_datetime = df_row.loc['CURTAILMENT START DATE TIME'].replace(minute=0,second=0,microsecond=0)
-            end_datetime = df_row.loc['CURTAILMENT END DATE TIME']
-            delta_datetime = end_datetime - start_datetime
-            return [ts(start_datetime)+td(hours=x) for x in range(max(int(delta_datetime.seconds/3600),1))]
-        df.loc[:,'DATETIME'] = df.apply(expand_hours,axis='columns')
-        df.drop(columns=['CURTAILMENT START DATE TIME','CURTAILMENT END DATE TIME'],inplace=True)
-        self.resource_curtailments = ddf.from_pandas(df.explode('DATETIME').reset_index().drop(columns=['index']),npartitions=16)
+        df = apply_compact_schema(df)
+        self.nminutes = nminutes
+        self.resource_curtailment_intervals = df
+        if expand:
+            self.resource_curtailments = ddf.from_pandas(expand_intervals(df,nminutes=nminutes),npartitions=16)
 
-    def load_weather(self,use_processed:bool=True):
+    def load_weather(self,use_processed:bool=True,nminutes:int=60,maximum_gap_minutes:int=120):
         '''
         Reads a file containing hourly weather data in ISD format downloaded
         from ncei.noaa.gov and loads the data into a Pandas DataFrame for
         analysis. If weather data has already been processed and stored in a
         data file, the use_store_merged flag will read data from that file
-        instead.
+        instead. Observations are resampled to nminutes-long blocks matching
+        the curtailment blocks, with gaps up to maximum_gap_minutes filled by
+        interpolation.
         '''
         def parse_temperature(temp_str:str):
             '''
@@ -129,8 +213,8 @@ class CurtailmentModeller:
             return np.round(wet_bulb_temperature.magnitude,1)
         if use_processed and self.data_paths['processed_weather_data_filename'].is_file():
             print('Loading Pre-Processed Weather Data ...')
-            df = ddf.read_csv(self.data_paths['processed_weather_data_filename'])
-            df['DATE'] = ddf.to_datetime(df['DATE'])
+            df = pd.read_csv(self.data_paths['processed_weather_data_filename'])
+            df.loc[:,'DATE'] = pd.to_datetime(df.loc[:,'DATE'])
         else:
             print('Loading Original Weather Data Files ...')
             df = pd.DataFrame()
@@ -146,7 +230,6 @@ class CurtailmentModeller:
             # extract fields required for later operations:
             df = df.loc[:,['CALL_SIGN','DATE','TMP','DEW','MA1']]
             df.loc[:,'DATE'] = pd.to_datetime(df.loc[:,'DATE'])
-            df.loc[:,'DATE'] = df.loc[:,'DATE'].map(lambda t: t.replace(minute=0,second=0,microsecond=0))
             df.loc[:,'DRY BULB TEMPERATURE'] = df.loc[:,'TMP'].map(parse_temperature)
             df.loc[:,'DEW POINT'] = df.loc[:,'DEW'].map(parse_dew_point)
             df.loc[:,'PRESSURE'] = df.loc[:,'MA1'].map(parse_pressure).round(1)
@@ -169,181 +252,581 @@ class CurtailmentModeller:
             # df.loc[:,'WET BULB TEMPERATURE'] = df.apply(f,axis='columns')
             ### END Removing wet bulb temperatures to reduce calculation time ###
             df.to_csv(self.data_paths['processed_weather_data_filename'],index=False)
-            df = ddf.from_pandas(df,npartitions=16)
-        self.weather_data = df
+        print('Resampling Weather Data to {}-Minute Blocks ...'.format(nminutes))
+        df = resample_weather(df,nminutes=nminutes,maximum_gap_minutes=maximum_gap_minutes)
+        self.maximum_gap_minutes = maximum_gap_minutes
+        self.weather_data = ddf.from_pandas(apply_compact_schema(df),npartitions=16)
 
-    def load_weather_station_map(self):
+    def load_weather_station_map(self,weather_station_blending:str='nearest',number_of_weather_stations:int=None,inverse_distance_power:float=2.0):
         '''
-        Reads a file containing 
+        Reads a file containing the weather station for each resource, or
+        several stations per resource with their distances in a Dist column,
+        e.g., the k nearest stations.
+
+        Parameters:
+            weather_station_blending - how temperatures are assigned to
+                resources from their stations in the merged data: 'nearest'
+                uses the nearest station only, 'fallback' fills gaps at the
+                nearest station from the next nearest station with an
+                observation, and 'inverse distance' blends all stations with
+                observations by inverse distance weights. Default value is
+                'nearest'.
+            number_of_weather_stations - if given, the maximum number of
+                stations used for each resource.
+            inverse_distance_power - the exponent of inverse distance weights.
+                Default value is 2.
         '''
         print('Loading Weather Station Locations ...')
         df = pd.read_csv(self.data_paths['resources_to_weather_stations_map_filename'],low_memory=False)
-        self.weather_station_map = ddf.from_pandas(df.loc[:,['ResourceID','UnitType','WeatherStationID']],npartitions=1)
+        columns = [c for c in ['ResourceID','UnitType','WeatherStationID','Dist'] if c in df.columns]
+        self.weather_station_map = ddf.from_pandas(apply_compact_schema(df.loc[:,columns]),npartitions=1)
+        self.weather_station_blending = weather_station_blending
+        self.number_of_weather_stations = number_of_weather_stations
+        self.inverse_distance_power = inverse_distance_power
 
     def load_weather_station_placenames(self):
         self.weather_station_placenames = ddf.read_csv(self.data_paths['weather_station_placenames_filename'])
 
-    def load_all(self,use_processed:bool=True):
-        self.load_weather(use_processed)
-        self.load_resource_curtailments()
-        self.load_weather_station_map()
+    def load_all(self,use_processed:bool=True,nminutes:int=60,maximum_gap_minutes:int=120,expand_curtailments:bool=True,weather_station_blending:str='nearest',number_of_weather_stations:int=None,inverse_distance_power:float=2.0):
+        self.load_weather(use_processed,nminutes,maximum_gap_minutes)
+        self.load_resource_curtailments(nminutes,expand_curtailments)
+        self.load_weather_station_map(weather_station_blending,number_of_weather_stations,inverse_distance_power)
         self.load_weather_station_placenames()
 
+    def merge_curtailments_and_weather(self,resource_curtailment_intervals:pd.DataFrame=None):
+        '''
+        Pairs each curtailment interval, of the given intervals or otherwise of
+        the resource_curtailment_intervals attribute, with the weather observations from its
+        resource's weather station during each block of the curtailment, using
+        only hours reported in the curtailment data. Curtailments are not
+        expanded into blocks; covering observations are located by binary
+        search on sorted timestamps. Unless weather_station_blending is
+        'nearest', temperatures are first assigned to each resource from its
+        neighbouring stations as in blended_observations, and curtailments are
+        paired with their resource's temperatures.
+
+        Returns:
+            a dask dataframe with one row per curtailed resource and block with
+            a weather observation.
+        '''
+        if resource_curtailment_intervals is None:
+            resource_curtailment_intervals = self.resource_curtailment_intervals
+        weather_station_map = self.weather_station_map.compute()
+        intervals = resource_curtailment_intervals.merge(
+            primary_weather_stations(weather_station_map).drop(columns=['Dist'],errors='ignore'),
+            left_on='RESOURCE ID',
+            right_on='ResourceID'
+        ).drop(columns=['ResourceID'])
+        if self.weather_station_blending=='nearest':
+            df = join_intervals_to_observations(intervals,self.weather_data.compute(),nminutes=self.nminutes)
+        else:
+            observations = blended_observations(
+                weather_station_map,
+                self.weather_data.compute(),
+                pd.Index(np.sort(intervals.loc[:,'RESOURCE ID'].astype(str).unique())),
+                self.weather_station_blending,
+                self.number_of_weather_stations,
+                self.inverse_distance_power,
+                nminutes=self.nminutes,
+                resource_column='WEATHER RESOURCE ID'
+            )
+            df = join_intervals_to_observations(
+                intervals.astype({'RESOURCE ID':str}),
+                observations,
+                nminutes=self.nminutes,
+                interval_station_column='RESOURCE ID',
+                observation_station_column='WEATHER RESOURCE ID'
+            )
+        return ddf.from_pandas(apply_compact_schema(df),npartitions=16)
+
     def impute_zero_curtailments(self):
         '''
         Inserts zero-valued curtailments into hours during which no curtailment
-        were reported for each resource.
+        were reported for each resource. Curtailments and temperatures are
+        scattered into a resource by block CurtailmentMatrix, which is kept as
+        the curtailment_matrix attribute, rather than cross-joining every
+        resource with every hour. Each partition of the returned dataframe is
+        built from the matrix arrays for a chunk of resources only when it is
+        computed, so the long table of every resource and block is never held
+        in memory at once.
 
         Returns:
             Dataframe with curtailments and weather data including imputed 
             zero-valued curtailments
         '''
-        # Determine times in full curtailment dataset:
-        min_datetime = self.resource_curtailments.loc[:,'DATETIME'].min().compute()
-        max_datetime = self.resource_curtailments.loc[:,'DATETIME'].max().compute()
-        datetimes = pd.DataFrame({'DATETIME':[min_datetime+td(hours=d_hrs) for d_hrs in range(int((max_datetime-min_datetime).total_seconds()/3600))]})
-        # Merge records into full list of hours, copying relevant metadata where needed:
-        df = datetimes.merge(self.resource_curtailments.loc[:,'RESOURCE ID'].unique().compute(),how='cross')
-        df = df.merge(
-            self.resource_curtailments.groupby(['RESOURCE ID','DATETIME']).last().reset_index().compute(),
-            how='left',
-            on=['RESOURCE ID','DATETIME']
-        )
-        df.loc[df.loc[:,'RESOURCE NAME'].isna(),'RESOURCE NAME'] = df.loc[(df.loc[:,'RESOURCE NAME'].isna()),['RESOURCE ID']].merge(
-            self.resource_curtailments.loc[:,['RESOURCE ID','RESOURCE NAME']].groupby('RESOURCE ID').first().reset_index().compute(),
-            how='left',
-            on='RESOURCE ID'
-        ).loc[:,'RESOURCE NAME']
-        df.loc[df.loc[:,'RESOURCE PMAX MW'].isna(),'RESOURCE PMAX MW'] = df.loc[(df.loc[:,'RESOURCE PMAX MW'].isna()),['RESOURCE ID']].merge(
-            self.resource_curtailments.loc[:,['RESOURCE ID','RESOURCE PMAX MW']].groupby('RESOURCE ID').mean().reset_index().compute(),
-            how='left',
-            on='RESOURCE ID'
-        ).loc[:,'RESOURCE PMAX MW']
-        # Insert assumed values and metadata:
-        df.loc[df.loc[:,'CURTAILMENT MW'].isna(),'CURTAILMENT MW'] = 0
-        df.loc[df.loc[:,'OUTAGE TYPE'].isna(),'OUTAGE TYPE'] = 'FORCED'
-        df.loc[df.loc[:,'NATURE OF WORK'].isna(),'NATURE OF WORK'] = 'AMBIENT_DUE_TO_TEMP'
-        df = df.merge(
+        self.curtailment_matrix = CurtailmentMatrix(
+            self.resource_curtailment_intervals,
             self.weather_station_map.compute(),
-            how='left',
-            left_on='RESOURCE ID',
-            right_on='ResourceID'
-        )
-        df = df.merge(
             self.weather_data.compute(),
-            how='left',
-            left_on=['WeatherStationID','DATETIME'],
-            right_on=['CALL_SIGN','DATE']
+            nminutes=self.nminutes,
+            station_blending=self.weather_station_blending,
+            number_of_stations=self.number_of_weather_stations,
+            inverse_distance_power=self.inverse_distance_power
+        )
+        return ddf.from_map(
+            self.curtailment_matrix.to_frame,
+            self.curtailment_matrix.resource_chunks(16),
+            meta=self.curtailment_matrix.to_frame(np.array([],dtype=np.int64))
         )
-        # filter for forced outages due to temperature:
-        df = df.dropna(axis='index',how='all',subset=['DRY BULB TEMPERATURE'])
-        df = df.loc[(df.loc[:,'OUTAGE TYPE']=='FORCED')&(df.loc[:,'NATURE OF WORK']=='AMBIENT_DUE_TO_TEMP'),:]
-        df = ddf.from_pandas(df.loc[:,['DATETIME','RESOURCE ID','RESOURCE NAME','UnitType','CURTAILMENT MW','RESOURCE PMAX MW','WeatherStationID','DRY BULB TEMPERATURE']],npartitions=16)
-        return df
 
-    def regress(self,use_processed:bool=True,target_curtailment:float=0,maximum_curtailment:float=1.0,minimum_rsquared:float=0.0,unit_types:list=None,normalize_temperatures:bool=True,impute_zeros:bool=False):
+    def inputs_loaded(self):
         '''
-        Performs merges to associate curtailments with weather data and
-        calculates the best fit linear relationship between temperature and
-        curtailment.
+        Returns True if curtailments, weather data, and the weather station
+        map have been loaded, e.g., by load_all, so they may be merged.
+        '''
+        return (
+            len(self.resource_curtailment_intervals)>0 and
+            isinstance(self.weather_data,ddf.DataFrame) and
+            isinstance(self.weather_station_map,ddf.DataFrame)
+        )
+
+    def read_merged_data(self,path:Path):
+        '''
+        Reads a merged curtailment and weather data file with the compact
+        schema in curtailment_schema.py and persists it in memory.
+        '''
+        df0 = ddf.read_csv(
+            path,
+            dtype={c:d for c,d in compact_dtypes(pd.read_csv(path,nrows=0).columns).items() if c!='DATETIME'},
+            parse_dates=['DATETIME']
+        ).persist(**self.scheduler_options)
+        # find the categories of identifier columns from the persisted data:
+        return df0.categorize(columns=list(df0.select_dtypes('category').columns)).persist(**self.scheduler_options)
+
+    def prepare_merged_data(self,df0,unit_types:list=None):
         '''
-        if use_processed:
-            print('Loading Pre-Processed Merged Curtailment and Weather Data')
-            df0 = ddf.read_csv(self.data_paths['merged_data_filename'])
+        Selects the merged data columns from a pandas or dask dataframe of
+        curtailments paired with temperatures, keeps the given unit types,
+        adds percent curtailments, and removes implausible or missing
+        temperatures.
+        '''
+        df0 = df0.loc[:,['DATETIME','RESOURCE ID','RESOURCE NAME','UnitType','CURTAILMENT MW','RESOURCE PMAX MW','WeatherStationID','DRY BULB TEMPERATURE']]
+        # drop records not matching given unit_type:
+        if isinstance(unit_types,list):
+            df0 = df0.loc[reduce(lambda x,y:x|y,[df0['UnitType']==unit_type for unit_type in unit_types]),:]
+        df0 = df0.assign(PERCENT_CURTAILMENT=lambda r:r['CURTAILMENT MW']/r['RESOURCE PMAX MW'])
+        df0 = df0.rename(columns={'PERCENT_CURTAILMENT':'PERCENT CURTAILMENT'})
+        # remove implausible or missing temperatures:
+        df0 = df0.loc[(df0.loc[:,'DRY BULB TEMPERATURE']<=100),:]
+        df0 = df0.dropna(subset=['DRY BULB TEMPERATURE','PERCENT CURTAILMENT'],how='any')
+        # df0 = df0.loc[(df0.loc[:,'DRY BULB TEMPERATURE']<=100)&(df0.loc[:,'WET BULB TEMPERATURE']<=100),:]
+        # df0 = df0.dropna(subset=['DRY BULB TEMPERATURE','WET BULB TEMPERATURE','PERCENT CURTAILMENT'],how='any')
+        return apply_compact_schema(df0)
+
+    def merged_rows(self,resource_ids:list=None,start=None,end=None,unit_types:list=None,impute_zeros:bool=False):
+        '''
+        Merges curtailments with weather data for the given resources, or for
+        all resources if none are given, during blocks starting at or after
+        start and before end, if given, without merging the rest of the
+        dataset. Rows are the same as those of load_merged_data with the same
+        parameters for those resources and blocks. Curtailment and weather
+        data must have been loaded, e.g., by load_all.
+
+        Returns:
+            a pandas dataframe with one row per resource and block.
+        '''
+        if not self.inputs_loaded():
+            raise ValueError('Curtailment and Weather Data Not Loaded')
+        if impute_zeros:
+            curtailment_matrix = CurtailmentMatrix(
+                self.resource_curtailment_intervals,
+                self.weather_station_map.compute(),
+                self.weather_data.compute(),
+                nminutes=self.nminutes,
+                station_blending=self.weather_station_blending,
+                number_of_stations=self.number_of_weather_stations,
+                inverse_distance_power=self.inverse_distance_power
+            )
+            resource_codes = None
+            if resource_ids is not None:
+                resource_codes = np.flatnonzero(pd.Index(curtailment_matrix.resource_ids).astype(str).isin([str(r) for r in resource_ids]))
+            df0 = curtailment_matrix.to_frame(resource_codes,start,end)
+        else:
+            intervals = self.resource_curtailment_intervals
+            if resource_ids is not None:
+                intervals = intervals.loc[intervals.loc[:,'RESOURCE ID'].astype(str).isin([str(r) for r in resource_ids]),:]
+            # keep intervals with any block in the period:
+            if start is not None:
+                intervals = intervals.loc[intervals.loc[:,'CURTAILMENT END DATE TIME']>pd.Timestamp(start)-pd.Timedelta(minutes=self.nminutes),:]
+            if end is not None:
+                intervals = intervals.loc[intervals.loc[:,'CURTAILMENT START DATE TIME']<pd.Timestamp(end),:]
+            df0 = self.merge_curtailments_and_weather(intervals).compute(**self.scheduler_options)
+        if start is not None:
+            df0 = df0.loc[df0.loc[:,'DATETIME']>=pd.Timestamp(start),:]
+        if end is not None:
+            df0 = df0.loc[df0.loc[:,'DATETIME']<pd.Timestamp(end),:]
+        return self.prepare_merged_data(df0,unit_types)
+
+    def load_merged_data(self,use_processed:bool=True,unit_types:list=None,impute_zeros:bool=False):
+        '''
+        Loads the merged curtailment and weather dataset from the merged data
+        cache, or merges curtailments with weather data and saves the result to
+        file and to the cache. Cached datasets are keyed on the contents of the
+        curtailment, weather station map, and processed weather files and on
+        the merge parameters, so the merge is only repeated when an input has
+        changed; use_processed=False forces the merge regardless. The dataset
+        is persisted in memory once and kept as the merged_data attribute, so
+        later aggregations and later calls with the same parameters do not
+        re-read or re-merge the source data. Newly imputed zero curtailments
+        are not persisted; their partitions are rebuilt from the
+        curtailment_matrix arrays by each aggregation instead. If the curtailment and weather
+        data have not been loaded, e.g., by load_all, the merged data file is
+        read as is, since it can be neither merged nor keyed on the parameters
+        it was merged with.
+
+        Returns:
+            a dask dataframe with one row per resource and block.
+        '''
+        if not self.inputs_loaded():
+            merged_data_path = self.data_paths['merged_data_filename']
+            if not use_processed or not merged_data_path.is_file():
+                raise ValueError('Curtailment and Weather Data Not Loaded and No Merged Data File to Read: {}'.format(merged_data_path))
+            if self.merged_data is not None and self.merged_data_parameters==(use_processed,merged_data_path,unit_types):
+                return self.merged_data
+            print('Loading Pre-Processed Merged Curtailment and Weather Data ...')
+            df0 = self.read_merged_data(merged_data_path)
+            if isinstance(unit_types,list):
+                df0 = df0.loc[df0['UnitType'].isin(unit_types),:].persist(**self.scheduler_options)
+            self.merged_data = df0
+            self.merged_data_parameters = (use_processed,merged_data_path,unit_types)
+            return df0
+        merged_data_key = self.merged_data_cache.key(
+            [
+                self.data_paths['resource_curtailments_filename'],
+                self.data_paths['resources_to_weather_stations_map_filename'],
+                self.data_paths['processed_weather_data_filename'],
+            ],
+            {
+                'unit_types' : unit_types if isinstance(unit_types,list) else None,
+                'impute_zeros' : impute_zeros,
+                'nminutes' : self.nminutes,
+                'maximum_gap_minutes' : self.maximum_gap_minutes,
+                **({} if self.weather_station_blending=='nearest' else {
+                    'weather_station_blending' : self.weather_station_blending,
+                    'number_of_weather_stations' : self.number_of_weather_stations,
+                    'inverse_distance_power' : self.inverse_distance_power,
+                }),
+            }
+        )
+        if self.merged_data is not None and self.merged_data_parameters==(use_processed,merged_data_key):
+            return self.merged_data
+        cached_path = self.merged_data_cache.lookup(merged_data_key) if use_processed else None
+        if cached_path is not None:
+            print('Loading Cached Merged Curtailment and Weather Data {} ...'.format(merged_data_key))
+            df0 = self.read_merged_data(cached_path)
         else:
             if impute_zeros:
                 df0 = self.impute_zero_curtailments()
             else:
                 # Use only hours reported in curtailment data:
-                df0 = self.resource_curtailments.merge(
-                    self.weather_station_map,
-                    left_on='RESOURCE ID',
-                    right_on='ResourceID'
-                ).merge(
-                    self.weather_data,
-                    left_on=['WeatherStationID','DATETIME'],
-                    right_on=['CALL_SIGN','DATE']
-                )
-                df0 = df0.loc['DATETIME','RESOURCE ID','RESOURCE NAME','UnitType','CURTAILMENT MW','RESOURCE PMAX MW','WeatherStationID','DRY BULB TEMPERATURE']
-            # drop records not matching given unit_type:
-            if isinstance(unit_types,list):
-                df0 = df0.loc[reduce(lambda x,y:x|y,[df0['UnitType']==unit_type for unit_type in unit_types]),:]
-            df0 = df0.assign(PERCENT_CURTAILMENT=lambda r:r['CURTAILMENT MW']/r['RESOURCE PMAX MW'])
-            df0 = df0.rename(columns={'PERCENT_CURTAILMENT':'PERCENT CURTAILMENT'})
-            # remove implausible or missing temperatures:
-            df0 = df0.loc[(df0.loc[:,'DRY BULB TEMPERATURE']<=100),:]
-            df0 = df0.dropna(subset=['DRY BULB TEMPERATURE','PERCENT CURTAILMENT'],how='any')
-            # df0 = df0.loc[(df0.loc[:,'DRY BULB TEMPERATURE']<=100)&(df0.loc[:,'WET BULB TEMPERATURE']<=100),:]
-            # df0 = df0.dropna(subset=['DRY BULB TEMPERATURE','WET BULB TEMPERATURE','PERCENT CURTAILMENT'],how='any')
+                df0 = self.merge_curtailments_and_weather()
+            df0 = self.prepare_merged_data(df0,unit_types)
+            if not impute_zeros:
+                df0 = df0.persist(**self.scheduler_options)
             print('Saving Curtailments and Temperatures to File ...')
-            df0.to_csv(self.data_paths['merged_data_filename'],single_file=True,index=False)
+            df0.to_csv(self.data_paths['merged_data_filename'],single_file=True,index=False,compute_kwargs=self.scheduler_options)
+            self.merged_data_cache.store(self.data_paths['merged_data_filename'],merged_data_key)
+        self.merged_data = df0
+        self.merged_data_parameters = (use_processed,merged_data_key)
+        return df0
+
+    def report_memory(self):
+        '''
+        Prints and returns a comparison of the memory used by each column of
+        the merged dataset under the compact schema in curtailment_schema.py
+        and under pandas' default dtypes.
+        '''
+        if self.merged_data is None:
+            raise ValueError('Merged Data Not Loaded')
+        report = memory_report(self.merged_data)
+        print('Merged Data Memory Usage:\n{}'.format(report.to_string(float_format='{:.2f}'.format)))
+        return report
+
+    def build_curtailment_cube(self,use_processed:bool=True,unit_types:list=None,impute_zeros:bool=False,temperature_bin_width:float=0.5,curtailment_bin_width:float=0.05):
+        '''
+        Summarizes the merged curtailment and weather dataset in a
+        CurtailmentCube, which is saved to file and kept as the
+        curtailment_cube attribute. Regressions in sweep and
+        multilinear_regress may then be run against the cube with use_cube=True
+        without scanning the merged dataset.
+        '''
+        df0 = self.load_merged_data(use_processed,unit_types,impute_zeros)
+        print('Building Curtailment Cube ...')
+        self.curtailment_cube = CurtailmentCube(temperature_bin_width,curtailment_bin_width)
+        self.curtailment_cube.add(df0)
+        self.curtailment_cube.save(self.data_paths['curtailment_cube_filename'])
+        return self.curtailment_cube
+
+    def load_curtailment_cube(self):
+        '''
+        Reads a CurtailmentCube previously saved by build_curtailment_cube.
+        '''
+        print('Loading Curtailment Cube ...')
+        self.curtailment_cube = CurtailmentCube.load(self.data_paths['curtailment_cube_filename'])
+        return self.curtailment_cube
+
+    def get_curtailment_cube(self):
+        '''
+        Returns the curtailment_cube attribute, reading the cube saved by
+        build_curtailment_cube or update_curtailment_cube if it has not been
+        loaded.
+        '''
+        if self.curtailment_cube is None:
+            if not self.data_paths['curtailment_cube_filename'].is_file():
+                raise ValueError('Curtailment Cube Not Built: {}'.format(self.data_paths['curtailment_cube_filename']))
+            self.load_curtailment_cube()
+        return self.curtailment_cube
+
+    def update_curtailment_cube(self,df=None,resource_months:pd.DataFrame=None,use_processed:bool=True,unit_types:list=None,impute_zeros:bool=False):
+        '''
+        Adds newly reported hours to the curtailment cube, or replaces given
+        resource-months of the cube, and saves the updated cube to file.
+        Observations may be given as a dataframe with the same columns as
+        returned by load_merged_data; otherwise they are merged from the
+        loaded curtailment and weather data with the given parameters for only
+        the hours or resource-months being updated, or taken from
+        load_merged_data if those data have not been loaded.
+
+        Parameters:
+            df - an optional pandas or dask dataframe of merged data. Only
+                observations after the cube's last datetime are added, so df
+                may overlap the hours already in the cube.
+            resource_months - an optional dataframe with RESOURCE ID, YEAR,
+                and MONTH columns identifying resource-months whose reports
+                have been revised or reported late, or replace imputed zeros.
+                Every cell of each is retracted and summarized again from all
+                of its observations, which are merged from the loaded
+                curtailment and weather data unless given in df. Default
+                value is None, in which case only new hours are added.
+
+        Returns:
+            the number of observations added.
+        '''
+        if self.curtailment_cube is None:
+            if self.data_paths['curtailment_cube_filename'].is_file():
+                self.load_curtailment_cube()
+            else:
+                self.curtailment_cube = CurtailmentCube()
+        if resource_months is not None:
+            if df is None:
+                # merge the given resources over the span of the given months;
+                # replace keeps only the observations in the given months:
+                months = pd.to_datetime(resource_months.loc[:,['YEAR','MONTH']].assign(DAY=1))
+                df = self.merged_rows(
+                    resource_months.loc[:,'RESOURCE ID'].astype(str).unique().tolist(),
+                    months.min(),
+                    months.max()+pd.DateOffset(months=1),
+                    unit_types,
+                    impute_zeros
+                )
+            number_of_observations = self.curtailment_cube.replace(df,resource_months)
+            print('Replaced {} Resource-Months with {} Observations in Curtailment Cube'.format(len(resource_months),number_of_observations))
+        else:
+            if df is None:
+                if self.inputs_loaded():
+                    start = None if pd.isnull(self.curtailment_cube.last_datetime) else self.curtailment_cube.last_datetime+pd.Timedelta(minutes=self.nminutes)
+                    df = self.merged_rows(None,start,None,unit_types,impute_zeros)
+                else:
+                    df = self.load_merged_data(use_processed,unit_types,impute_zeros)
+            number_of_observations = self.curtailment_cube.add(df,new_only=True)
+            print('Added {} Observations to Curtailment Cube through {}'.format(number_of_observations,self.curtailment_cube.last_datetime))
+        self.curtailment_cube.save(self.data_paths['curtailment_cube_filename'])
+        return number_of_observations
+
+    def refresh_regressions(self,target_curtailment:float=0,maximum_curtailment:float=1.0,minimum_rsquared:float=0.0,normalize_temperatures:bool=True):
+        '''
+        Recalculates the per-resource and per-unit type regressions of regress
+        from the sufficient statistics in the curtailment cube, e.g., after
+        update_curtailment_cube, and saves both tables to file without
+        scanning the merged dataset. Maximum curtailments must lie on the
+        cube's curtailment bin edges.
+        '''
+        print('Refreshing Regression Analyses from Curtailment Cube ...')
+        curtailment_cube = self.get_curtailment_cube()
+        observations = curtailment_cube.sums(['UnitType','RESOURCE ID'])
+        correlation_sums = curtailment_cube.sums(['UnitType','RESOURCE ID'],maximum_curtailment=0.3).reindex(observations.index,fill_value=0)
+        fit_sums = curtailment_cube.sums(['UnitType','RESOURCE ID'],maximum_curtailment=maximum_curtailment).reindex(observations.index,fill_value=0)
+        return self.save_regression_tables(observations,correlation_sums,fit_sums,target_curtailment,maximum_curtailment,minimum_rsquared,normalize_temperatures)
+
+    def save_regression_tables(
+            self,
+            observations:pd.DataFrame,
+            correlation_sums:pd.DataFrame,
+            fit_sums:pd.DataFrame,
+            target_curtailment:float=0,
+            maximum_curtailment:float=1.0,
+            minimum_rsquared:float=0.0,
+            normalize_temperatures:bool=True
+        ):
+        '''
+        Builds the per-resource and per-unit type tables of regress from
+        sufficient statistics indexed by UnitType and RESOURCE ID, for all
+        observations, for observations below 30% curtailment, and for
+        observations below the maximum curtailment, and saves both tables to
+        file.
+        '''
+        correlations = solve_linear_regressions(correlation_sums)
+        fits = solve_linear_regressions(fit_sums)
+        df1 = pd.DataFrame({
+            'RESOURCE ID' : observations.index.get_level_values('RESOURCE ID'),
+            'UNIT TYPE' : observations.index.get_level_values('UnitType'),
+            'NUMBER OF OBSERVATIONS' : observations.loc[:,'N'].astype(int).to_numpy(),
+            'CORRELATION DRY BULB TEMPERATURE' : correlations.loc[:,'CORRELATION'].to_numpy(),
+            'COV DRY BULB TEMPERATURE' : correlations.loc[:,'COVARIANCE'].to_numpy(),
+            'DRY BULB SLOPE' : fits.loc[:,'SLOPE'].to_numpy(),
+            'DRY BULB INTERCEPT' : fits.loc[:,'INTERCEPT'].to_numpy(),
+            'DRY BULB RSQUARED' : fits.loc[:,'RSQUARED'].to_numpy(),
+        })
+        # as in regress, resources without curtailments below 30% are omitted:
+        df1 = df1.loc[(correlation_sums.loc[:,'N'].to_numpy()>0),:].sort_values('RESOURCE ID',ignore_index=True)
+        df1.to_csv(self.data_paths['regression_by_resource_filename'],index=False)
+        self.regression_by_resource = df1
+        unit_type_fits = self.unit_type_regressions(fit_sums,target_curtailment,minimum_rsquared,normalize_temperatures)
+        df2 = pd.DataFrame({
+            'UNIT TYPE' : unit_type_fits.index,
+            'DRY BULB SLOPE' : unit_type_fits.loc[:,'SLOPE'].to_numpy(),
+            'DRY BULB INTERCEPT' : unit_type_fits.loc[:,'INTERCEPT'].to_numpy(),
+            'DRY BULB RSQUARED' : unit_type_fits.loc[:,'RSQUARED'].to_numpy(),
+            'MAXIMUM CURTAILMENT' : maximum_curtailment,
+            'MINIMUM RSQUARED' : minimum_rsquared,
+            'TARGET CURTAILMENT' : target_curtailment,
+        })
+        df2.to_csv(self.data_paths['regression_by_unit_type_filename'],index=False)
+        self.regression_by_unit_type = df2
+        return df1,df2
+
+    def read_merged_data_chunks(self,columns:list,memory_limit='1GB',path:Path=None):
+        '''
+        Reads a merged curtailment and weather data file, in csv or parquet
+        format, in chunks whose number of rows is chosen from the memory used
+        by a sample of rows so that each chunk and the intermediate columns
+        derived from it stay within memory_limit.
+
+        Parameters:
+            columns - a list of columns to read.
+            memory_limit - the memory allowance for each chunk in bytes, or a
+                string such as '1GB'. Default value is '1GB'.
+            path - a path object pointing to the file. Default value is None,
+                which reads the merged_data_filename data path.
+
+        Yields:
+            pandas dataframes with the given columns.
+        '''
+        if path is None:
+            path = self.data_paths['merged_data_filename']
+        if path.suffix=='.parquet':
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(path)
+            sample = next(parquet_file.iter_batches(batch_size=1000,columns=columns)).to_pandas()
+        else:
+            sample = pd.read_csv(path,nrows=1000,usecols=columns)
+        # allow for copies of the chunk and a float64 column for each
+        # accumulated sum while aggregating:
+        bytes_per_row = 2*sample.memory_usage(index=True,deep=True).sum()/max(len(sample),1) + 24*8
+        rows_per_chunk = max(int(parse_bytes(memory_limit)//bytes_per_row),1)
+        if path.suffix=='.parquet':
+            for batch in parquet_file.iter_batches(batch_size=rows_per_chunk,columns=columns):
+                yield batch.to_pandas()
+        else:
+            # identifiers are kept as strings, since each chunk would otherwise
+            # have its own categories:
+            float_dtypes = {c:d for c,d in compact_dtypes(columns).items() if d==np.float32}
+            yield from pd.read_csv(path,usecols=columns,dtype=float_dtypes,chunksize=rows_per_chunk)
+
+    def regress_out_of_core(self,target_curtailment:float=0,maximum_curtailment:float=1.0,minimum_rsquared:float=0.0,normalize_temperatures:bool=True,memory_limit='1GB',path:Path=None):
+        '''
+        Performs the same two-stage regression as regress on a merged
+        curtailment and weather data file which may be larger than memory,
+        e.g., with imputed zero curtailments. The file is read in chunks no
+        larger than memory_limit, as in read_merged_data_chunks, and
+        sufficient statistics for each resource are accumulated chunk by
+        chunk. Unit type regressions are derived from the resource statistics,
+        so the file is read only once and the results match regress.
+        '''
+        print('Performing Out-of-Core Regression Analyses ...\n\t\tTarget Curtailment={:.2f}%\n\t\tMaximum Curtailment:{:.2f}%\n\t\tMinimum R-Squared:{:.3f}\n\t\tMemory Limit:{}'.format(target_curtailment,maximum_curtailment,minimum_rsquared,memory_limit))
+        chunks = self.read_merged_data_chunks(['RESOURCE ID','UnitType','DRY BULB TEMPERATURE','PERCENT CURTAILMENT'],memory_limit,path)
+        weight_columns = [None,'CORRELATION_WEIGHT','FIT_WEIGHT']
+        sums = accumulate_grouped_sums(
+            (
+                chunk.assign(
+                    CORRELATION_WEIGHT=(chunk['PERCENT CURTAILMENT']<0.3),
+                    FIT_WEIGHT=(chunk['PERCENT CURTAILMENT']<maximum_curtailment),
+                )
+                for chunk in chunks
+            ),
+            ['UnitType','RESOURCE ID'],
+            'DRY BULB TEMPERATURE',
+            'PERCENT CURTAILMENT',
+            weight_columns=weight_columns
+        )
+        return self.save_regression_tables(
+            sums[None],
+            sums['CORRELATION_WEIGHT'],
+            sums['FIT_WEIGHT'],
+            target_curtailment,
+            maximum_curtailment,
+            minimum_rsquared,
+            normalize_temperatures
+        )
+
+    def regress(self,use_processed:bool=True,target_curtailment:float=0,maximum_curtailment:float=1.0,minimum_rsquared:float=0.0,unit_types:list=None,normalize_temperatures:bool=True,impute_zeros:bool=False,capacity_column:str=None):
+        '''
+        Performs merges to associate curtailments with weather data and
+        calculates the best fit linear relationship between temperature and
+        curtailment. If capacity_column is given, e.g., 'RESOURCE PMAX MW',
+        unit type lines are also fit by weighted least squares with each
+        observation weighted by its resource's capacity, in the same pass as
+        the unweighted lines, and reported as CAPACITY WEIGHTED columns.
+        '''
+        df0 = self.load_merged_data(use_processed,unit_types,impute_zeros)
 
         if len(self.regression_by_resource)>0:
             df1 = self.regression_by_resource
         else:
-            # extract unique resource ids for aggregation:
             print('Performing Regression Analyses ...\n\t\tTarget Curtailment={:.2f}%\n\t\tMaximum Curtailment:{:.2f}%\n\t\tMinimum R-Squared:{:.3f}'.format(target_curtailment,maximum_curtailment,minimum_rsquared))
-            df1 = df0['RESOURCE ID'].unique().compute().to_frame()
-
-            # append unit type to resource list:
-            df1 = df1.merge(
-                df0[['RESOURCE ID','UnitType']].groupby('RESOURCE ID').first().rename(columns={'UnitType':'UNIT TYPE'}).compute(),
-                on='RESOURCE ID'
-            )
-
-            # count hours of curtailment for each resource (hours of curtailment):
-            df1 = df1.merge(
-                df0.groupby('RESOURCE ID')['DATETIME'].count().reset_index().rename(columns={'DATETIME':'NUMBER OF OBSERVATIONS'}).compute(),
-                on='RESOURCE ID'
+            # compute unit types, hours of curtailment, and sufficient
+            # statistics for correlations, covariances, and best-fit lines for
+            # each resource together; correlations and covariances use
+            # curtailments below 30% and best-fit lines use curtailments below
+            # maximum_curtailment:
+            weight_columns = ['CORRELATION_WEIGHT','FIT_WEIGHT']
+            unit_types_by_resource,observation_counts,sums = dask.compute(
+                df0[['RESOURCE ID','UnitType']].groupby('RESOURCE ID',observed=True).first().rename(columns={'UnitType':'UNIT TYPE'}),
+                df0.groupby('RESOURCE ID',observed=True)['DATETIME'].count().rename('NUMBER OF OBSERVATIONS'),
+                grouped_sums(
+                    df0.assign(
+                        CORRELATION_WEIGHT=(df0['PERCENT CURTAILMENT']<0.3),
+                        FIT_WEIGHT=(df0['PERCENT CURTAILMENT']<maximum_curtailment),
+                    ),
+                    ['RESOURCE ID'],
+                    'DRY BULB TEMPERATURE',
+                    'PERCENT CURTAILMENT',
+                    weight_columns=weight_columns,
+                    compute=False
+                ),
+                **self.scheduler_options
             )
+            sums = split_grouped_sums(sums,weight_columns)
+            df1 = unit_types_by_resource.join(observation_counts).reset_index()
             #df1 = df1.loc[(df1['NUMBER OF OBSERVATIONS']>300),:]
 
-            # calculate correlations:
-            df0_pd_g = df0.loc[(df0['PERCENT CURTAILMENT']<0.3),['RESOURCE ID','DRY BULB TEMPERATURE','PERCENT CURTAILMENT']].compute().groupby('RESOURCE ID')
-            # df0_pd_g = df0.loc[(df0['PERCENT CURTAILMENT']<0.3),['RESOURCE ID','DRY BULB TEMPERATURE','WET BULB TEMPERATURE','PERCENT CURTAILMENT']].compute().groupby('RESOURCE ID')
-            df1_pd = df0_pd_g.corr().reset_index()
-            df1_pd = df1_pd.loc[(df1_pd.loc[:,'level_1']=='PERCENT CURTAILMENT'),:].rename(columns={'DRY BULB TEMPERATURE':'CORRELATION DRY BULB TEMPERATURE'})
-            # df1_pd = df1_pd.loc[(df1_pd.loc[:,'level_1']=='PERCENT CURTAILMENT'),:].rename(columns={'DRY BULB TEMPERATURE':'CORRELATION DRY BULB TEMPERATURE','WET BULB TEMPERATURE':'CORRELATION WET BULB TEMPERATURE'})
-            df1_pd = df1_pd.drop(columns=['level_1','PERCENT CURTAILMENT'])
-            df1 = df1.merge(df1_pd,on='RESOURCE ID')
-
-            # calculate covariances:
-            df2_pd = df0_pd_g.cov().reset_index()
-            df2_pd = df2_pd.loc[(df2_pd.loc[:,'level_1']=='PERCENT CURTAILMENT')].rename(columns={'DRY BULB TEMPERATURE':'COV DRY BULB TEMPERATURE'})
-            # df2_pd = df2_pd.loc[(df2_pd.loc[:,'level_1']=='PERCENT CURTAILMENT')].rename(columns={'DRY BULB TEMPERATURE':'COV DRY BULB TEMPERATURE','WET BULB TEMPERATURE':'COV WET BULB TEMPERATURE'})
-            df2_pd = df2_pd.drop(columns=['level_1','PERCENT CURTAILMENT'])
-            df1 = df1.merge(df2_pd,on='RESOURCE ID')
-
-            # find best-fit lines for each resource using both dry- and wet-bulb temperatures:
-            def f(r):
+            correlations = solve_linear_regressions(sums['CORRELATION_WEIGHT'])
+            correlations = correlations.loc[(sums['CORRELATION_WEIGHT'].loc[:,'N']>0),['CORRELATION','COVARIANCE']].rename(columns={
+                'CORRELATION' : 'CORRELATION DRY BULB TEMPERATURE',
+                'COVARIANCE' : 'COV DRY BULB TEMPERATURE',
+            })
+            df1 = df1.merge(correlations.reset_index(),on='RESOURCE ID')
+
+            # find best-fit lines for each resource using dry-bulb temperatures:
+            fits = solve_linear_regressions(sums['FIT_WEIGHT']).loc[:,['SLOPE','INTERCEPT','RSQUARED']].rename(columns={
+                'SLOPE' : 'DRY BULB SLOPE',
+                'INTERCEPT' : 'DRY BULB INTERCEPT',
+                'RSQUARED' : 'DRY BULB RSQUARED',
+            })
+            df1 = df1.merge(fits.reset_index(),how='left',on='RESOURCE ID')
+            for _,r in df1.iterrows():
                 print('\tPerforming Linear Regression on Resource: {}'.format(r.loc['RESOURCE ID']))
-                df0_f = df0.loc[
-                    (df0['RESOURCE ID']==r['RESOURCE ID'])&
-                    (df0['PERCENT CURTAILMENT']<maximum_curtailment),
-                    [
-                        'DRY BULB TEMPERATURE',
-                        # 'WET BULB TEMPERATURE',
-                        'PERCENT CURTAILMENT',
-                    ]
-                ].compute()
-                t_d = df0_f.loc[:,'DRY BULB TEMPERATURE'].values.reshape(len(df0_f),1)
-                # t_w = df0_f.loc[:,'WET BULB TEMPERATURE'].values.reshape(len(df0_f),1)
-                c = df0_f.loc[:,'PERCENT CURTAILMENT'].values.reshape(len(df0_f),1)
-                lr_d = LinearRegression().fit(t_d,c)
-                # lr_w = LinearRegression().fit(t_w,c)
-                sc_d = lr_d.score(t_d,c)
-                # sc_w = lr_w.score(t_w,c)
-                linear_regression_results = {
-                    'DRY BULB SLOPE' : lr_d.coef_[0][0],
-                    'DRY BULB INTERCEPT' : lr_d.intercept_[0],
-                    'DRY BULB RSQUARED' : sc_d,
-                    # 'WET BULB SLOPE' : lr_w.coef_[0][0],
-                    # 'WET BULB INTERCEPT' : lr_w.intercept_[0],
-                    # 'WET BULB RSQUARED' : sc_w,
-                }
-                print('\tC = {DRY BULB SLOPE:.2%}*T + {DRY BULB INTERCEPT:.2%}\tR-Squared: {DRY BULB RSQUARED:.4f}'.format(**linear_regression_results))
-                return linear_regression_results
-            df1 = pd.concat([df1,df1.apply(f,axis='columns',result_type='expand')],axis='columns')
+                print('\tC = {DRY BULB SLOPE:.2%}*T + {DRY BULB INTERCEPT:.2%}\tR-Squared: {DRY BULB RSQUARED:.4f}'.format(**r))
             df1.to_csv(self.data_paths['regression_by_resource_filename'],index=False)
             self.regression_by_resource = df1
 
@@ -360,176 +843,561 @@ class CurtailmentModeller:
             temperature_column = 'NORMALIZED DRY BULB TEMPERATURE'
         else:
             temperature_column = 'DRY BULB TEMPERATURE'
-        df2 = pd.DataFrame(df0['UnitType'].unique().to_frame().rename(columns={'UnitType':'UNIT TYPE'}).compute())
-        def f(r):
-            print('\tPerforming Linear Regression on Unit Type: {}'.format(r.loc['UNIT TYPE']))
-            df0_f = df0.loc[
-                (df0['UnitType']==r['UNIT TYPE'])&
-                (df0[temperature_column]>-1e6)&
-                (df0[temperature_column]<1e6)&
-                (df0['PERCENT CURTAILMENT']<maximum_curtailment),
-                [
-                    temperature_column,
-                    # 'NORMALIZED WET BULB TEMPERATURE',
-                    'PERCENT CURTAILMENT',
-                    'DRY BULB RSQUARED',
-                    # 'WET BULB RSQUARED',
-                ]
-            ].compute()
-            df0_f_d = df0_f.loc[(df0_f.loc[:,'DRY BULB RSQUARED']>minimum_rsquared),[temperature_column,'PERCENT CURTAILMENT']]
-            df0_f_d = df0_f.loc[(df0_f.loc[:,'DRY BULB RSQUARED']>minimum_rsquared),[temperature_column,'PERCENT CURTAILMENT']]
-            # df0_f_w = df0_f.loc[(df0_f.loc[:,'WET BULB RSQUARED']>minimum_rsquared),['NORMALIZED WET BULB TEMPERATURE','PERCENT CURTAILMENT']]
-            t_d = df0_f_d.loc[:,temperature_column].values.reshape(len(df0_f_d),1)
-            # t_w = df0_f_w.loc[:,'NORMALIZED WET BULB TEMPERATURE'].values.reshape(len(df0_f_w),1)
-            c_d = df0_f_d.loc[:,'PERCENT CURTAILMENT'].values.reshape(len(df0_f_d),1)
-            # c_w = df0_f_w.loc[:,'PERCENT CURTAILMENT'].values.reshape(len(df0_f_w),1)
-            if len(t_d)>0:
-                lr_d = LinearRegression().fit(t_d,c_d)
-                lr_d_coef = lr_d.coef_[0][0]
-                lr_d_intercept = lr_d.intercept_[0]
-                sc_d = lr_d.score(t_d,c_d)
-            else:
-                lr_d_coef = np.nan
-                lr_d_intercept = np.nan
-                sc_d = np.nan
-            # if len(t_w)>0:
-            #     lr_w = LinearRegression().fit(t_w,c_w)
-            #     lr_w_coef = lr_w.coef_[0][0]
-            #     lr_w_intercept = lr_w.intercept_[0]
-            #     sc_w = lr_w.score(t_w,c_w)
-            # else:
-            #     lr_w_coef = np.nan
-            #     lr_w_intercept = np.nan
-            #     sc_w = np.nan
-            linear_regression_results = {
-                'DRY BULB SLOPE' : lr_d_coef,
-                'DRY BULB INTERCEPT' : lr_d_intercept,
-                'DRY BULB RSQUARED' : sc_d,
-                # 'WET BULB SLOPE' : lr_w_coef,
-                # 'WET BULB INTERCEPT' : lr_w_intercept,
-                # 'WET BULB RSQUARED' : sc_w,
-            }
-            return linear_regression_results
-        df2 = pd.concat([df2,df2.apply(f,axis='columns',result_type='expand')],axis='columns')
+        # fit all unit types from sufficient statistics accumulated in one
+        # grouped pass, weighting rows by whether they meet the temperature,
+        # curtailment, and goodness-of-fit criteria, and optionally by
+        # capacity:
+        weighted = df0.assign(UNIT_TYPE_WEIGHT=(
+            (df0[temperature_column]>-1e6)&
+            (df0[temperature_column]<1e6)&
+            (df0['PERCENT CURTAILMENT']<maximum_curtailment)&
+            (df0['DRY BULB RSQUARED']>minimum_rsquared)
+        ))
+        weight_columns = ['UNIT_TYPE_WEIGHT']
+        if capacity_column is not None:
+            weighted = weighted.assign(CAPACITY_WEIGHT=weighted['UNIT_TYPE_WEIGHT']*weighted[capacity_column].fillna(0).astype(float))
+            weight_columns.append('CAPACITY_WEIGHT')
+        unit_type_list,sums = dask.compute(
+            df0['UnitType'].unique(),
+            grouped_sums(
+                weighted,
+                ['UnitType'],
+                temperature_column,
+                'PERCENT CURTAILMENT',
+                weight_columns=weight_columns,
+                compute=False
+            ),
+            **self.scheduler_options
+        )
+        sums = split_grouped_sums(sums,weight_columns)
+        df2 = pd.DataFrame({'UNIT TYPE':list(unit_type_list)})
+        for unit_type in df2.loc[:,'UNIT TYPE']:
+            print('\tPerforming Linear Regression on Unit Type: {}'.format(unit_type))
+        for weight_column,prefix in zip(weight_columns,['','CAPACITY WEIGHTED ']):
+            weighted_sums = sums[weight_column]
+            fits = solve_linear_regressions(weighted_sums.loc[(weighted_sums.loc[:,'N']>0),:]).loc[:,['SLOPE','INTERCEPT','RSQUARED']].rename(columns={
+                'SLOPE' : prefix+'DRY BULB SLOPE',
+                'INTERCEPT' : prefix+'DRY BULB INTERCEPT',
+                'RSQUARED' : prefix+'DRY BULB RSQUARED',
+            })
+            df2 = df2.merge(fits,how='left',left_on='UNIT TYPE',right_index=True)
         df2.loc[:,'MAXIMUM CURTAILMENT'] = maximum_curtailment
         df2.loc[:,'MINIMUM RSQUARED'] = minimum_rsquared
         df2.loc[:,'TARGET CURTAILMENT'] = target_curtailment
+        if capacity_column is not None:
+            df2.loc[:,'CAPACITY COLUMN'] = capacity_column
         df2.to_csv(self.data_paths['regression_by_unit_type_filename'],index=False)
         self.curtailments_and_temperatures = df0
         self.regression_by_unit_type = df2
 
-    def multilinear_regress(self,use_processed:bool=True,maximum_curtailment:float=1.0,unit_types:list=None,impute_zeros:bool=False):
+    def sweep(
+            self,
+            target_curtailments:list,
+            maximum_curtailments:list,
+            minimum_rsquared=0.0,
+            use_processed:bool=True,
+            unit_types:list=None,
+            impute_zeros:bool=False,
+            use_cube:bool=False
+        ):
         '''
-        Performs merges to associate curtailments with weather data and
-        calculates the best fit linear relationship between temperature and
-        curtailment with additional binary variables to allow optimal alignment
-        of each individual resource's curtailment data.
+        Performs the two-stage regression in regress, with normalized
+        temperatures, for every combination of target curtailment, maximum
+        curtailment, and minimum R-squared. The merged dataset is scanned once
+        to accumulate sufficient statistics for each resource under each
+        maximum curtailment. Since normalization shifts each resource's
+        temperatures by a constant, (intercept - target) / slope, the unit type
+        statistics for every target curtailment are derived from the resource
+        statistics without revisiting the data.
+
+        Parameters:
+            target_curtailments - a list of curtailment percentages, in
+                decimal form, at which resources' best-fit lines are normalized
+                to intersect.
+            maximum_curtailments - a list of maximum curtailment percentages,
+                in decimal form, to use in regression analyses.
+            minimum_rsquared - a minimum R-squared value, or a list of values,
+                for a resource's best-fit line to be included in unit type
+                regressions. Default value is 0.
+            use_processed, unit_types, impute_zeros - see regress.
+            use_cube - a boolean value to specify whether to use the sufficient
+                statistics in the curtailment cube, as in get_curtailment_cube,
+                rather than the merged dataset. Maximum curtailments must then
+                lie on the cube's curtailment bin edges. Default value is
+                False.
+
+        Returns:
+            a dataframe with one row for each unit type and combination of
+            parameters, with the same columns as regression_by_unit_type.
         '''
-        if use_processed:
-            print('Loading Pre-Processed Merged Curtailment and Weather Data')
-            df0 = ddf.read_csv(self.data_paths['merged_data_filename'])
+        if not isinstance(minimum_rsquared,list):
+            minimum_rsquared = [minimum_rsquared]
+        print('Performing Regression Sweep ...\n\t\t{} Target Curtailments\n\t\t{} Maximum Curtailments\n\t\t{} Minimum R-Squared Values'.format(len(target_curtailments),len(maximum_curtailments),len(minimum_rsquared)))
+        weight_columns = ['FIT_WEIGHT_{}'.format(i) for i in range(len(maximum_curtailments))]
+        if use_cube:
+            curtailment_cube = self.get_curtailment_cube()
+            sums = {
+                weight_column : curtailment_cube.sums(['UnitType','RESOURCE ID'],maximum_curtailment=maximum_curtailment,unit_types=unit_types if isinstance(unit_types,list) else None)
+                for weight_column,maximum_curtailment in zip(weight_columns,maximum_curtailments)
+            }
         else:
-            if impute_zeros:
-                df0 = self.impute_zero_curtailments()
-            else:
-                # Use only hours reported in curtailment data:
-                df0 = self.resource_curtailments.merge(
-                    self.weather_station_map,
-                    left_on='RESOURCE ID',
-                    right_on='ResourceID'
-                ).merge(
-                    self.weather_data,
-                    left_on=['WeatherStationID','DATETIME'],
-                    right_on=['CALL_SIGN','DATE']
-                )
-                df0 = df0.loc[:,['DATETIME','RESOURCE ID','RESOURCE NAME','UnitType','CURTAILMENT MW','RESOURCE PMAX MW','WeatherStationID','DRY BULB TEMPERATURE']]
-            # drop records not matching given unit_type:
-            if isinstance(unit_types,list):
-                df0 = df0.loc[reduce(lambda x,y:x|y,[df0['UnitType']==unit_type for unit_type in unit_types]),:]
-            df0 = df0.assign(PERCENT_CURTAILMENT=lambda r:r['CURTAILMENT MW']/r['RESOURCE PMAX MW'])
-            df0 = df0.rename(columns={'PERCENT_CURTAILMENT':'PERCENT CURTAILMENT'})
-            # remove implausible or missing temperatures:
-            df0 = df0.loc[(df0.loc[:,'DRY BULB TEMPERATURE']<=100),:]
-            df0 = df0.dropna(subset=['DRY BULB TEMPERATURE','PERCENT CURTAILMENT'],how='any')
-            # df0 = df0.loc[(df0.loc[:,'DRY BULB TEMPERATURE']<=100)&(df0.loc[:,'WET BULB TEMPERATURE']<=100),:]
-            # df0 = df0.dropna(subset=['DRY BULB TEMPERATURE','WET BULB TEMPERATURE','PERCENT CURTAILMENT'],how='any')
-            print('Saving Curtailments and Temperatures to File ...')
-            df0.to_csv(self.data_paths['merged_data_filename'],single_file=True,index=False)
+            df0 = self.load_merged_data(use_processed,unit_types,impute_zeros)
+            sums = grouped_sums(
+                df0.assign(**{
+                    weight_column : (df0['PERCENT CURTAILMENT']<maximum_curtailment)
+                    for weight_column,maximum_curtailment in zip(weight_columns,maximum_curtailments)
+                }),
+                ['UnitType','RESOURCE ID'],
+                'DRY BULB TEMPERATURE',
+                'PERCENT CURTAILMENT',
+                weight_columns=weight_columns,
+                compute=False
+            )
+            sums = split_grouped_sums(sums.compute(**self.scheduler_options),weight_columns)
+        results = []
+        for weight_column,maximum_curtailment in zip(weight_columns,maximum_curtailments):
+            resource_sums = sums[weight_column]
+            for rsquared in minimum_rsquared:
+                for target_curtailment in target_curtailments:
+                    unit_type_fits = self.unit_type_regressions(resource_sums,target_curtailment,rsquared)
+                    results.append(pd.DataFrame({
+                        'UNIT TYPE' : unit_type_fits.index,
+                        'DRY BULB SLOPE' : unit_type_fits.loc[:,'SLOPE'].to_numpy(),
+                        'DRY BULB INTERCEPT' : unit_type_fits.loc[:,'INTERCEPT'].to_numpy(),
+                        'DRY BULB RSQUARED' : unit_type_fits.loc[:,'RSQUARED'].to_numpy(),
+                        'MAXIMUM CURTAILMENT' : maximum_curtailment,
+                        'MINIMUM RSQUARED' : rsquared,
+                        'TARGET CURTAILMENT' : target_curtailment,
+                    }))
+        self.sweep_results = pd.concat(results,axis='index',ignore_index=True)
+        return self.sweep_results
 
-        if len(self.regression_by_resource)>0:
-            df1 = self.regression_by_resource
+    def bootstrap(
+            self,
+            number_of_replicates:int=1000,
+            target_curtailment:float=0,
+            maximum_curtailment:float=1.0,
+            minimum_rsquared:float=0.0,
+            normalize_temperatures:bool=True,
+            confidence_level:float=0.95,
+            seed:int=0,
+            number_of_workers:int=None,
+            use_processed:bool=True,
+            unit_types:list=None,
+            impute_zeros:bool=False
+        ):
+        '''
+        Estimates standard errors and confidence intervals for the slopes and
+        intercepts of regress by a block bootstrap which resamples days within
+        each resource, preserving correlation between hours of the same day.
+        Sufficient statistics are accumulated for each resource and day in one
+        pass over the merged dataset, and replicates are drawn as multinomial
+        weights on the daily sums in a process pool, as in
+        bootstrap_regressions. Results are kept as the bootstrap_by_resource
+        and bootstrap_by_unit_type attributes and saved to file.
+
+        Parameters:
+            number_of_replicates - the number of bootstrap replicates. Default
+                value is 1000.
+            confidence_level - the coverage of percentile confidence
+                intervals. Default value is 0.95.
+            seed - an integer seed; results for a given seed are the same for
+                any number of workers. Default value is 0.
+            number_of_workers - the number of worker processes. Default value
+                is None, which uses the number of processors.
+            other parameters - see regress.
+        '''
+        df0 = self.load_merged_data(use_processed,unit_types,impute_zeros)
+        print('Bootstrapping Regression Analyses ...\n\t\t{} Replicates\n\t\tConfidence Level:{:.0%}'.format(number_of_replicates,confidence_level))
+        day_sums = grouped_sums(
+            df0.assign(
+                DAY=df0['DATETIME'].dt.floor('D'),
+                FIT_WEIGHT=(df0['PERCENT CURTAILMENT']<maximum_curtailment),
+            ),
+            ['UnitType','RESOURCE ID','DAY'],
+            'DRY BULB TEMPERATURE',
+            'PERCENT CURTAILMENT',
+            weight_columns=['FIT_WEIGHT'],
+            compute=False
+        )
+        day_sums = split_grouped_sums(day_sums.compute(**self.scheduler_options),['FIT_WEIGHT'])['FIT_WEIGHT']
+        replicates = bootstrap_regressions(
+            day_sums,
+            number_of_replicates=number_of_replicates,
+            target_curtailment=target_curtailment,
+            minimum_rsquared=minimum_rsquared,
+            normalize_temperatures=normalize_temperatures,
+            seed=seed,
+            number_of_workers=number_of_workers
+        )
+        resource_sums = day_sums.groupby(level=['UnitType','RESOURCE ID'],observed=True).sum()
+        resource_fits = solve_linear_regressions(resource_sums).reset_index(level='UnitType')
+        unit_type_fits = self.unit_type_regressions(resource_sums,target_curtailment,minimum_rsquared,normalize_temperatures)
+        def summarize(fits:pd.DataFrame,slope_replicates:pd.DataFrame,intercept_replicates:pd.DataFrame):
+            slope_intervals = confidence_intervals(slope_replicates,confidence_level).reindex(fits.index)
+            intercept_intervals = confidence_intervals(intercept_replicates,confidence_level).reindex(fits.index)
+            return pd.DataFrame({
+                'DRY BULB SLOPE' : fits.loc[:,'SLOPE'],
+                'DRY BULB SLOPE STD ERROR' : slope_intervals.loc[:,'STD ERROR'],
+                'DRY BULB SLOPE LOWER' : slope_intervals.loc[:,'LOWER'],
+                'DRY BULB SLOPE UPPER' : slope_intervals.loc[:,'UPPER'],
+                'DRY BULB INTERCEPT' : fits.loc[:,'INTERCEPT'],
+                'DRY BULB INTERCEPT STD ERROR' : intercept_intervals.loc[:,'STD ERROR'],
+                'DRY BULB INTERCEPT LOWER' : intercept_intervals.loc[:,'LOWER'],
+                'DRY BULB INTERCEPT UPPER' : intercept_intervals.loc[:,'UPPER'],
+                'CONFIDENCE LEVEL' : confidence_level,
+                'NUMBER OF REPLICATES' : number_of_replicates,
+            },index=fits.index)
+        df1 = summarize(resource_fits,replicates['RESOURCE SLOPE'],replicates['RESOURCE INTERCEPT'])
+        df1.insert(0,'UNIT TYPE',resource_fits.loc[:,'UnitType'])
+        df1 = df1.rename_axis('RESOURCE ID').reset_index()
+        df1.to_csv(self.data_paths['bootstrap_by_resource_filename'],index=False)
+        self.bootstrap_by_resource = df1
+        df2 = summarize(unit_type_fits,replicates['UNIT TYPE SLOPE'],replicates['UNIT TYPE INTERCEPT'])
+        df2 = df2.rename_axis('UNIT TYPE').reset_index()
+        df2.loc[:,'MAXIMUM CURTAILMENT'] = maximum_curtailment
+        df2.loc[:,'MINIMUM RSQUARED'] = minimum_rsquared
+        df2.loc[:,'TARGET CURTAILMENT'] = target_curtailment
+        df2.to_csv(self.data_paths['bootstrap_by_unit_type_filename'],index=False)
+        self.bootstrap_by_unit_type = df2
+        return df1,df2
+
+    def hinge_regress(
+            self,
+            maximum_curtailment:float=1.0,
+            minimum_observations:int=24,
+            temperature_bin_width:float=0.5,
+            use_processed:bool=True,
+            unit_types:list=None,
+            impute_zeros:bool=False,
+            use_cube:bool=False
+        ):
+        '''
+        Fits a continuous piecewise-linear model to each resource's
+        curtailments, with separate slopes below and above a breakpoint
+        temperature at which derates begin to increase. Sufficient statistics
+        are accumulated for each resource and temperature bin in one pass
+        over the merged dataset, or taken from the curtailment cube if
+        use_cube is True, and every bin edge is evaluated as a breakpoint for
+        all resources at once, as in solve_hinge_regressions. Results are kept
+        as the hinge_regression_by_resource attribute and saved to file.
+
+        Parameters:
+            maximum_curtailment - the maximum curtailment percentage, in
+                decimal form, to include. Default value is 1.0.
+            minimum_observations - the minimum number of observations on each
+                side of a breakpoint. Default value is 24.
+            temperature_bin_width - the spacing of candidate breakpoints in
+                degrees. Ignored if use_cube is True, in which case the
+                cube's temperature bins are used. Default value is 0.5.
+            use_processed, unit_types, impute_zeros - see regress.
+            use_cube - see sweep.
+        '''
+        print('Performing Hinge Regression Analyses ...\n\t\tMaximum Curtailment:{:.2f}%'.format(maximum_curtailment))
+        if use_cube:
+            curtailment_cube = self.get_curtailment_cube()
+            temperature_bin_width = curtailment_cube.temperature_bin_width
+            sums = curtailment_cube.sums(['UnitType','RESOURCE ID','TEMPERATURE BIN'],maximum_curtailment=maximum_curtailment,unit_types=unit_types if isinstance(unit_types,list) else None)
         else:
-            # extract unique resource ids for aggregation:
-            print('Performing Multilinear Regression Analyses ...\n\t\tMaximum Curtailment:{:.2f}%\n\t\tMinimum R-Squared:{:.3f}'.format(maximum_curtailment,minimum_rsquared))
-            df1 = df0['RESOURCE ID'].unique().compute().to_frame()
-            resource_ids = list(df1.loc[:,'RESOURCE ID'])
-            for resource_id in resource_ids:
-                df1 = df1.assign(new_col=df1.loc[:,'RESOURCE ID'].map(lambda s:1 if s==resource_id else 0))
-                df1 = df1.rename(columns={'new_col':resource_id})
-            df0 = df0.merge(ddf.from_pandas(df1,npartitions=1),how='left',on='RESOURCE ID')
-
-            # append unit type to resource list:
-            df1 = df1.merge(
-                df0.loc[:,['RESOURCE ID','UnitType']].groupby('RESOURCE ID').first().rename(columns={'UnitType':'UNIT TYPE'}).compute(),
-                on='RESOURCE ID'
+            df0 = self.load_merged_data(use_processed,unit_types,impute_zeros)
+            df0 = df0.loc[(df0['PERCENT CURTAILMENT']<maximum_curtailment),:]
+            sums = grouped_sums(
+                df0.assign(**{'TEMPERATURE BIN':(df0['DRY BULB TEMPERATURE']//temperature_bin_width).astype(int)}),
+                ['UnitType','RESOURCE ID','TEMPERATURE BIN'],
+                'DRY BULB TEMPERATURE',
+                'PERCENT CURTAILMENT',
+                compute=False
             )
+            sums = split_grouped_sums(sums.compute(**self.scheduler_options))[None]
+        fits = solve_hinge_regressions(sums,temperature_bin_width,minimum_observations)
+        df1 = fits.rename(columns={
+            'BREAKPOINT' : 'DRY BULB BREAKPOINT',
+            'INTERCEPT' : 'DRY BULB INTERCEPT',
+            'SLOPE BELOW' : 'DRY BULB SLOPE BELOW BREAKPOINT',
+            'SLOPE ABOVE' : 'DRY BULB SLOPE ABOVE BREAKPOINT',
+            'N' : 'NUMBER OF OBSERVATIONS',
+            'N ABOVE' : 'NUMBER OF OBSERVATIONS ABOVE BREAKPOINT',
+        }).reset_index().rename(columns={'UnitType':'UNIT TYPE'})
+        df1 = df1.loc[:,[
+            'RESOURCE ID',
+            'UNIT TYPE',
+            'NUMBER OF OBSERVATIONS',
+            'NUMBER OF OBSERVATIONS ABOVE BREAKPOINT',
+            'DRY BULB BREAKPOINT',
+            'DRY BULB INTERCEPT',
+            'DRY BULB SLOPE BELOW BREAKPOINT',
+            'DRY BULB SLOPE ABOVE BREAKPOINT',
+            'SSE',
+            'LINEAR SSE',
+        ]].sort_values('RESOURCE ID',ignore_index=True)
+        df1.loc[:,'MAXIMUM CURTAILMENT'] = maximum_curtailment
+        for _,r in df1.iterrows():
+            print('\tResource: {RESOURCE ID}\tBreakpoint: {DRY BULB BREAKPOINT:.1f}\tSlopes: {DRY BULB SLOPE BELOW BREAKPOINT:.2%} / {DRY BULB SLOPE ABOVE BREAKPOINT:.2%}'.format(**r))
+        df1.to_csv(self.data_paths['hinge_regression_by_resource_filename'],index=False)
+        self.hinge_regression_by_resource = df1
+        return df1
 
-            # count hours of curtailment for each resource (hours of curtailment):
-            df1 = df1.merge(
-                df0.groupby('RESOURCE ID')['DATETIME'].count().reset_index().rename(columns={'DATETIME':'NUMBER OF OBSERVATIONS'}).compute(),
-                on='RESOURCE ID'
-            )
+    def robust_regress(
+            self,
+            quantile:float=0.9,
+            huber_threshold:float=1.345,
+            maximum_curtailment:float=1.0,
+            maximum_iterations:int=100,
+            use_processed:bool=True,
+            unit_types:list=None,
+            impute_zeros:bool=False
+        ):
+        '''
+        Fits each resource's curtailments with two estimators less sensitive
+        than least squares to full trips among small derates: a Huber
+        M-estimator, which downweights large residuals, and a regression on
+        an upper quantile of percent curtailment. Both are solved for every
+        resource at once by iteratively reweighted least squares over arrays
+        of the merged data, as in solve_huber_regressions and
+        solve_quantile_regressions. Results are kept as the
+        robust_regression_by_resource attribute and saved to file. HUBER
+        CONVERGED and QUANTILE CONVERGED are False for resources whose lines,
+        or whose quantile check loss, were still changing by more than one
+        part in 1e8 after maximum_iterations; their fits may be improved by
+        more iterations.
 
-        df2 = pd.DataFrame({'UNIT TYPE':unit_types})
-        def f(r):
-            print('\tPerforming Linear Regression on Unit Type: {}'.format(r.loc['UNIT TYPE']))
-            resource_columns = list(df0.loc[(df0.loc[:,'UnitType']==r.loc['UNIT TYPE']),'RESOURCE ID'].unique().compute())
-            df0_f = df0.loc[
-                (df0['UnitType']==r['UNIT TYPE'])&
-                (df0['DRY BULB TEMPERATURE']>-1e6)&
-                (df0['DRY BULB TEMPERATURE']<1e6)&
-                (df0['PERCENT CURTAILMENT']<maximum_curtailment),
-                [
-                    'DRY BULB TEMPERATURE',
-                    'PERCENT CURTAILMENT',
-                ] + resource_columns
-            ].compute()
-            t_d = df0_f.loc[:,['DRY BULB TEMPERATURE']+resource_columns].values.reshape(len(df0_f),len(resource_columns)+1)
-            c_d = df0_f.loc[:,'PERCENT CURTAILMENT'].values.reshape(len(df0_f),1)
-            # c_w = df0_f_w.loc[:,'PERCENT CURTAILMENT'].values.reshape(len(df0_f_w),1)
-            if len(t_d)>0:
-                lr_d = LinearRegression().fit(t_d,c_d)
-                lr_d_coef = lr_d.coef_[0][0]
-                lr_d_intercept = lr_d.intercept_[0]
-                sc_d = lr_d.score(t_d,c_d)
-            else:
-                lr_d_coef = np.nan
-                lr_d_intercept = np.nan
-                sc_d = np.nan
-            # if len(t_w)>0:
-            #     lr_w = LinearRegression().fit(t_w,c_w)
-            #     lr_w_coef = lr_w.coef_[0][0]
-            #     lr_w_intercept = lr_w.intercept_[0]
-            #     sc_w = lr_w.score(t_w,c_w)
-            # else:
-            #     lr_w_coef = np.nan
-            #     lr_w_intercept = np.nan
-            #     sc_w = np.nan
-            linear_regression_results = {
-                'DRY BULB SLOPE' : lr_d_coef,
-                'DRY BULB INTERCEPT' : lr_d_intercept,
-                'DRY BULB RSQUARED' : sc_d,
-                # 'WET BULB SLOPE' : lr_w_coef,
-                # 'WET BULB INTERCEPT' : lr_w_intercept,
-                # 'WET BULB RSQUARED' : sc_w,
-            }
-            return linear_regression_results
-        df2 = pd.concat([df2,df2.apply(f,axis='columns',result_type='expand')],axis='columns')
+        Parameters:
+            quantile - the quantile of percent curtailment to fit. Default
+                value is 0.9.
+            huber_threshold - the residual, in multiples of each resource's
+                scale, beyond which observations are downweighted. Default
+                value is 1.345.
+            maximum_curtailment - the maximum curtailment percentage, in
+                decimal form, to include. Default value is 1.0.
+            maximum_iterations - the maximum number of reweighting
+                iterations. Default value is 100.
+            use_processed, unit_types, impute_zeros - see regress.
+        '''
+        print('Performing Robust Regression Analyses ...\n\t\tQuantile:{:.2f}\n\t\tHuber Threshold:{:.3f}\n\t\tMaximum Curtailment:{:.2f}%'.format(quantile,huber_threshold,maximum_curtailment))
+        df0 = self.load_merged_data(use_processed,unit_types,impute_zeros)
+        df0 = df0.loc[
+            (df0['PERCENT CURTAILMENT']<maximum_curtailment)&
+            df0['DRY BULB TEMPERATURE'].notnull(),
+            ['RESOURCE ID','UnitType','DRY BULB TEMPERATURE','PERCENT CURTAILMENT']
+        ].compute(**self.scheduler_options)
+        codes,resources = pd.factorize(df0.loc[:,'RESOURCE ID'],sort=True)
+        x = df0.loc[:,'DRY BULB TEMPERATURE'].to_numpy(dtype=float)
+        y = df0.loc[:,'PERCENT CURTAILMENT'].to_numpy(dtype=float)
+        huber_fits = solve_huber_regressions(x,y,codes,len(resources),huber_threshold,maximum_iterations)
+        quantile_fits = solve_quantile_regressions(x,y,codes,len(resources),quantile,maximum_iterations)
+        df1 = pd.DataFrame({
+            'RESOURCE ID' : np.asarray(resources),
+            'UNIT TYPE' : df0.groupby('RESOURCE ID',observed=True)['UnitType'].first().reindex(resources).to_numpy(),
+            'NUMBER OF OBSERVATIONS' : np.bincount(codes,minlength=len(resources)),
+            'DRY BULB HUBER SLOPE' : huber_fits['SLOPE'],
+            'DRY BULB HUBER INTERCEPT' : huber_fits['INTERCEPT'],
+            'HUBER CONVERGED' : huber_fits['CONVERGED'],
+            'DRY BULB QUANTILE SLOPE' : quantile_fits['SLOPE'],
+            'DRY BULB QUANTILE INTERCEPT' : quantile_fits['INTERCEPT'],
+            'QUANTILE CONVERGED' : quantile_fits['CONVERGED'],
+        })
+        df1.loc[:,'QUANTILE'] = quantile
+        df1.loc[:,'HUBER THRESHOLD'] = huber_threshold
+        df1.loc[:,'MAXIMUM CURTAILMENT'] = maximum_curtailment
+        for _,r in df1.iterrows():
+            print('\tResource: {RESOURCE ID}\tHuber Slope: {DRY BULB HUBER SLOPE:.2%}\tQuantile Slope: {DRY BULB QUANTILE SLOPE:.2%}'.format(**r))
+        df1.to_csv(self.data_paths['robust_regression_by_resource_filename'],index=False)
+        self.robust_regression_by_resource = df1
+        return df1
+
+    def cross_validate(
+            self,
+            target_curtailment:float=0,
+            maximum_curtailment:float=1.0,
+            minimum_rsquared:float=0.0,
+            minimum_training_months:int=12,
+            training_months:int=None,
+            use_processed:bool=True,
+            unit_types:list=None,
+            impute_zeros:bool=False
+        ):
+        '''
+        Compares the out-of-sample errors of the model variants by
+        rolling-origin cross-validation: each fold fits the models to the
+        months before a test month and predicts percent curtailments in the
+        test month. The variants are the unit type regression on dry bulb
+        temperatures (SINGLE STAGE), the two-stage regression on normalized
+        temperatures of regress (TWO STAGE), and the fixed effects regression
+        of multilinear_regress (MULTILINEAR), whose unit type intercept is
+        used for resources not seen in training. Sufficient statistics are
+        accumulated for each resource and month in one pass over the merged
+        dataset; every fold's training statistics are sums over months, and
+        since predictions are linear, squared errors on the test month follow
+        from its statistics as in prediction_errors. Results are kept as the
+        cross_validation_by_fold and cross_validation_by_unit_type attributes
+        and saved to file.
+
+        Parameters:
+            minimum_training_months - the number of months before the first
+                test month. Default value is 12.
+            training_months - if given, the length of a moving training
+                window in months; otherwise each fold trains on every earlier
+                month.
+            other parameters - see regress.
+
+        Returns:
+            a dataframe with one row per model and unit type with errors
+            pooled over every fold.
+        '''
+        df0 = self.load_merged_data(use_processed,unit_types,impute_zeros)
+        df0 = df0.loc[(df0['PERCENT CURTAILMENT']<maximum_curtailment),:]
+        sums = grouped_sums(
+            df0.assign(MONTH=df0['DATETIME'].dt.year*12+df0['DATETIME'].dt.month-1),
+            ['UnitType','RESOURCE ID','MONTH'],
+            'DRY BULB TEMPERATURE',
+            'PERCENT CURTAILMENT',
+            compute=False
+        )
+        sums = split_grouped_sums(sums.compute(**self.scheduler_options))[None]
+        months = sorted(sums.index.unique(level='MONTH'))
+        folds = rolling_origin_folds(months,minimum_training_months,training_months)
+        if len(folds)==0:
+            raise ValueError('Merged Data Spans {} Months, Too Few for {} Training Months'.format(len(months),minimum_training_months))
+        print('Cross-Validating Regression Analyses ...\n\t\t{} Folds\n\t\tTarget Curtailment={:.2f}%\n\t\tMaximum Curtailment:{:.2f}%\n\t\tMinimum R-Squared:{:.3f}'.format(len(folds),target_curtailment,maximum_curtailment,minimum_rsquared))
+        month_codes = sums.index.get_level_values('MONTH')
+        results = []
+        for fold_training_months,test_month in folds:
+            training_sums = sums.loc[month_codes.isin(fold_training_months),:].groupby(level=['UnitType','RESOURCE ID'],observed=True).sum()
+            test_sums = sums.loc[(month_codes==test_month),:].droplevel('MONTH')
+            test_unit_types = test_sums.index.get_level_values('UnitType')
+            test_resources = test_sums.index.get_level_values('RESOURCE ID')
+            predictions = {}
+            fits = self.unit_type_regressions(training_sums,target_curtailment,minimum_rsquared,normalize_temperatures=False)
+            predictions['SINGLE STAGE'] = (
+                fits.loc[:,'INTERCEPT'].reindex(test_unit_types),
+                fits.loc[:,'SLOPE'].reindex(test_unit_types),
+            )
+            fits = self.unit_type_regressions(training_sums,target_curtailment,minimum_rsquared,normalize_temperatures=True)
+            resource_fits = solve_linear_regressions(training_sums).droplevel('UnitType')
+            with np.errstate(invalid='ignore',divide='ignore'):
+                shifts = ((resource_fits.loc[:,'INTERCEPT']-target_curtailment)/resource_fits.loc[:,'SLOPE']).reindex(test_resources).to_numpy()
+            shifts[~(np.abs(shifts)<1e6)] = np.nan
+            slopes = fits.loc[:,'SLOPE'].reindex(test_unit_types).to_numpy()
+            predictions['TWO STAGE'] = (
+                fits.loc[:,'INTERCEPT'].reindex(test_unit_types).to_numpy() + slopes*shifts,
+                slopes,
+            )
+            fits,intercepts = solve_fixed_effects_regressions(training_sums)
+            resource_intercepts = intercepts.loc[:,'INTERCEPT'].droplevel('UnitType').reindex(test_resources).to_numpy()
+            unit_type_intercepts = fits.loc[:,'INTERCEPT'].reindex(test_unit_types).to_numpy()
+            predictions['MULTILINEAR'] = (
+                np.where(np.isnan(resource_intercepts),unit_type_intercepts,resource_intercepts),
+                fits.loc[:,'SLOPE'].reindex(test_unit_types),
+            )
+            for model,(intercept,slope) in predictions.items():
+                scores = score_predictions(test_sums,intercept,slope)
+                results.append(pd.DataFrame({
+                    'MODEL' : model,
+                    'TEST MONTH' : '{:04d}-{:02d}'.format(test_month//12,test_month%12+1),
+                    'NUMBER OF TRAINING MONTHS' : len(fold_training_months),
+                    'UNIT TYPE' : scores.index,
+                    'NUMBER OF OBSERVATIONS' : scores.loc[:,'N'].to_numpy(),
+                    'NUMBER OF UNSCORED OBSERVATIONS' : scores.loc[:,'UNSCORED N'].to_numpy(),
+                    'SSE' : scores.loc[:,'SSE'].to_numpy(),
+                    'SST' : scores.loc[:,'SST'].to_numpy(),
+                    'RMSE' : scores.loc[:,'RMSE'].to_numpy(),
+                    'RSQUARED' : scores.loc[:,'RSQUARED'].to_numpy(),
+                }))
+        df1 = pd.concat(results,axis='index',ignore_index=True)
+        df1.loc[:,'MAXIMUM CURTAILMENT'] = maximum_curtailment
+        df1.loc[:,'MINIMUM RSQUARED'] = minimum_rsquared
+        df1.loc[:,'TARGET CURTAILMENT'] = target_curtailment
+        df1.to_csv(self.data_paths['cross_validation_by_fold_filename'],index=False)
+        self.cross_validation_by_fold = df1
+        df2 = summarize_folds(df1)
+        for _,r in df2.iterrows():
+            print('\t{MODEL}\tUnit Type: {UNIT TYPE}\tRMSE: {RMSE:.2%}\tOut-of-Sample R-Squared: {RSQUARED:.4f}'.format(**r))
         df2.loc[:,'MAXIMUM CURTAILMENT'] = maximum_curtailment
         df2.loc[:,'MINIMUM RSQUARED'] = minimum_rsquared
         df2.loc[:,'TARGET CURTAILMENT'] = target_curtailment
+        df2.to_csv(self.data_paths['cross_validation_by_unit_type_filename'],index=False)
+        self.cross_validation_by_unit_type = df2
+        return df2
+
+    def unit_type_regressions(self,resource_sums:pd.DataFrame,target_curtailment:float=0,minimum_rsquared:float=0.0,normalize_temperatures:bool=True):
+        '''
+        Derives the unit type stage of regress from sufficient statistics for
+        each resource, indexed by UnitType and RESOURCE ID. If
+        normalize_temperatures is True, each resource's temperatures are
+        shifted by (intercept - target) / slope of its own best-fit line.
+
+        Returns:
+            a dataframe indexed by unit type with columns SLOPE, INTERCEPT,
+            RSQUARED, CORRELATION, and COVARIANCE.
+        '''
+        resource_fits = solve_linear_regressions(resource_sums)
+        if normalize_temperatures:
+            with np.errstate(invalid='ignore',divide='ignore'):
+                shifts = ((resource_fits.loc[:,'INTERCEPT']-target_curtailment)/resource_fits.loc[:,'SLOPE']).to_numpy()
+        else:
+            shifts = np.zeros(len(resource_fits))
+        # exclude resources with implausible normalized temperatures or poor
+        # fits, as in regress:
+        included = np.isfinite(shifts) & (np.abs(shifts)<1e6) & (resource_fits.loc[:,'RSQUARED'].to_numpy()>minimum_rsquared)
+        unit_type_sums = shift_grouped_sums(resource_sums.loc[included,:],shifts[included]).groupby(level='UnitType',observed=True).sum()
+        unit_type_fits = solve_linear_regressions(unit_type_sums.loc[(unit_type_sums.loc[:,'N']>0),:])
+        return unit_type_fits.reindex(resource_sums.index.unique(level='UnitType'))
+
+    def multilinear_regress(self,use_processed:bool=True,maximum_curtailment:float=1.0,unit_types:list=None,impute_zeros:bool=False,use_cube:bool=False):
+        '''
+        Performs merges to associate curtailments with weather data and
+        calculates the best fit linear relationship between temperature and
+        curtailment with additional binary variables to allow optimal alignment
+        of each individual resource's curtailment data. The fitted intercepts
+        for each resource are kept in the intercepts_by_resource attribute.
+        If use_cube is True, the sufficient statistics in the curtailment cube,
+        as in get_curtailment_cube, are used rather than the merged dataset.
+        '''
+        print('Performing Multilinear Regression Analyses ...\n\t\tMaximum Curtailment:{:.2f}%'.format(maximum_curtailment))
+        # accumulate sufficient statistics for each resource within each unit
+        # type; the shared slope and per-resource intercepts are solved from
+        # these by demeaning each resource's data rather than by adding a
+        # binary column for each resource:
+        if use_cube:
+            sums = self.get_curtailment_cube().sums(['UnitType','RESOURCE ID'],maximum_curtailment=maximum_curtailment,unit_types=unit_types if isinstance(unit_types,list) else None)
+        else:
+            df0 = self.load_merged_data(use_processed,unit_types,impute_zeros)
+            sums = grouped_sums(
+                df0.loc[
+                    (df0['DRY BULB TEMPERATURE']>-1e6)&
+                    (df0['DRY BULB TEMPERATURE']<1e6)&
+                    (df0['PERCENT CURTAILMENT']<maximum_curtailment),
+                    :
+                ],
+                ['UnitType','RESOURCE ID'],
+                'DRY BULB TEMPERATURE',
+                'PERCENT CURTAILMENT',
+                compute=False
+            )
+            sums = split_grouped_sums(sums.compute(**self.scheduler_options))[None]
+            self.curtailments_and_temperatures = df0
+        fits,intercepts = solve_fixed_effects_regressions(sums)
+        fits = fits.rename(columns={
+            'SLOPE' : 'DRY BULB SLOPE',
+            'INTERCEPT' : 'DRY BULB INTERCEPT',
+            'RSQUARED' : 'DRY BULB RSQUARED',
+        })
+        if isinstance(unit_types,list):
+            df2 = pd.DataFrame({'UNIT TYPE':unit_types})
+        else:
+            df2 = pd.DataFrame({'UNIT TYPE':fits.index})
+        for unit_type in df2.loc[:,'UNIT TYPE']:
+            print('\tPerforming Linear Regression on Unit Type: {}'.format(unit_type))
+        df2 = df2.merge(fits,how='left',left_on='UNIT TYPE',right_index=True)
+        df2.loc[:,'MAXIMUM CURTAILMENT'] = maximum_curtailment
+        df2.loc[:,'MINIMUM RSQUARED'] = np.nan
+        df2.loc[:,'TARGET CURTAILMENT'] = np.nan
         df2.to_csv(self.data_paths['regression_by_unit_type_filename'],index=False)
-        self.curtailments_and_temperatures = df0
+        self.intercepts_by_resource = intercepts.reset_index().rename(columns={
+            'UnitType' : 'UNIT TYPE',
+            'N' : 'NUMBER OF OBSERVATIONS',
+            'INTERCEPT' : 'DRY BULB INTERCEPT',
+        })
         self.regression_by_unit_type = df2
 
 if __name__=='__main__':
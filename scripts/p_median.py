@@ -0,0 +1,115 @@
+import numpy as np
+
+def nearest_two(distances:np.ndarray,selected:np.ndarray):
+    '''
+    Finds the nearest and second nearest selected facilities to each client,
+    e.g., weather stations to resources.
+
+    Parameters:
+        distances - a client by facility array of distances.
+        selected - an array of selected facility indices.
+
+    Returns:
+        a tuple of arrays with one entry per client: the nearest facility, its
+        distance, the second nearest facility, and its distance, with -1 and
+        infinity for the second nearest if only one facility is selected.
+    '''
+    selected_distances = distances[:,selected]
+    if len(selected)==1:
+        nearest = np.full(len(distances),selected[0])
+        return nearest,selected_distances[:,0],np.full(len(distances),-1),np.full(len(distances),np.inf)
+    closest = np.argpartition(selected_distances,1,axis=1)[:,:2]
+    closest_distances = np.take_along_axis(selected_distances,closest,axis=1)
+    order = np.argsort(closest_distances,axis=1,kind='stable')
+    closest = np.take_along_axis(closest,order,axis=1)
+    closest_distances = np.take_along_axis(closest_distances,order,axis=1)
+    return selected[closest[:,0]],closest_distances[:,0],selected[closest[:,1]],closest_distances[:,1]
+
+def greedy_p_median(distances:np.ndarray,number_of_facilities:int,selected:list=[]):
+    '''
+    Adds facilities one at a time to an initial selection, each time choosing
+    the facility which most reduces the total distance from clients to their
+    nearest selected facility, with the reduction evaluated for every
+    candidate at once.
+
+    Returns:
+        an array of selected facility indices.
+    '''
+    selected = list(selected)
+    nearest_distances = distances[:,selected].min(axis=1) if len(selected)>0 else np.full(len(distances),np.inf)
+    while len(selected)<number_of_facilities:
+        costs = np.minimum(nearest_distances[:,np.newaxis],distances).sum(axis=0)
+        costs[selected] = np.inf
+        facility = int(np.argmin(costs))
+        selected.append(facility)
+        nearest_distances = np.minimum(nearest_distances,distances[:,facility])
+    return np.array(selected,dtype=np.int64)
+
+def interchange_p_median(distances:np.ndarray,selected:np.ndarray,maximum_iterations:int=1000,tolerance:float=1e-9):
+    '''
+    Improves a selection of facilities by Teitz-Bart vertex substitution,
+    swapping a selected facility for an unselected one while any swap reduces
+    the total distance from clients to their nearest selected facility. The
+    change in total distance for every possible swap is evaluated at once
+    from each client's nearest and second nearest selected facilities: a
+    client moves to an added facility if it is closer, and a client whose
+    nearest facility is removed moves to the closer of its second nearest
+    and the added facility. The best swap is made on each iteration, and the
+    nearest and second nearest arrays are updated only for clients affected.
+
+    Returns:
+        an array of selected facility indices.
+    '''
+    selected = np.array(selected,dtype=np.int64)
+    number_of_facilities = distances.shape[1]
+    nearest,nearest_distances,second,second_distances = nearest_two(distances,selected)
+    for _ in range(maximum_iterations):
+        # change in each client's distance from adding each facility:
+        closer = np.minimum(nearest_distances[:,np.newaxis],distances)
+        added = (closer - nearest_distances[:,np.newaxis]).sum(axis=0)
+        # correction for clients whose nearest facility is removed:
+        positions = np.full(number_of_facilities,-1)
+        positions[selected] = np.arange(len(selected))
+        membership = np.zeros((len(selected),len(distances)))
+        membership[positions[nearest],np.arange(len(distances))] = 1
+        removed = membership @ (np.minimum(second_distances[:,np.newaxis],distances) - closer)
+        changes = added[np.newaxis,:] + removed
+        changes[:,selected] = np.inf
+        position,facility = np.unravel_index(np.argmin(changes),changes.shape)
+        if changes[position,facility] >= -tolerance:
+            break
+        removed_facility = selected[position]
+        selected[position] = facility
+        # clients whose nearest or second nearest was removed are reassigned
+        # from scratch; others only compare with the added facility:
+        affected = (nearest==removed_facility) | (second==removed_facility)
+        added_distances = distances[:,facility]
+        nearer = ~affected & (added_distances<nearest_distances)
+        between = ~affected & ~nearer & (added_distances<second_distances)
+        second[nearer],second_distances[nearer] = nearest[nearer],nearest_distances[nearer]
+        nearest[nearer],nearest_distances[nearer] = facility,added_distances[nearer]
+        second[between],second_distances[between] = facility,added_distances[between]
+        if np.any(affected):
+            nearest[affected],nearest_distances[affected],second[affected],second_distances[affected] = nearest_two(distances[affected,:],selected)
+    return selected
+
+def solve_p_medians(distances:np.ndarray,numbers_of_facilities:list,maximum_iterations:int=1000):
+    '''
+    Solves the p-median problem for each number of facilities in a list,
+    e.g., from 5 to 50 weather stations, in one run. Solutions are found in
+    increasing order of the number of facilities, each starting from the
+    previous solution plus facilities added greedily and then improved by
+    interchange_p_median.
+
+    Returns:
+        a dictionary mapping each number of facilities to a tuple of the
+        selected facility indices and the total distance from clients to
+        their nearest selected facility.
+    '''
+    solutions = {}
+    selected = []
+    for number_of_facilities in sorted(numbers_of_facilities):
+        selected = greedy_p_median(distances,number_of_facilities,selected)
+        selected = interchange_p_median(distances,selected,maximum_iterations)
+        solutions[number_of_facilities] = (selected.copy(),distances[:,selected].min(axis=1).sum())
+    return solutions
@@ -1,10 +1,28 @@
-import psycopg2
 import pandas as pd
+import numpy as np
 from pathlib import Path
 
-from login import pguser
+from ezdb import query
+from resource_metadata_cache import ResourceMetadataCache,RESOURCE_LOCATION_OVERRIDES_PATH
+from station_distances import nearest_locations
 
-def retrieve_resource_locations(resource_ids:list):
+WEATHER_STATION_PLACENAMES_PATH = Path(r'M:\Users\RH2\src\caiso_curtailments\geospatial\weather_station_placenames.csv')
+DEFAULT_WEATHER_STATIONS = [
+    'KNKX',
+    'KOAK',
+    'KRDD',
+    'KRNO',
+    'KSAC',
+    'KSAN',
+    'KSBA',
+    'KSCK',
+    'KSFO',
+    'KSJC',
+    'KSMF',
+    'KUKI',
+]
+
+def retrieve_resource_locations(resource_ids:list,backend=None):
     '''
     Retrieves geospatial data for each resource identified in resource_ids from
     the ezdb_ed_main.public.ceccaisoeiaplantid table on EZDB
@@ -12,17 +30,17 @@ def retrieve_resource_locations(resource_ids:list):
     Parameters:
         resource_ids - a list of strings containing CAISO IDs for generation
             resources
+        backend - the ezdb backend to query. Default is EZDB.
 
     Returns:
         a dataframe containing three columns: resource_id, lat, and lon
     '''
-    resource_ids.sort()
-    sql_str_template = '''
-        WITH curtailed_resources ("ResourceID") AS ( VALUES
-            {}
+    sql_str = '''
+        WITH curtailed_resources ("ResourceID") AS (
+            SELECT unnest(%(resource_ids)s::text[])
         )
 
-        SELECT DISTINCT ON ("ResourceID")
+        SELECT
             "ResourceID"
             ,"UnitType"
             ,"ResLat"
@@ -57,6 +75,7 @@ def retrieve_resource_locations(resource_ids:list):
                 ,f."Longitude" AS "Lon3"
                 ,g."Longitude" AS "Lon4"
                 ,h."Longitude" AS "Lon5"
+                ,ROW_NUMBER() OVER (PARTITION BY b."ResourceID") AS "RowNumber"
             FROM curtailed_resources AS b
             LEFT JOIN (
                 SELECT *
@@ -69,7 +88,7 @@ def retrieve_resource_locations(resource_ids:list):
                 FROM ezdb_ed_main.public.ceccaisoeiaplantid_current
                 WHERE "Latitude"<>0 AND "Latitude" IS NOT NULL AND "Latitude"<>'nan' AND "Longitude"<>0 AND "Longitude" IS NOT NULL AND "Longitude"<>'nan'
             ) AS d
-            ON LEFT(b."ResourceID",POSITION('_' IN b."ResourceID"))=LEFT(d."ResID",POSITION('_' IN d."ResID"))
+            ON SUBSTR(b."ResourceID",1,STRPOS(b."ResourceID",'_'))=SUBSTR(d."ResID",1,STRPOS(d."ResID",'_'))
             LEFT JOIN ezdb_ed_main.public.caisomastercapability_current AS e
             ON b."ResourceID"=e."ResID"
             LEFT JOIN (
@@ -91,24 +110,20 @@ def retrieve_resource_locations(resource_ids:list):
             ) AS h
             ON h."ResID"=e."ResID"
         ) AS a
+        WHERE "RowNumber"=1
         ORDER BY "ResourceID"
     '''
-    sql_str = sql_str_template.format('\n            ,'.join([f'(\'{s}\')' for s in resource_ids]))
-    conn = psycopg2.connect(
-        database=pguser['db_main'],
-        user=pguser['uid'],
-        password=pguser['passwd'],
-        host=pguser['host']
+    print('Retrieving generator resource locations from EZDB ...')
+    results = query(
+        sql_str,
+        {'resource_ids' : sorted(resource_ids)},
+        columns=['ResourceID','UnitType','ResLat','ResLon','Lat1','Lat2','Lat3','Lat4','Lat5','Lon1','Lon2','Lon3','Lon4','Lon5'],
+        backend=backend
     )
-    with conn:
-        with conn.cursor() as curs:
-            print('Retrieving generator resource locations from EZDB ...')
-            curs.execute(sql_str)
-            results = curs.fetchall()
-            print('Retrieved {} resource locations.'.format(len(results)))
-    return pd.DataFrame(results,columns=['ResourceID','UnitType','ResLat','ResLon','Lat1','Lat2','Lat3','Lat4','Lat5','Lon1','Lon2','Lon3','Lon4','Lon5'])
+    print('Retrieved {} resource locations.'.format(len(results)))
+    return results
 
-def retrieve_resource_locations_alternative(resource_ids:list):
+def retrieve_resource_locations_alternative(resource_ids:list,backend=None):
     '''
     Retrieves geospatial data for each resource identified in resource_ids from
     the ezdb_ed_main.public.ceccaisoeiaplantid table on EZDB
@@ -116,166 +131,135 @@ def retrieve_resource_locations_alternative(resource_ids:list):
     Parameters:
         resource_ids - a list of strings containing CAISO IDs for generation
             resources
+        backend - the ezdb backend to query. Default is EZDB.
 
     Returns:
         a dataframe containing three columns: resource_id, lat, and lon
     '''
-    resource_ids.sort()
-    sql_str_template = '''
-        WITH resources ("ResourceID") AS ( VALUES
-            {}
+    sql_str = '''
+        WITH resources ("ResourceID") AS (
+            SELECT unnest(%(resource_ids)s::text[])
         )
 
-        SELECT DISTINCT ON (resources."ResourceID")
-            resources."ResourceID"
-            ,"Latitude" AS "ResLat"
-            ,CASE
-                WHEN "Longitude"<150 AND "Longitude">100 THEN 360-"Longitude"
-                WHEN "Longitude">-150 AND "Longitude"<-100 THEN 360+"Longitude"
-                ELSE "Longitude"
-            END AS "ResLon"
-        FROM
-            resources
-        LEFT JOIN
-            ezdb_ed_main.public.ceccaisoeiaplantid_current
-        ON resources."ResourceID"=ceccaisoeiaplantid_current."ResID"
-        WHERE "Latitude"<>'nan' AND "Latitude"<>0 AND "Longitude"<>'nan' AND "Longitude"<>0
+        SELECT
+            "ResourceID"
+            ,"ResLat"
+            ,"ResLon"
+        FROM (
+            SELECT
+                resources."ResourceID"
+                ,"Latitude" AS "ResLat"
+                ,CASE
+                    WHEN "Longitude"<150 AND "Longitude">100 THEN 360-"Longitude"
+                    WHEN "Longitude">-150 AND "Longitude"<-100 THEN 360+"Longitude"
+                    ELSE "Longitude"
+                END AS "ResLon"
+                ,ROW_NUMBER() OVER (PARTITION BY resources."ResourceID") AS "RowNumber"
+            FROM
+                resources
+            LEFT JOIN
+                ezdb_ed_main.public.ceccaisoeiaplantid_current
+            ON resources."ResourceID"=ceccaisoeiaplantid_current."ResID"
+            WHERE "Latitude"<>'nan' AND "Latitude"<>0 AND "Longitude"<>'nan' AND "Longitude"<>0
+        ) AS a
+        WHERE "RowNumber"=1
         ORDER BY "ResourceID"
     '''
-    sql_str = sql_str_template.format('\n            ,'.join([f'(\'{s}\')' for s in resource_ids]))
-    conn = psycopg2.connect(
-        database=pguser['db_main'],
-        user=pguser['uid'],
-        password=pguser['passwd'],
-        host=pguser['host'])
-    with conn:
-        with conn.cursor() as curs:
-            print('Retrieving generator resource locations from EZDB ...')
-            curs.execute(sql_str)
-            results = curs.fetchall()
-            print('Retrieved {} resource locations.'.format(len(results)))
-    resources = pd.DataFrame(results,columns=['ResourceID','ResLat','ResLon'])
+    print('Retrieving generator resource locations from EZDB ...')
+    resources = query(sql_str,{'resource_ids' : sorted(resource_ids)},columns=['ResourceID','ResLat','ResLon'],backend=backend)
+    print('Retrieved {} resource locations.'.format(len(resources)))
     resources.loc[:,'UnitType'] = ''
     return resources
 
-def identify_weather_stations(resources:pd.DataFrame):
+def read_weather_station_locations(weather_station_placenames_path:Path=WEATHER_STATION_PLACENAMES_PATH,station_ids:list=None):
+    '''
+    reads weather station locations from the weather station placenames file.
+
+    parameters:
+        weather_station_placenames_path - a path object pointing to a csv file
+            with a StationID column and latitude and longitude columns, named
+            Lat and Lon, WeaLat and WeaLon, or LATITUDE and LONGITUDE.
+        station_ids - if given, a list of the station ids to include.
+
+    returns:
+        a dataframe with StationName, WeaLat, and WeaLon columns
+    '''
+    placenames = pd.read_csv(weather_station_placenames_path)
+    for latitude_column,longitude_column in [('Lat','Lon'),('WeaLat','WeaLon'),('LATITUDE','LONGITUDE')]:
+        if latitude_column in placenames.columns and longitude_column in placenames.columns:
+            break
+    else:
+        raise ValueError('No Latitude and Longitude Columns Found in {}'.format(weather_station_placenames_path))
+    weather_stations = placenames.loc[:,['StationID',latitude_column,longitude_column]].rename(columns={
+        'StationID' : 'StationName',
+        latitude_column : 'WeaLat',
+        longitude_column : 'WeaLon',
+    })
+    if station_ids is not None:
+        weather_stations = weather_stations.loc[weather_stations.loc[:,'StationName'].isin(station_ids),:]
+    return weather_stations.dropna(subset=['WeaLat','WeaLon']).reset_index(drop=True)
+
+def identify_weather_stations(resources:pd.DataFrame,weather_stations:pd.DataFrame=None,number_of_stations:int=1,use_ball_tree:bool=False):
     '''
-    identifies the closest weather station to each resource based on geospatial
-    information in the second database
+    identifies the closest weather stations to each resource by great-circle
+    distance, computed locally for all resources at once as in
+    nearest_locations, without a database connection.
 
     parameters:
         resources - a dataframe containing a column with the ResourceID, Lat,
             Lon, and UnitType values for each resource with which weather
             stations are to be matched.
+        weather_stations - a dataframe with StationName, WeaLat, and WeaLon
+            columns, as returned by read_weather_station_locations. Default is
+            the stations in DEFAULT_WEATHER_STATIONS from the weather station
+            placenames file.
+        number_of_stations - the number of closest weather stations to return
+            for each resource. Default is 1.
+        use_ball_tree - whether to search a haversine BallTree rather than
+            computing every distance. Default is False.
 
     returns:
         a dataframe containing ids and lat/lon coordinates for each resource and
-        its closest weather station, along with the absolute distance between
-        (in kilometers)
-    '''
-    sql_str_template = '''
-        WITH constants ("radius_km","pi") AS ( VALUES (6563,3.14159265359) ),
-        gen_locations ("ResourceID","UnitType","ResLat","ResLon") AS ( VALUES
-            {}
-        ),
-        weather_stations ("StationName") AS ( VALUES
-            ('KNKX'),
-            ('KOAK'),
-            ('KRDD'),
-            ('KRNO'),
-            ('KSAC'),
-            ('KSAN'),
-            ('KSBA'),
-            ('KSCK'),
-            ('KSFO'),
-            ('KSJC'),
-            ('KSMF'),
-            ('KUKI')
-        )
-
-        SELECT
-            "ResourceID"
-            ,"UnitType"
-            ,"StationName"
-            ,"Dist"
-            ,RANK() OVER (ORDER BY RIGHT('0000000'||CAST(ROUND(100*"Dist") AS TEXT),7)||"ResourceID") AS "DistRank"
-            ,"ResLat"
-            ,"ResLon"
-            ,"WeaLat"
-            ,"WeaLon"
-        FROM (
-            SELECT
-                "ResourceID"
-                ,"UnitType"
-                ,"StationName"
-                ,"Dist"
-                ,"ResLat"
-                ,"ResLon"
-                ,"WeaLat"
-                ,"WeaLon"
-                ,RANK() OVER (PARTITION BY "ResourceID" ORDER BY "Dist" ASC) AS "R"
-            FROM (
-                SELECT
-                    "ResourceID"
-                    ,"UnitType"
-                    ,"StationName"
-                    ,SQRT(("ResX"-"WeaX")^2 + ("ResY"-"WeaY")^2 + ("ResZ"-"WeaZ")^2) AS "Dist"
-                    ,"ResLat"
-                    ,"ResLon"
-                    ,"WeaLat"
-                    ,"WeaLon"
-                FROM (
-                    SELECT
-                        "ResourceID"
-                        ,"UnitType"
-                        ,"ResLat"
-                        ,"ResLon"
-                        ,"StationName"
-                        ,"Lat" AS "WeaLat"
-                        ,"Lon" AS "WeaLon"
-                        ,"radius_km"*COS("pi"*"ResLon"/180.0)*COS("pi"*"ResLat"/180.0) AS "ResX"
-                        ,"radius_km"*SIN("pi"*"ResLon"/180.0)*COS("pi"*"ResLat"/180.0) AS "ResY"
-                        ,"radius_km"*SIN("pi"*"ResLat"/180.0) AS "ResZ"
-                        ,"radius_km"*COS("pi"*"Lon"/180.0)*COS("pi"*"Lat"/180.0) AS "WeaX"
-                        ,"radius_km"*SIN("pi"*"Lon"/180.0)*COS("pi"*"Lat"/180.0) AS "WeaY"
-                        ,"radius_km"*SIN("pi"*"Lat"/180.0) AS "WeaZ"
-                    FROM
-                        gen_locations, constants
-                    FULL OUTER JOIN
-                        (
-                            SELECT
-                                weather_stations."StationName",
-                                "Lat",
-                                "Lon"
-                            FROM weather_stations
-                            LEFT JOIN latlonmap
-                            ON weather_stations."StationName"=latlonmap."StationName"
-                        ) AS latlonmap
-                    ON
-                        TRUE
-                ) AS c
-            ) AS b
-        ) AS a
-        WHERE "R"=1
-        ORDER BY "ResourceID"
+        its closest weather stations, along with the absolute distance between
+        (in kilometers) and the rank of each station among the resource's
+        closest stations
     '''
-    resource_list = ['(\'{}\',\'{}\',{},{})'.format(row.loc['ResourceID'],row.loc['UnitType'],row.loc['ResLat'],row.loc['ResLon']) for _,row in resources.iterrows()]
-    sql_str = sql_str_template.format('\n            ,'.join(resource_list))
-    conn = psycopg2.connect(
-        database=pguser['db_alt'],
-        user=pguser['uid'],
-        password=pguser['passwd'],
-        host=pguser['host'])
-    with conn:
-        with conn.cursor() as curs:
-            print('Pairing resources with nearest weather station locations in EZDB ...')
-            curs.execute(sql_str)
-            results = curs.fetchall()
-            print('Retrieved {} resource-weather station pairs.'.format(len(results)))
-    return pd.DataFrame(results,columns=['ResourceID','UnitType','WeatherStationID','Dist','DistRank','ResLat','ResLon','WeaLat','WeaLon'])
+    if weather_stations is None:
+        weather_stations = read_weather_station_locations(WEATHER_STATION_PLACENAMES_PATH,DEFAULT_WEATHER_STATIONS)
+    print('Pairing resources with nearest weather station locations ...')
+    indices,distances = nearest_locations(
+        resources.loc[:,'ResLat'].to_numpy(dtype=float),
+        resources.loc[:,'ResLon'].to_numpy(dtype=float),
+        weather_stations.loc[:,'WeaLat'].to_numpy(dtype=float),
+        weather_stations.loc[:,'WeaLon'].to_numpy(dtype=float),
+        number_of_stations,
+        use_ball_tree
+    )
+    resource_rows = np.repeat(np.arange(len(resources)),indices.shape[1])
+    station_rows = indices.ravel()
+    pairs = pd.DataFrame({
+        'ResourceID' : resources.loc[:,'ResourceID'].to_numpy()[resource_rows],
+        'UnitType' : resources.loc[:,'UnitType'].to_numpy()[resource_rows],
+        'WeatherStationID' : weather_stations.loc[:,'StationName'].to_numpy()[station_rows],
+        'Dist' : distances.ravel(),
+        'ResLat' : resources.loc[:,'ResLat'].to_numpy()[resource_rows],
+        'ResLon' : resources.loc[:,'ResLon'].to_numpy()[resource_rows],
+        'WeaLat' : weather_stations.loc[:,'WeaLat'].to_numpy()[station_rows],
+        'WeaLon' : weather_stations.loc[:,'WeaLon'].to_numpy()[station_rows],
+        'StationRank' : np.tile(np.arange(1,indices.shape[1]+1),len(resources)),
+    })
+    # rank all pairs by distance, to the nearest 10 m, then by resource:
+    order = np.lexsort((pairs.loc[:,'ResourceID'].to_numpy(dtype=str),np.round(100*pairs.loc[:,'Dist'].to_numpy())))
+    dist_ranks = np.empty(len(pairs),dtype=np.int64)
+    dist_ranks[order] = np.arange(1,len(pairs)+1)
+    pairs.loc[:,'DistRank'] = dist_ranks
+    print('Identified {} resource-weather station pairs.'.format(len(pairs)))
+    return pairs.loc[:,['ResourceID','UnitType','WeatherStationID','Dist','DistRank','ResLat','ResLon','WeaLat','WeaLon','StationRank']].sort_values(['ResourceID','StationRank'],ignore_index=True)
 
 if __name__=='__main__':
     resource_ids = pd.read_csv(Path('M:\\Users\\RH2\\src\\caiso_curtailments\\geospatial\\curtailed_resources.csv'))
-    resources = retrieve_resource_locations(list(resource_ids.loc[:,'RESOURCE ID']))
-    resource_weather_station_pairs = identify_weather_stations(resources)
+    resource_metadata_cache = ResourceMetadataCache(override_path=RESOURCE_LOCATION_OVERRIDES_PATH)
+    resources = resource_metadata_cache.lookup('resource_locations',list(resource_ids.loc[:,'RESOURCE ID']),retrieve_resource_locations)
+    # keep the three closest stations so gaps can be filled from neighbours:
+    resource_weather_station_pairs = identify_weather_stations(resources,number_of_stations=3)
     resource_weather_station_pairs.to_csv(Path('M:\\Users\\RH2\\src\\caiso_curtailments\\geospatial\\resource_weather_stations.csv'),index=False)
\ No newline at end of file
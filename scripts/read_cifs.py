@@ -1,20 +1,88 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
+from pandas import Timestamp as ts
 from pathlib import Path
 
-def read_cif(path:Path):
-    md = pq.read_metadata(path)
-    cif = pq.read_table(path).to_pandas()
-    f = lambda s: s.split('_')[-1]
-    if 'CallSign' in cif.columns:
-        station_column = 'CallSign'
-    elif 'StationLongName' in cif.columns:
-        station_column = 'StationLongName'
+def station_column_name(schema:pa.Schema):
+    '''
+    returns the name of the column identifying weather stations in a
+    climate-informed weather schema.
+    '''
+    if 'CallSign' in schema.names:
+        return 'CallSign'
+    elif 'StationLongName' in schema.names:
+        return 'StationLongName'
+    else:
+        return schema.names[0]
+
+def station_ids(station_names:pa.ChunkedArray):
+    '''
+    returns dictionary-encoded station ids, the part of each station name
+    after its last underscore, computing each distinct id only once.
+    '''
+    if pa.types.is_dictionary(station_names.type):
+        station_names = station_names.unify_dictionaries().combine_chunks()
     else:
-        station_column = cif.columns[0]
-    cif.loc[:,'StationID'] = cif.loc[:,station_column].map(f)
-    return md,cif
+        station_names = pc.dictionary_encode(station_names.combine_chunks())
+    ids = pc.dictionary_encode(pc.replace_substring_regex(station_names.dictionary,pattern='^.*_',replacement=''))
+    return pa.DictionaryArray.from_arrays(pc.take(ids.indices,station_names.indices),ids.dictionary)
+
+def matching_station_names(path:Path,station_column:str,stations:list):
+    '''
+    returns the distinct station names in a climate-informed weather file
+    whose station ids are in a list, reading the station column's dictionary
+    rather than its values.
+    '''
+    station_names = pq.read_table(path,columns=[station_column],read_dictionary=[station_column],memory_map=True).column(station_column)
+    if station_names.num_chunks==0:
+        return pa.array([],type=pa.string())
+    station_names = station_names.unify_dictionaries().chunk(0).dictionary
+    ids = pc.replace_substring_regex(station_names,pattern='^.*_',replacement='')
+    return station_names.filter(pc.is_in(ids,value_set=pa.array([str(s) for s in stations],type=pa.string())))
+
+def read_cif(path:Path,columns:list=None,stations:list=None,years:list=None):
+    '''
+    Reads climate-informed weather data from a parquet file, reading only the
+    requested columns and only row groups which may hold the requested
+    stations and years, and adds a StationID column.
+
+    Parameters:
+        path - a path object pointing to a parquet file of climate-informed
+            weather data
+        columns - a list of columns to read. Default is all columns.
+        stations - a list of station ids, e.g., KSAC, to read. Default is all
+            stations.
+        years - a list of years to read, in the time zone of the DateTime
+            column. Default is all years.
+
+    Returns:
+        a tuple of the file's parquet metadata and a dataframe of the
+        requested columns and a categorical StationID column
+    '''
+    md = pq.read_metadata(path)
+    schema = md.schema.to_arrow_schema()
+    station_column = station_column_name(schema)
+    filters = None
+    if stations is not None:
+        filters = ds.field(station_column).isin(matching_station_names(path,station_column,stations))
+    if years is not None:
+        datetime_type = schema.field('DateTime').type
+        tz = getattr(datetime_type,'tz',None)
+        year_filters = None
+        for year in sorted(set(years)):
+            year_filter = (ds.field('DateTime')>=pa.scalar(ts(year,1,1,tz=tz),type=datetime_type)) & (ds.field('DateTime')<pa.scalar(ts(year+1,1,1,tz=tz),type=datetime_type))
+            year_filters = year_filter if year_filters is None else year_filters|year_filter
+        filters = year_filters if filters is None else filters&year_filters
+    read_columns = None if columns is None else list(dict.fromkeys([c for c in columns if c!='StationID']+[station_column]))
+    cif = pq.read_table(path,columns=read_columns,filters=filters,memory_map=True)
+    cif = cif.append_column('StationID',station_ids(cif.column(station_column)))
+    if columns is not None and station_column not in columns:
+        cif = cif.drop_columns([station_column])
+    return md,cif.to_pandas()
 
 if __name__=='__main__':
     p = Path(r'M:\Users\RH2\src\caiso_curtailments\climate_informed_weather_data\cif_temperature_15_25.parquet')
     md,cif = read_cif(p)
-    print(cif)
\ No newline at end of file
+    print(cif)
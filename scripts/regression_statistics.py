@@ -0,0 +1,280 @@
+import pandas as pd
+import numpy as np
+
+SUM_COLUMNS = ['N','SUM X','SUM Y','SUM XY','SUM XX','SUM YY']
+
+def grouped_sums(df,group_columns:list,x_column:str,y_column:str,weight_columns:list=[None],compute:bool=True):
+    '''
+    Accumulates the sufficient statistics for simple linear regressions of
+    y_column on x_column within each group in a single pass over a pandas or
+    dask dataframe: the (weighted) number of observations and the sums of x,
+    y, xy, x², and y². Rows with missing x or y values are ignored.
+
+    Parameters:
+        df - a pandas or dask dataframe.
+        group_columns - a list of columns identifying each group.
+        x_column - the name of the independent variable column.
+        y_column - the name of the dependent variable column.
+        weight_columns - a list of columns containing observation weights, with
+            None for unweighted sums. A 0/1 weight column may be used to
+            restrict the sums to a subset of rows. Sums for every weight column
+            are accumulated in the same pass. Default value is [None].
+        compute - a boolean value to specify whether to compute a dask input
+            and split the results by weight column. If False, the combined
+            aggregate is returned as-is so it can be computed together with
+            other aggregates and later passed to split_grouped_sums. Default
+            value is True.
+
+    Returns:
+        a dictionary mapping each entry of weight_columns to a pandas dataframe
+        indexed by group_columns with the columns listed in SUM_COLUMNS.
+    '''
+    valid = df[x_column].notnull() & df[y_column].notnull()
+    # accumulate in double precision regardless of the storage dtype:
+    x = df[x_column].where(valid,0).astype(float)
+    y = df[y_column].where(valid,0).astype(float)
+    products = {}
+    for i,weight_column in enumerate(weight_columns):
+        if weight_column is None:
+            w = valid.astype(float)
+        else:
+            w = df[weight_column].where(valid,0).astype(float)
+        products.update({
+            'N_{}'.format(i) : w,
+            'SUM X_{}'.format(i) : w*x,
+            'SUM Y_{}'.format(i) : w*y,
+            'SUM XY_{}'.format(i) : w*x*y,
+            'SUM XX_{}'.format(i) : w*x*x,
+            'SUM YY_{}'.format(i) : w*y*y,
+        })
+    sums = df[group_columns].assign(**products).groupby(group_columns,observed=True).sum()
+    if not compute:
+        return sums
+    if hasattr(sums,'compute'):
+        sums = sums.compute()
+    return split_grouped_sums(sums,weight_columns)
+
+def split_grouped_sums(sums:pd.DataFrame,weight_columns:list=[None]):
+    '''
+    Splits the combined aggregate returned by grouped_sums with compute=False,
+    once computed, into a dictionary mapping each entry of weight_columns to a
+    dataframe with the columns listed in SUM_COLUMNS.
+    '''
+    return {
+        weight_column : sums.loc[:,['{}_{}'.format(c,i) for c in SUM_COLUMNS]].rename(columns=lambda c:c.rsplit('_',1)[0]).sort_index()
+        for i,weight_column in enumerate(weight_columns)
+    }
+
+def accumulate_grouped_sums(chunks,group_columns:list,x_column:str,y_column:str,weight_columns:list=[None]):
+    '''
+    Accumulates grouped_sums over an iterable of pandas dataframes, e.g.,
+    chunks of a file read one at a time, so only one chunk and the running
+    totals are held in memory at once. Since the sums are additive, the
+    results are the same as from grouped_sums over the concatenated chunks.
+
+    Returns:
+        a dictionary as returned by grouped_sums.
+    '''
+    totals = None
+    for chunk in chunks:
+        sums = grouped_sums(chunk,group_columns,x_column,y_column,weight_columns,compute=False)
+        totals = sums if totals is None else totals.add(sums,fill_value=0)
+    if totals is None:
+        raise ValueError('No Chunks to Accumulate')
+    return split_grouped_sums(totals,weight_columns)
+
+def shift_grouped_sums(sums:pd.DataFrame,shifts):
+    '''
+    Returns the sufficient statistics which would result from adding a
+    constant shift to the x values of every observation in each group, e.g.,
+    normalizing each resource's temperatures, without revisiting the
+    observations.
+
+    Parameters:
+        sums - a dataframe as returned by grouped_sums.
+        shifts - an array or series of shifts aligned with the rows of sums.
+    '''
+    shifts = np.asarray(shifts,dtype=float)
+    shifted = sums.copy()
+    shifted.loc[:,'SUM X'] = sums.loc[:,'SUM X'] + sums.loc[:,'N']*shifts
+    shifted.loc[:,'SUM XY'] = sums.loc[:,'SUM XY'] + sums.loc[:,'SUM Y']*shifts
+    shifted.loc[:,'SUM XX'] = sums.loc[:,'SUM XX'] + 2*sums.loc[:,'SUM X']*shifts + sums.loc[:,'N']*shifts*shifts
+    return shifted
+
+def linear_regression_arrays(sums:np.ndarray):
+    '''
+    Derives least-squares lines and related statistics in closed form from an
+    array of sufficient statistics whose last axis holds the columns listed in
+    SUM_COLUMNS, e.g., one row per group and replicate.
+
+    Returns:
+        a dictionary of arrays with the shape of sums without its last axis,
+        keyed SLOPE, INTERCEPT, RSQUARED, CORRELATION, and COVARIANCE.
+    '''
+    n,sum_x,sum_y,sum_xy,sum_xx,sum_yy = np.moveaxis(np.asarray(sums,dtype=float),-1,0)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        mean_x = sum_x / n
+        mean_y = sum_y / n
+        sxx = np.maximum(sum_xx - n*mean_x*mean_x,0)
+        syy = np.maximum(sum_yy - n*mean_y*mean_y,0)
+        sxy = sum_xy - n*mean_x*mean_y
+        # a single distinct x value gives a flat line through the mean of y,
+        # and a constant y is fit perfectly:
+        slope = np.where(sxx>0,sxy/sxx,0.0)
+        intercept = mean_y - slope*mean_x
+        rsquared = np.where(syy>0,np.where(sxx>0,sxy*sxy/(sxx*syy),0.0),1.0)
+        correlation = sxy / np.sqrt(sxx*syy)
+        covariance = sxy / (n-1)
+    empty = (n<=0)
+    return {
+        'SLOPE' : np.where(empty,np.nan,slope),
+        'INTERCEPT' : np.where(empty,np.nan,intercept),
+        'RSQUARED' : np.where(empty,np.nan,rsquared),
+        'CORRELATION' : correlation,
+        'COVARIANCE' : covariance,
+    }
+
+def solve_linear_regressions(sums:pd.DataFrame):
+    '''
+    Derives least-squares lines and related statistics in closed form for
+    every group at once from sufficient statistics as returned by grouped_sums.
+    Results match those from sklearn's LinearRegression and score methods, and
+    pandas' corr and cov methods, applied to each group separately.
+
+    Returns:
+        a dataframe with the same index as sums and columns SLOPE, INTERCEPT,
+        RSQUARED, CORRELATION, and COVARIANCE.
+    '''
+    return pd.DataFrame(linear_regression_arrays(sums.loc[:,SUM_COLUMNS].to_numpy(dtype=float)),index=sums.index)
+
+def prediction_errors(sums:pd.DataFrame,intercepts,slopes):
+    '''
+    Returns the sum of squared errors of the predictions y = intercept +
+    slope * x over the observations summarized in each row of sums, computed
+    from the sufficient statistics alone. Intercepts and slopes are arrays or
+    series aligned with the rows of sums, e.g., fitted on other data for
+    out-of-sample evaluation.
+    '''
+    a = np.asarray(intercepts,dtype=float)
+    b = np.asarray(slopes,dtype=float)
+    n,sum_x,sum_y,sum_xy,sum_xx,sum_yy = [sums.loc[:,c].to_numpy(dtype=float) for c in SUM_COLUMNS]
+    return np.maximum(sum_yy - 2*a*sum_y - 2*b*sum_xy + a*a*n + 2*a*b*sum_x + b*b*sum_xx,0)
+
+def solve_fixed_effects_regressions(sums:pd.DataFrame):
+    '''
+    Derives least-squares lines with a shared slope and a separate intercept
+    for each member within each group, e.g., resources within unit types, from
+    sufficient statistics as returned by grouped_sums for two group columns.
+    The shared slope is estimated by the within transformation, i.e., by
+    demeaning each member's observations, so memory use does not grow with the
+    number of members. Results match sklearn's LinearRegression fit to the
+    temperatures plus one binary column per member: the slope, the intercept
+    (which for the minimum-norm solution is the unweighted average of member
+    intercepts), and the R-squared score.
+
+    Returns:
+        a tuple of two dataframes: the first indexed by group with columns
+        SLOPE, INTERCEPT, and RSQUARED, and the second indexed by group and
+        member with columns N and INTERCEPT.
+    '''
+    sums = sums.loc[(sums.loc[:,'N']>0),:]
+    n = sums.loc[:,'N']
+    mean_x = sums.loc[:,'SUM X'] / n
+    mean_y = sums.loc[:,'SUM Y'] / n
+    within = pd.DataFrame({
+        'SXX' : (sums.loc[:,'SUM XX'] - n*mean_x*mean_x).clip(lower=0),
+        'SXY' : sums.loc[:,'SUM XY'] - n*mean_x*mean_y,
+        'SYY' : (sums.loc[:,'SUM YY'] - n*mean_y*mean_y).clip(lower=0),
+    })
+    group_level = sums.index.names[0]
+    group_within = within.groupby(level=group_level,observed=True).sum()
+    group_sums = sums.groupby(level=group_level,observed=True).sum()
+    with np.errstate(invalid='ignore',divide='ignore'):
+        slope = (group_within.loc[:,'SXY']/group_within.loc[:,'SXX']).where(group_within.loc[:,'SXX']>0,0.0)
+        member_slope = slope.reindex(sums.index.get_level_values(group_level)).to_numpy()
+        member_intercepts = pd.DataFrame({
+            'N' : n,
+            'INTERCEPT' : mean_y - member_slope*mean_x,
+        })
+        ss_residual = (group_within.loc[:,'SYY'] - 2*slope*group_within.loc[:,'SXY'] + slope*slope*group_within.loc[:,'SXX']).clip(lower=0)
+        ss_total = (group_sums.loc[:,'SUM YY'] - group_sums.loc[:,'SUM Y']**2/group_sums.loc[:,'N']).clip(lower=0)
+        rsquared = (1 - ss_residual/ss_total).where(ss_total>0,1.0)
+    results = pd.DataFrame({
+        'SLOPE' : slope,
+        'INTERCEPT' : member_intercepts.loc[:,'INTERCEPT'].groupby(level=group_level,observed=True).mean(),
+        'RSQUARED' : rsquared,
+    })
+    return results,member_intercepts
+
+def solve_hinge_regressions(binned_sums:pd.DataFrame,bin_width:float=0.5,minimum_observations:float=24):
+    '''
+    Fits a continuous piecewise-linear "hinge" model,
+
+        y = intercept + slope_below * x + (slope_above - slope_below) * max(x - breakpoint, 0),
+
+    for every group at once, searching all breakpoints on the edges of the
+    bins in binned_sums. Sums for observations above each candidate
+    breakpoint are reverse cumulative sums over the bins, so each candidate's
+    normal equations are assembled in constant time and all candidates for
+    all groups are solved in one batched operation.
+
+    Parameters:
+        binned_sums - a dataframe of sufficient statistics as returned by
+            grouped_sums, indexed by one or more group columns followed by an
+            integer bin index, where bin i holds x values from i*bin_width up
+            to (i+1)*bin_width.
+        bin_width - the width of each bin. Default value is 0.5.
+        minimum_observations - the minimum (weighted) number of observations
+            on each side of a candidate breakpoint. Default value is 24.
+
+    Returns:
+        a dataframe indexed by group with columns BREAKPOINT, INTERCEPT,
+        SLOPE BELOW, SLOPE ABOVE, SSE, LINEAR SSE, N, and N ABOVE.
+    '''
+    groups = binned_sums.index.droplevel(-1).unique()
+    bins = binned_sums.index.get_level_values(-1).to_numpy(dtype=np.int64)
+    first_bin = bins.min()
+    number_of_bins = bins.max() - first_bin + 1
+    # scatter sums into a dense group by bin array:
+    dense = np.zeros((len(groups),number_of_bins,len(SUM_COLUMNS)))
+    dense[groups.get_indexer(binned_sums.index.droplevel(-1)),bins-first_bin,:] = binned_sums.loc[:,SUM_COLUMNS].to_numpy(dtype=float)
+    totals = dense.sum(axis=1)
+    # sums over bins at or above each candidate edge:
+    above = np.cumsum(dense[:,::-1,:],axis=1)[:,::-1,:]
+    breakpoints = (first_bin+np.arange(number_of_bins))*bin_width
+    n,sum_x,sum_y,sum_xy,sum_xx,sum_yy = [totals[:,[k]] for k in range(len(SUM_COLUMNS))]
+    n_above,sum_x_above,sum_y_above,sum_xy_above,sum_xx_above = [above[:,:,k] for k in range(5)]
+    # sums of the hinge term h = max(x - breakpoint, 0):
+    c = breakpoints[np.newaxis,:]
+    sum_h = sum_x_above - c*n_above
+    sum_hh = sum_xx_above - 2*c*sum_x_above + c*c*n_above
+    sum_xh = sum_xx_above - c*sum_x_above
+    sum_hy = sum_xy_above - c*sum_y_above
+    ones = np.ones_like(sum_h)
+    xtx = np.stack([
+        np.stack([n*ones,sum_x*ones,sum_h],axis=-1),
+        np.stack([sum_x*ones,sum_xx*ones,sum_xh],axis=-1),
+        np.stack([sum_h,sum_xh,sum_hh],axis=-1),
+    ],axis=-2)
+    xty = np.stack([sum_y*ones,sum_xy*ones,sum_hy],axis=-1)
+    coefficients = np.einsum('gcij,gcj->gci',np.linalg.pinv(xtx),xty)
+    sse = np.maximum(sum_yy - np.einsum('gci,gci->gc',coefficients,xty),0)
+    feasible = (n_above>=minimum_observations) & ((n-n_above)>=minimum_observations)
+    sse_search = np.where(feasible,sse,np.inf)
+    best = np.argmin(sse_search,axis=1)
+    rows = np.arange(len(groups))
+    found = np.isfinite(sse_search[rows,best])
+    linear = linear_regression_arrays(totals)
+    with np.errstate(invalid='ignore'):
+        linear_sse = np.maximum(totals[:,5] - totals[:,2]*totals[:,2]/totals[:,0] - linear['SLOPE']*(totals[:,3]-totals[:,1]*totals[:,2]/totals[:,0]),0)
+    best_coefficients = coefficients[rows,best,:]
+    return pd.DataFrame({
+        'BREAKPOINT' : np.where(found,breakpoints[best],np.nan),
+        'INTERCEPT' : np.where(found,best_coefficients[:,0],np.nan),
+        'SLOPE BELOW' : np.where(found,best_coefficients[:,1],np.nan),
+        'SLOPE ABOVE' : np.where(found,best_coefficients[:,1]+best_coefficients[:,2],np.nan),
+        'SSE' : np.where(found,sse[rows,best],np.nan),
+        'LINEAR SSE' : linear_sse,
+        'N' : totals[:,0],
+        'N ABOVE' : np.where(found,n_above[rows,best],np.nan),
+    },index=groups)
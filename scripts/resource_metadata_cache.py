@@ -0,0 +1,157 @@
+import pandas as pd
+from pathlib import Path
+from pandas import Timestamp as ts
+from pandas import Timedelta as td
+
+RESOURCE_METADATA_CACHE_DIRECTORY = Path(r'M:\Users\RH2\src\caiso_curtailments\resource_metadata_cache')
+RESOURCE_LOCATION_OVERRIDES_PATH = Path(__file__).resolve().parents[1] / 'geospatial' / 'resource_location_overrides.csv'
+
+class ResourceMetadataCache:
+    '''
+    A directory of resource metadata retrieved from EZDB, e.g., resource
+    locations and unit types, stored in one parquet file per lookup with the
+    time each resource was retrieved, so only resources missing from the cache
+    or older than a maximum age are requested from the database. Resources for
+    which the database returns nothing are cached as not found. Values in an
+    optional override file, a csv file with a column of resource ids and a
+    column for each overridden field, replace retrieved values wherever they
+    are not blank.
+    '''
+    cache_directory = RESOURCE_METADATA_CACHE_DIRECTORY
+    maximum_age = td(days=30)
+    override_path = None
+    retrieved_column = 'RETRIEVED'
+    found_column = 'FOUND'
+    def __init__(self,cache_directory:Path=RESOURCE_METADATA_CACHE_DIRECTORY,maximum_age:td=td(days=30),override_path:Path=None):
+        '''
+        initializes a cache in the given directory, which is created if it does
+        not exist.
+
+        parameters:
+            cache_directory - a path object pointing to the cache directory
+            maximum_age - a pandas timedelta giving the time after which
+                cached metadata are retrieved again. Default is 30 days.
+            override_path - a path object pointing to a csv file of manual
+                overrides, if any.
+        '''
+        self.cache_directory = cache_directory
+        self.maximum_age = maximum_age
+        self.override_path = override_path
+
+    def table_path(self,name:str):
+        return self.cache_directory / '{}.parquet'.format(name)
+
+    def read_table(self,name:str):
+        '''
+        returns the cached dataframe for a lookup, or None if there is none.
+        '''
+        path = self.table_path(name)
+        if path.is_file():
+            return pd.read_parquet(path)
+        else:
+            return None
+
+    def write_table(self,name:str,df:pd.DataFrame):
+        self.cache_directory.mkdir(parents=True,exist_ok=True)
+        df.reset_index(drop=True).to_parquet(self.table_path(name),index=False)
+
+    def lookup(self,name:str,resource_ids:list,retrieve,key_column:str='ResourceID'):
+        '''
+        returns metadata for each resource in a list, calling retrieve only
+        for resources which are not cached or whose cached metadata have
+        expired, then adding the results to the cache and applying overrides.
+
+        parameters:
+            name - the name of the lookup, e.g., resource_locations.
+            resource_ids - a list of resource ids.
+            retrieve - a function taking a list of resource ids and returning
+                a dataframe of their metadata, e.g.,
+                retrieve_resource_locations.
+            key_column - the column of resource ids in the returned
+                dataframe. Default is ResourceID.
+
+        returns:
+            a dataframe with one row per cached resource in resource_ids,
+            sorted by resource id.
+        '''
+        resource_ids = pd.Index(resource_ids).astype(str).unique()
+        cached = self.read_table(name)
+        if cached is not None:
+            if self.found_column not in cached.columns:
+                cached = cached.assign(**{self.found_column:True})
+            fresh = cached.loc[:,self.retrieved_column] >= ts.now() - self.maximum_age
+            missing = resource_ids.difference(cached.loc[fresh,key_column].astype(str))
+        else:
+            missing = resource_ids
+        if len(missing)>0:
+            print('Retrieving {} of {} resources missing from {} cache ...'.format(len(missing),len(resource_ids),name))
+            retrieved = retrieve(missing.sort_values().tolist()).assign(**{self.found_column:True})
+            # resources without results are cached too, so they are not
+            # requested again until they expire:
+            not_found = missing.difference(retrieved.loc[:,key_column].astype(str))
+            if len(not_found)>0:
+                retrieved = pd.concat([
+                    retrieved,
+                    pd.DataFrame({key_column:not_found.to_numpy(),self.found_column:False}),
+                ],ignore_index=True)
+            retrieved = retrieved.assign(**{self.retrieved_column:ts.now()})
+            if cached is not None:
+                # replace expired entries:
+                cached = pd.concat([
+                    cached.loc[~cached.loc[:,key_column].astype(str).isin(missing),:],
+                    retrieved
+                ],ignore_index=True)
+            else:
+                cached = retrieved
+            self.write_table(name,cached)
+        df = cached.loc[cached.loc[:,key_column].astype(str).isin(resource_ids)&cached.loc[:,self.found_column].astype(bool),:]
+        df = df.sort_values(key_column).drop(columns=[self.retrieved_column,self.found_column]).reset_index(drop=True)
+        return self.apply_overrides(df,key_column)
+
+    def lookup_all(self,name:str,retrieve,key_column:str='ResourceID'):
+        '''
+        returns the result of a lookup without a list of resources, e.g.,
+        get_resource_locations, calling retrieve only if the cached result
+        has expired, and applying overrides.
+        '''
+        cached = self.read_table(name)
+        if cached is None or len(cached)==0 or cached.loc[:,self.retrieved_column].min() < ts.now() - self.maximum_age:
+            cached = retrieve().assign(**{self.retrieved_column:ts.now()})
+            self.write_table(name,cached)
+        return self.apply_overrides(cached.drop(columns=self.retrieved_column).reset_index(drop=True),key_column)
+
+    def read_overrides(self):
+        '''
+        returns the override file as a dataframe, or None if there is none.
+        '''
+        if self.override_path is not None and Path(self.override_path).is_file():
+            return pd.read_csv(self.override_path)
+        else:
+            return None
+
+    def apply_overrides(self,df:pd.DataFrame,key_column:str='ResourceID'):
+        '''
+        replaces values in a dataframe of resource metadata with the non-blank
+        values for the same resources and columns in the override file,
+        joining the two on key_column.
+        '''
+        overrides = self.read_overrides()
+        if overrides is None or key_column not in overrides.columns:
+            return df
+        columns = [c for c in overrides.columns if c!=key_column and c in df.columns]
+        overrides = overrides.astype({key_column:str}).drop_duplicates(subset=key_column,keep='last').set_index(key_column)
+        joined = df.loc[:,[key_column]].astype(str).join(overrides.loc[:,columns],on=key_column)
+        df = df.copy()
+        for c in columns:
+            df.loc[:,c] = joined.loc[:,c].where(joined.loc[:,c].notna(),df.loc[:,c])
+        return df
+
+    def clear(self,name:str=None):
+        '''
+        deletes the cached dataframe for a lookup, or for every lookup if name
+        is None.
+        '''
+        paths = [self.table_path(name)] if name is not None else self.cache_directory.glob('*.parquet')
+        for path in paths:
+            if path.is_file():
+                path.unlink()
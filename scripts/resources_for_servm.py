@@ -1,4 +1,5 @@
 from pair_resources_to_weather_stations import *
+from resource_metadata_cache import ResourceMetadataCache,RESOURCE_LOCATION_OVERRIDES_PATH
 
 if __name__=='__main__':
     resource_ids = [
@@ -49,57 +50,12 @@ if __name__=='__main__':
         'VICTORVILLECOGEN',
         'VISTA_2_FCELL'
     ]
-    resource_locations = retrieve_resource_locations(resource_ids)
+    # locations are retrieved from EZDB only for resources missing from the
+    # cache, with manual overrides applied from the override file:
+    resource_metadata_cache = ResourceMetadataCache(override_path=RESOURCE_LOCATION_OVERRIDES_PATH)
+    resource_locations = resource_metadata_cache.lookup('resource_locations',resource_ids,retrieve_resource_locations)
     # resource_locations_alternative = retrieve_resource_locations_alternative(resource_ids)
     print(resource_locations)
-    # manual overwrite locations:
-    resource_locations_overwrite = pd.DataFrame({
-        'ResourceID' : [
-            'GRIFFI_2_LSPDYN_SCE',
-            'INDIGO_1_UNIT_1',
-            'INDIGO_1_UNIT_2',
-            'INDIGO_1_UNIT_3',
-            'LAPLMA_2_UNIT_1',
-            'LAPLMA_2_UNIT_2',
-            'LAPLMA_2_UNIT_3',
-            'LAPLMA_2_UNIT_4',
-            'LARKSP_6_UNIT_1',
-            'LARKSP_6_UNIT_2',
-            'STANTN_2_STAGT1',
-            'STANTN_2_STAGT2',
-        ],
-        'ResLat' : [
-            35.053198,
-            33.911133,
-            33.911133,
-            33.911133,
-            35.295078,
-            35.295078,
-            35.295078,
-            35.295078,
-            32.567210,
-            32.567210,
-            33.807004,
-            33.807004,
-        ],
-        'ResLon' : [
-            245.866566,
-            243.447035,
-            243.447035,
-            243.447035,
-            240.407669,
-            240.407669,
-            240.407669,
-            240.407669,
-            243.05572,
-            243.05572,
-            242.0154,
-            242.0154,
-        ]
-    })
-    for _,r in resource_locations_overwrite.iterrows():
-        resource_locations.loc[(resource_locations.loc[:,'ResourceID']==r.loc['ResourceID']),'ResLat'] = r.loc['ResLat']
-        resource_locations.loc[(resource_locations.loc[:,'ResourceID']==r.loc['ResourceID']),'ResLon'] = r.loc['ResLon']
 
     resource_weather_station_pairs = identify_weather_stations(resource_locations)
     # resource_weather_station_pairs_alternative = identify_weather_stations(resource_locations_alternative)
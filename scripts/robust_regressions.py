@@ -0,0 +1,173 @@
+import numpy as np
+
+from regression_statistics import linear_regression_arrays
+
+def weighted_group_sums(x:np.ndarray,y:np.ndarray,weights:np.ndarray,codes:np.ndarray,number_of_groups:int):
+    '''
+    Accumulates weighted sufficient statistics for every group at once from
+    arrays of observations and integer group codes.
+
+    Returns:
+        an array with one row per group and one column for each entry of
+        SUM_COLUMNS.
+    '''
+    return np.stack([
+        np.bincount(codes,weights=weights*values,minlength=number_of_groups)
+        for values in [np.ones_like(x),x,y,x*y,x*x,y*y]
+    ],axis=-1)
+
+def group_medians(values:np.ndarray,codes:np.ndarray,number_of_groups:int):
+    '''
+    Returns the median of values within each group, sorting all groups
+    together rather than one at a time. Empty groups have a median of nan.
+    '''
+    order = np.lexsort((values,codes))
+    sorted_values = values[order]
+    counts = np.bincount(codes,minlength=number_of_groups)
+    starts = np.cumsum(counts) - counts
+    medians = np.full(number_of_groups,np.nan)
+    occupied = counts>0
+    lower = starts[occupied] + (counts[occupied]-1)//2
+    upper = starts[occupied] + counts[occupied]//2
+    medians[occupied] = (sorted_values[lower]+sorted_values[upper]) / 2
+    return medians
+
+def iteratively_reweighted_regressions(x:np.ndarray,y:np.ndarray,codes:np.ndarray,number_of_groups:int,reweight,maximum_iterations:int,tolerance:float,loss=None):
+    '''
+    Fits a line to each group by iteratively reweighted least squares,
+    starting from ordinary least squares. Each iteration computes every
+    observation's residual from its group's current line, passes the
+    residuals to reweight for new observation weights, and solves all groups'
+    weighted least squares lines at once from their weighted sums. A group
+    has converged once each of its coefficients moves by no more than
+    tolerance times one plus the coefficient's magnitude or, if loss is
+    given, once its total loss decreases by no more than tolerance times the
+    total loss, keeping its previous line if the loss has increased.
+    Converged groups keep their lines, and iteration stops when every group
+    has converged.
+
+    Parameters:
+        loss - an optional function returning each observation's loss from
+            an array of residuals.
+
+    Returns:
+        a dictionary of arrays with one entry per group, keyed SLOPE,
+        INTERCEPT, and CONVERGED, which is False for groups still changing
+        after maximum_iterations.
+    '''
+    x = np.asarray(x,dtype=float)
+    y = np.asarray(y,dtype=float)
+    fits = linear_regression_arrays(weighted_group_sums(x,y,np.ones_like(x),codes,number_of_groups))
+    slope,intercept = fits['SLOPE'],fits['INTERCEPT']
+    converged = np.zeros(number_of_groups,dtype=bool)
+    if loss is not None:
+        total_loss = np.bincount(codes,weights=loss(y-intercept[codes]-slope[codes]*x),minlength=number_of_groups)
+    for _ in range(maximum_iterations):
+        residuals = y - intercept[codes] - slope[codes]*x
+        weights = reweight(residuals)
+        fits = linear_regression_arrays(weighted_group_sums(x,y,weights,codes,number_of_groups))
+        # keep the previous line for groups whose weights all vanish or which
+        # have already converged:
+        keep = np.isnan(fits['SLOPE']) | np.isnan(fits['INTERCEPT']) | converged
+        new_slope = np.where(keep,slope,fits['SLOPE'])
+        new_intercept = np.where(keep,intercept,fits['INTERCEPT'])
+        with np.errstate(invalid='ignore'):
+            converged = (
+                (np.abs(new_slope-slope)<=tolerance*(1+np.abs(slope))) &
+                (np.abs(new_intercept-intercept)<=tolerance*(1+np.abs(intercept)))
+            )
+            if loss is not None:
+                new_total_loss = np.bincount(codes,weights=loss(y-new_intercept[codes]-new_slope[codes]*x),minlength=number_of_groups)
+                # groups whose loss no longer decreases have converged, and
+                # keep their previous line if the new one is worse:
+                converged |= new_total_loss>=total_loss*(1-tolerance)
+                worse = new_total_loss>total_loss
+                new_slope = np.where(worse,slope,new_slope)
+                new_intercept = np.where(worse,intercept,new_intercept)
+                total_loss = np.where(worse,total_loss,new_total_loss)
+        slope,intercept = new_slope,new_intercept
+        if np.all(converged|np.isnan(slope)):
+            break
+    return {
+        'SLOPE' : slope,
+        'INTERCEPT' : intercept,
+        'CONVERGED' : converged,
+    }
+
+def solve_huber_regressions(
+        x:np.ndarray,
+        y:np.ndarray,
+        codes:np.ndarray,
+        number_of_groups:int,
+        threshold:float=1.345,
+        maximum_iterations:int=50,
+        tolerance:float=1e-8
+    ):
+    '''
+    Fits Huber M-estimator lines to every group at once, limiting the
+    influence of observations whose residuals exceed threshold times the
+    group's scale. Each group's scale is re-estimated on every iteration as
+    its median absolute residual divided by 0.6745, or from its mean absolute
+    residual where more than half of its residuals are zero.
+
+    Parameters:
+        x, y - arrays of observations.
+        codes - an array of integer group codes from 0 to number_of_groups-1.
+        number_of_groups - the number of groups.
+        threshold - the residual, in multiples of the scale, beyond which
+            observations are downweighted. Default value is 1.345.
+        maximum_iterations - the maximum number of reweighting iterations.
+            Default value is 50.
+        tolerance - the change in each coefficient, relative to one plus
+            its magnitude, at or below which a group is considered
+            converged. Default value is 1e-8.
+
+    Returns:
+        a dictionary of arrays with one entry per group, keyed SLOPE,
+        INTERCEPT, and CONVERGED.
+    '''
+    def reweight(residuals:np.ndarray):
+        absolute_residuals = np.abs(residuals)
+        scale = group_medians(absolute_residuals,codes,number_of_groups) / 0.6745
+        mean_absolute_residual = np.bincount(codes,weights=absolute_residuals,minlength=number_of_groups) / np.maximum(np.bincount(codes,minlength=number_of_groups),1)
+        scale = np.where(scale>0,scale,mean_absolute_residual*np.sqrt(np.pi/2))
+        limit = threshold * scale[codes]
+        with np.errstate(invalid='ignore',divide='ignore'):
+            return np.where(absolute_residuals<=limit,1.0,limit/absolute_residuals)
+    return iteratively_reweighted_regressions(x,y,codes,number_of_groups,reweight,maximum_iterations,tolerance)
+
+def solve_quantile_regressions(
+        x:np.ndarray,
+        y:np.ndarray,
+        codes:np.ndarray,
+        number_of_groups:int,
+        quantile:float=0.9,
+        maximum_iterations:int=100,
+        tolerance:float=1e-8,
+        epsilon:float=1e-6
+    ):
+    '''
+    Fits lines for a given quantile of y conditional on x to every group at
+    once by iteratively reweighting least squares toward the asymmetric
+    absolute loss, weighting each observation by quantile or 1 - quantile,
+    for residuals above or below the line, divided by its absolute residual.
+    Absolute residuals are bounded below by epsilon. Since the asymmetric
+    absolute loss is flat near its minimum, a group is also considered
+    converged once its total loss decreases by no more than tolerance times
+    the total loss, even if its coefficients are still moving.
+
+    Parameters:
+        quantile - the quantile to fit, between 0 and 1. Default value is 0.9.
+        epsilon - the smallest absolute residual used in weights. Default
+            value is 1e-6.
+        other parameters - see solve_huber_regressions.
+
+    Returns:
+        a dictionary of arrays with one entry per group, keyed SLOPE,
+        INTERCEPT, and CONVERGED.
+    '''
+    def reweight(residuals:np.ndarray):
+        return np.where(residuals>=0,quantile,1-quantile) / np.maximum(np.abs(residuals),epsilon)
+    def check_loss(residuals:np.ndarray):
+        return np.where(residuals>=0,quantile,quantile-1) * residuals
+    return iteratively_reweighted_regressions(x,y,codes,number_of_groups,reweight,maximum_iterations,tolerance,check_loss)
@@ -0,0 +1,83 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+def unit_vectors(latitudes,longitudes):
+    '''
+    Converts latitudes and longitudes in degrees to an array of points on the
+    unit sphere with one row per location.
+    '''
+    phi = np.radians(np.asarray(latitudes,dtype=float))
+    lam = np.radians(np.asarray(longitudes,dtype=float))
+    return np.stack([np.cos(phi)*np.cos(lam),np.cos(phi)*np.sin(lam),np.sin(phi)],axis=-1)
+
+def chord_to_great_circle(chord_lengths):
+    '''
+    Converts straight-line distances between points on the unit sphere to
+    great-circle distances in kilometers.
+    '''
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord_lengths/2,0,1))
+
+def distance_matrix(latitudes_a,longitudes_a,latitudes_b,longitudes_b):
+    '''
+    Returns the great-circle distances in kilometers between every pair of
+    locations in two lists, with one row per location in the first list and
+    one column per location in the second. Distances are computed from the
+    dot products of unit vectors, equivalent to the haversine formula, so the
+    whole matrix is one matrix multiplication. Longitudes may be given in
+    either the -180 to 180 or 0 to 360 convention.
+    '''
+    cosines = unit_vectors(latitudes_a,longitudes_a) @ unit_vectors(latitudes_b,longitudes_b).T
+    return chord_to_great_circle(np.sqrt(np.maximum(2-2*cosines,0)))
+
+def nearest_locations(
+        latitudes:np.ndarray,
+        longitudes:np.ndarray,
+        candidate_latitudes:np.ndarray,
+        candidate_longitudes:np.ndarray,
+        number_of_neighbours:int=1,
+        use_ball_tree:bool=False,
+        chunk_size:int=4096
+    ):
+    '''
+    Finds the nearest candidate locations, e.g., weather stations, to each of
+    a set of locations, e.g., resources.
+
+    Parameters:
+        latitudes, longitudes - arrays of locations in degrees.
+        candidate_latitudes, candidate_longitudes - arrays of candidate
+            locations in degrees.
+        number_of_neighbours - the number of nearest candidates to return for
+            each location. Default value is 1.
+        use_ball_tree - a boolean value to specify whether to query a
+            haversine BallTree from scikit-learn, which scales better to very
+            many candidates, rather than computing distances to every
+            candidate in chunks of chunk_size locations. Default value is
+            False.
+        chunk_size - the number of locations per chunk. Default value is
+            4096.
+
+    Returns:
+        a tuple of an array of candidate indices and an array of great-circle
+        distances in kilometers, each with one row per location and one column
+        per neighbour, nearest first.
+    '''
+    number_of_neighbours = min(number_of_neighbours,len(candidate_latitudes))
+    if use_ball_tree:
+        from sklearn.neighbors import BallTree
+        tree = BallTree(np.radians(np.stack([candidate_latitudes,candidate_longitudes],axis=-1)),metric='haversine')
+        distances,indices = tree.query(np.radians(np.stack([latitudes,longitudes],axis=-1)),k=number_of_neighbours)
+        return indices,distances*EARTH_RADIUS_KM
+    candidates = unit_vectors(candidate_latitudes,candidate_longitudes)
+    points = unit_vectors(latitudes,longitudes)
+    indices = np.empty((len(points),number_of_neighbours),dtype=np.int64)
+    distances = np.empty((len(points),number_of_neighbours))
+    for start in range(0,len(points),chunk_size):
+        cosines = points[start:start+chunk_size] @ candidates.T
+        # the largest cosines are the nearest candidates:
+        nearest = np.argpartition(-cosines,number_of_neighbours-1,axis=1)[:,:number_of_neighbours]
+        nearest_cosines = np.take_along_axis(cosines,nearest,axis=1)
+        order = np.argsort(-nearest_cosines,axis=1,kind='stable')
+        indices[start:start+chunk_size] = np.take_along_axis(nearest,order,axis=1)
+        distances[start:start+chunk_size] = chord_to_great_circle(np.sqrt(np.maximum(2-2*np.take_along_axis(nearest_cosines,order,axis=1),0)))
+    return indices,distances
@@ -1,60 +1,11 @@
-import psycopg2
 import numpy as np
 import pandas as pd
 from pathlib import Path
 from pandas import Timestamp as ts,Timedelta as td
 from pandas.tseries.offsets import MonthBegin,MonthEnd
-from login import pguser
 
 from retrieve_caiso_curtailments import CurtailmentDownloader
 
-def get_resource_types(resource_ids:list):
-    '''
-    Retrieves resource unit-types for each resource id in input list from EZDB.
-
-    Parameters:
-        resource_ids - a list of strings containing CAISO IDs for generation
-            resources
-
-    Returns:
-        a dataframe containing three columns: resource_id, ,unit type, lat, and lon
-    '''
-    resource_ids.sort()
-    sql_str_template = '''
-        WITH curtailed_resources ("ResourceID") AS ( VALUES
-            {}
-        )
-
-        SELECT DISTINCT ON ("ResourceID")
-            "ResourceID"
-            ,"ResourceType"
-            ,"UnitType"
-        FROM (
-            SELECT
-                b."ResourceID"
-                ,c."RESOURCE_TYPE" AS "ResourceType"
-                ,c."UNIT_TYPE" AS "UnitType"
-            FROM curtailed_resources AS b
-            LEFT JOIN ezdb_ed_main.public.caisomastercapability AS c
-            ON b."ResourceID"=c."ResID"
-        ) AS a
-        ORDER BY "ResourceID"
-    '''
-    sql_str = sql_str_template.format('\n            ,'.join([f'(\'{s}\')' for s in resource_ids]))
-    conn = psycopg2.connect(
-        database=pguser['db_main'],
-        user=pguser['postgres'],
-        password=pguser['passwd'],
-        host=pguser['host']
-    )
-    with conn:
-        with conn.cursor() as curs:
-            print('Retrieving generator resource locations from EZDB ...')
-            curs.execute(sql_str)
-            results = curs.fetchall()
-            print('Retrieved {} resource locations.'.format(len(results)))
-    return pd.DataFrame(results,columns=['RESOURCE ID','RESOURCE TYPE','UNIT TYPE'])
-
 def calculate_unforced_outage_rates(curtailments,resources,nminutes=5):
     '''
     Calculates the monthly unforced outage rates for each resource in the input
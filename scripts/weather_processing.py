@@ -0,0 +1,63 @@
+import pandas as pd
+import numpy as np
+
+from curtailment_intervals import block_offsets
+
+def resample_weather(
+        weather_data:pd.DataFrame,
+        nminutes:int=60,
+        maximum_gap_minutes:int=120,
+        station_column:str='CALL_SIGN',
+        datetime_column:str='DATE',
+        value_columns:list=['DRY BULB TEMPERATURE','DEW POINT','PRESSURE']
+    ):
+    '''
+    Resamples weather observations onto a regular grid of nminutes-long blocks
+    for each weather station. Timestamps are floored to the block size, the
+    last observation within each block is kept, and gaps in the grid no longer
+    than maximum_gap_minutes are filled by linear interpolation in time. Longer
+    gaps are left out of the output entirely.
+
+    Parameters:
+        weather_data - a dataframe with one row per weather observation,
+            containing station, datetime, and value columns.
+        nminutes - the length of each block in minutes. Blocks are aligned to
+            midnight so they match the blocks used when expanding curtailments.
+            Default value is 60.
+        maximum_gap_minutes - the longest run of missing blocks, in minutes,
+            which will be filled by interpolation. Default value is 120.
+        station_column - the name of the column identifying weather stations.
+        datetime_column - the name of the column containing observation times.
+        value_columns - a list of numeric columns to resample and interpolate.
+
+    Returns:
+        a dataframe with one row per weather station and block, with the same
+        columns as the input.
+    '''
+    df = weather_data.loc[:,[station_column,datetime_column]+value_columns].copy()
+    block = pd.Timedelta(minutes=nminutes)
+    df = df.assign(**{datetime_column:pd.to_datetime(df.loc[:,datetime_column]).dt.floor(block)})
+    df = df.sort_values(by=[station_column,datetime_column],kind='stable')
+    df = df.drop_duplicates(subset=[station_column,datetime_column],keep='last')
+    # build a complete grid of blocks between each station's first and last
+    # observations:
+    first_block = df.groupby(station_column,sort=True)[datetime_column].min()
+    last_block = df.groupby(station_column,sort=True)[datetime_column].max()
+    block_counts = ((last_block-first_block)//block).to_numpy().astype(np.int64) + 1
+    grid = pd.DataFrame({
+        station_column : np.repeat(first_block.index.to_numpy(),block_counts),
+        datetime_column : np.repeat(first_block.to_numpy(),block_counts) + block_offsets(block_counts)*block.to_timedelta64(),
+    })
+    df = grid.merge(df,how='left',on=[station_column,datetime_column])
+    # the grid is regular, so linear interpolation by position is equivalent to
+    # interpolation in time; each station's grid starts and ends on an
+    # observation, so interpolation never crosses between stations:
+    maximum_gap_blocks = maximum_gap_minutes // nminutes
+    for value_column in value_columns:
+        is_missing = df.loc[:,value_column].isna()
+        gap_id = (~is_missing).cumsum()
+        gap_length = is_missing.groupby(gap_id).transform('sum')
+        interpolated = df.loc[:,value_column].interpolate(method='linear',limit_area='inside')
+        df.loc[:,value_column] = interpolated.where(gap_length<=maximum_gap_blocks,np.nan).where(is_missing,df.loc[:,value_column])
+    df = df.dropna(how='any',subset=value_columns)
+    return df.reset_index(drop=True)
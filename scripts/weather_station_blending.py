@@ -0,0 +1,172 @@
+import pandas as pd
+import numpy as np
+from scipy import sparse
+
+from curtailment_intervals import datetimes_to_nanoseconds
+
+BLENDING_METHODS = ['nearest','fallback','inverse distance']
+
+def primary_weather_stations(weather_station_map:pd.DataFrame):
+    '''
+    Returns a map with one row per resource for the resource's nearest weather
+    station, i.e., the station with the smallest Dist if the map has a Dist
+    column, or otherwise the first station listed for the resource.
+    '''
+    if 'Dist' in weather_station_map.columns:
+        weather_station_map = weather_station_map.sort_values('Dist',kind='stable')
+    return weather_station_map.drop_duplicates(subset='ResourceID').sort_index()
+
+def neighbouring_stations(weather_station_map:pd.DataFrame,resource_ids:pd.Index,station_ids:pd.Index,number_of_stations:int=None):
+    '''
+    Arranges the weather stations listed for each resource, nearest first,
+    into resource by rank arrays.
+
+    Parameters:
+        weather_station_map - a dataframe with ResourceID and WeatherStationID
+            columns and one row per resource and station, with an optional
+            Dist column giving the distance between them.
+        resource_ids - an index of resource ids giving the row of each
+            resource.
+        station_ids - an index of weather station ids giving the code of each
+            station.
+        number_of_stations - if given, the maximum number of stations kept for
+            each resource.
+
+    Returns:
+        a tuple of an int64 array of station codes, with -1 for stations
+        without weather data and for padding, and a float array of distances,
+        with nan where unknown, each with one row per resource and one column
+        per rank.
+    '''
+    df = weather_station_map.astype({'ResourceID':str,'WeatherStationID':str})
+    if 'Dist' not in df.columns:
+        df = df.assign(Dist=np.nan)
+    df = df.assign(
+        RESOURCE_CODE=resource_ids.get_indexer(df.loc[:,'ResourceID']),
+        STATION_CODE=station_ids.get_indexer(df.loc[:,'WeatherStationID']),
+    )
+    df = df.loc[(df.loc[:,'RESOURCE_CODE']>=0),:].sort_values(['RESOURCE_CODE','Dist'],kind='stable')
+    df = df.drop_duplicates(subset=['RESOURCE_CODE','WeatherStationID'])
+    ranks = df.groupby('RESOURCE_CODE').cumcount().to_numpy()
+    if number_of_stations is not None:
+        df = df.loc[(ranks<number_of_stations),:]
+        ranks = ranks[ranks<number_of_stations]
+    number_of_ranks = ranks.max()+1 if len(ranks)>0 else 1
+    codes = np.full((len(resource_ids),number_of_ranks),-1,dtype=np.int64)
+    distances = np.full((len(resource_ids),number_of_ranks),np.nan)
+    codes[df.loc[:,'RESOURCE_CODE'].to_numpy(),ranks] = df.loc[:,'STATION_CODE'].to_numpy()
+    distances[df.loc[:,'RESOURCE_CODE'].to_numpy(),ranks] = df.loc[:,'Dist'].to_numpy(dtype=float)
+    return codes,distances
+
+def inverse_distance_weights(codes:np.ndarray,distances:np.ndarray,number_of_stations:int,power:float=2.0,minimum_distance:float=1.0):
+    '''
+    Builds a sparse resource by station matrix of inverse distance weights,
+    1 / distance^power, from arrays as returned by neighbouring_stations.
+    Distances are bounded below by minimum_distance so a station at a
+    resource's location does not receive an infinite weight.
+    '''
+    valid = codes>=0
+    if np.any(np.isnan(distances[valid])):
+        raise ValueError('Inverse Distance Blending Requires a Dist Column in the Weather Station Map')
+    rows = np.repeat(np.arange(codes.shape[0]),codes.shape[1]).reshape(codes.shape)
+    weights = 1 / np.maximum(distances[valid],minimum_distance)**power
+    return sparse.csr_matrix((weights,(rows[valid],codes[valid])),shape=(codes.shape[0],number_of_stations))
+
+def blend_station_temperatures(station_temperatures:np.ndarray,weights:sparse.csr_matrix):
+    '''
+    Applies a sparse resource by station weight matrix to a station by block
+    temperature array. Weights are renormalized in each block over the
+    stations with observations, so a gap at one station is filled from the
+    others, and blocks without any observations are missing.
+    '''
+    available = ~np.isnan(station_temperatures)
+    weighted_totals = weights @ np.where(available,station_temperatures,0).astype(float)
+    weight_totals = weights @ available.astype(float)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        return np.where(weight_totals>0,weighted_totals/weight_totals,np.nan).astype(np.float32)
+
+def fill_station_temperatures(station_temperatures:np.ndarray,codes:np.ndarray):
+    '''
+    Returns a resource by block temperature array taking each block from the
+    nearest station with an observation, filling one rank of stations at a
+    time for all resources.
+    '''
+    temperatures = station_temperatures[np.maximum(codes[:,0],0),:].astype(np.float32)
+    temperatures[(codes[:,0]<0),:] = np.nan
+    for rank in range(1,codes.shape[1]):
+        station_codes = codes[:,rank]
+        missing = np.isnan(temperatures) & (station_codes>=0)[:,np.newaxis]
+        temperatures[missing] = station_temperatures[np.maximum(station_codes,0),:][missing]
+    return temperatures
+
+def resource_station_temperatures(station_temperatures:np.ndarray,codes:np.ndarray,distances:np.ndarray,method:str='nearest',power:float=2.0,weights:sparse.csr_matrix=None):
+    '''
+    Assigns temperatures to resources from their neighbouring weather stations
+    by one of the methods listed in BLENDING_METHODS: the nearest station
+    only, the nearest station with an observation in each block, or an
+    inverse distance weighted average over stations with observations.
+
+    Parameters:
+        station_temperatures - a station by block temperature array.
+        codes, distances - arrays as returned by neighbouring_stations.
+        method - one of BLENDING_METHODS. Default value is 'nearest'.
+        power - the exponent of inverse distance weights. Default value is 2.
+        weights - a precomputed matrix as returned by
+            inverse_distance_weights for the same resources, if available.
+
+    Returns:
+        a resource by block temperature array.
+    '''
+    if method=='nearest':
+        return fill_station_temperatures(station_temperatures,codes[:,:1])
+    elif method=='fallback':
+        return fill_station_temperatures(station_temperatures,codes)
+    elif method=='inverse distance':
+        if weights is None:
+            weights = inverse_distance_weights(codes,distances,station_temperatures.shape[0],power)
+        return blend_station_temperatures(station_temperatures,weights)
+    else:
+        raise ValueError('Unknown Weather Station Blending Method {}; Expected One of {}'.format(method,BLENDING_METHODS))
+
+def blended_observations(
+        weather_station_map:pd.DataFrame,
+        weather_data:pd.DataFrame,
+        resource_ids:pd.Index,
+        method:str='nearest',
+        number_of_stations:int=None,
+        power:float=2.0,
+        nminutes:int=60,
+        resource_column:str='RESOURCE ID'
+    ):
+    '''
+    Converts weather observations for each station into observations for each
+    resource, assigning temperatures as in resource_station_temperatures on
+    the block grid spanned by the observations.
+
+    Parameters:
+        weather_station_map - see neighbouring_stations.
+        weather_data - a dataframe with CALL_SIGN, DATE, and DRY BULB
+            TEMPERATURE columns on a grid of nminutes-long blocks.
+        resource_ids - an index of the resources to include.
+        other parameters - see neighbouring_stations and
+            resource_station_temperatures.
+
+    Returns:
+        a dataframe with one row per resource and block with a temperature,
+        with resource_column, DATE, and DRY BULB TEMPERATURE columns.
+    '''
+    block_ns = np.int64(nminutes*60*10**9)
+    station_ids = pd.Index(np.sort(weather_data.loc[:,'CALL_SIGN'].astype(str).unique()))
+    observation_ns = datetimes_to_nanoseconds(weather_data.loc[:,'DATE'])
+    first_ns = observation_ns.min() - observation_ns.min()%block_ns
+    block_indices = (observation_ns-first_ns)//block_ns
+    station_temperatures = np.full((len(station_ids),block_indices.max()+1),np.nan,dtype=np.float32)
+    station_temperatures[station_ids.get_indexer(weather_data.loc[:,'CALL_SIGN'].astype(str)),block_indices] = weather_data.loc[:,'DRY BULB TEMPERATURE'].to_numpy(dtype=float)
+    codes,distances = neighbouring_stations(weather_station_map,resource_ids,station_ids,number_of_stations)
+    temperatures = resource_station_temperatures(station_temperatures,codes,distances,method,power)
+    resource_codes,blocks = np.nonzero(~np.isnan(temperatures))
+    return pd.DataFrame({
+        resource_column : np.asarray(resource_ids)[resource_codes],
+        'DATE' : pd.to_datetime((first_ns+blocks*block_ns).view('datetime64[ns]')),
+        'DRY BULB TEMPERATURE' : temperatures[resource_codes,blocks],
+    })